@@ -14,6 +14,10 @@ class BaseDockerTest(unittest.TestCase):
     * CHECKS_INTERVAL: Define the interval (in seconds) for sampling required services checks.
     * REQUIRED_HEALTH_CHECKS: Define the health checks (callables) to pass up before the test starts running.
     * WAIT_FOR_SERVICES: Define whether to wait for services health checks at test setup or not.
+    * REQUIRED_SERVICES: Define the services the test requires (all the environment services by default - in lazy
+      services mode, a test which doesn't declare its services starts all of them).
+    * DISRUPTS: Define the services the test disrupts (e.g. using `container_down`), True if it disrupts the whole
+      environment (e.g. mutates its state). Used for ordering the tests, see `docker_test_tools.ordering`.
     """
     # Override to define the timeout (in seconds) for the required checks to pass.
     CHECKS_TIMEOUT = 120
@@ -27,12 +31,21 @@ class BaseDockerTest(unittest.TestCase):
     # Override to disable health checks validation before the test starts running.
     WAIT_FOR_SERVICES = True
 
+    # Override to define the services the test requires, only these services are waited for (None for all services,
+    # which also starts all of them in lazy services mode).
+    REQUIRED_SERVICES = None
+
+    # Override to define the services the test disrupts, or True if it disrupts the whole environment.
+    DISRUPTS = False
+
     def setUp(self):
         """Manage the required containers setup."""
         if self.WAIT_FOR_SERVICES:
             # Wait for docker inspection on the services to pass
             self.assertTrue(
-                self.controller.wait_for_services(interval=self.CHECKS_INTERVAL, timeout=self.CHECKS_TIMEOUT),
+                self.controller.wait_for_services(services=self.REQUIRED_SERVICES,
+                                                  interval=self.CHECKS_INTERVAL,
+                                                  timeout=self.CHECKS_TIMEOUT),
                 "Required checks didn't pass within timeout")
 
         if self.REQUIRED_HEALTH_CHECKS:
@@ -0,0 +1,272 @@
+"""Utility for detecting containers resource usage regressions against a stored baseline.
+
+The baseline is a numeric stats summary (see `ClusterStats.to_raw_dict`) of a previous run, holding the resource
+usage summary per container and, when available, per test.
+"""
+import os
+import json
+import logging
+
+import humanfriendly
+
+log = logging.getLogger(__name__)
+
+# Metrics reported in bytes (formatted as sizes in the regressions report)
+SIZE_RESOURCES = ('ram', 'net_io', 'block_io')
+
+
+class Threshold(object):
+    """Allowed growth of a metric compared to its baseline value.
+
+    A metric is considered regressed only when it grew by more than *both* the relative and the absolute thresholds,
+    so small absolute changes of tiny values and small relative changes of huge values are not reported.
+    """
+
+    def __init__(self, relative, absolute=0):
+        """Initialize the threshold.
+
+        :param float relative: allowed relative growth (e.g. 0.2 for 20%).
+        :param float absolute: allowed absolute growth (in the metric units - percents or bytes).
+        """
+        self.relative = relative
+        self.absolute = absolute
+
+    def is_exceeded(self, baseline_value, current_value):
+        """Return True if the current value grew above the threshold compared to the baseline value."""
+        growth = current_value - baseline_value
+        if growth <= self.absolute:
+            return False
+
+        return baseline_value <= 0 or float(growth) / baseline_value > self.relative
+
+    def __repr__(self):
+        return "Threshold(relative=%r, absolute=%r)" % (self.relative, self.absolute)
+
+
+# Default thresholds, keyed by '<resource>.<aggregation>'
+DEFAULT_THRESHOLDS = {
+    'cpu.avg': Threshold(relative=0.5, absolute=5),
+    'cpu.max': Threshold(relative=0.5, absolute=20),
+    'ram.avg': Threshold(relative=0.2, absolute=10 * 1024 ** 2),
+    'ram.max': Threshold(relative=0.2, absolute=10 * 1024 ** 2),
+}
+
+
+def parse_thresholds(raw_thresholds):
+    """Parse a thresholds string into a thresholds dictionary.
+
+    The string format is a comma separated list of '<resource>.<aggregation>=<relative>[:<absolute>]', for example:
+    'ram.max=0.2:10485760,cpu.avg=0.5'
+
+    :param str raw_thresholds: thresholds string.
+    :return dict: of format {metric: Threshold}, the default thresholds if the string is empty.
+    """
+    if not raw_thresholds:
+        return dict(DEFAULT_THRESHOLDS)
+
+    thresholds = {}
+    for raw_threshold in raw_thresholds.split(','):
+        try:
+            metric, values = raw_threshold.strip().split('=')
+            relative, _, absolute = values.partition(':')
+            thresholds[metric.strip()] = Threshold(relative=float(relative), absolute=float(absolute or 0))
+        except ValueError:
+            raise ValueError("Invalid threshold: %r, expected '<resource>.<aggregation>=<relative>[:<absolute>]'"
+                             % raw_threshold)
+
+    return thresholds
+
+
+def save_baseline(summary, path):
+    """Store the given stats summary as a baseline.
+
+    :param dict summary: numeric stats summary (see `ClusterStats.to_raw_dict`).
+    :param str path: baseline file path.
+    """
+    log.debug("Saving stats baseline to %s", path)
+    dir_path = os.path.dirname(path)
+    if dir_path and not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+
+    with open(path, 'w') as baseline_file:
+        json.dump(summary, baseline_file, sort_keys=True, indent=2)
+
+
+def load_baseline(path):
+    """Load a stored stats baseline.
+
+    :param str path: baseline file path.
+    :return dict: numeric stats summary.
+    """
+    with open(path, 'r') as baseline_file:
+        return json.load(baseline_file)
+
+
+class Regression(object):
+    """A single metric regression."""
+
+    def __init__(self, container, metric, baseline_value, current_value, threshold, test=None):
+        self.test = test
+        self.metric = metric
+        self.container = container
+        self.threshold = threshold
+        self.current_value = current_value
+        self.baseline_value = baseline_value
+
+    @property
+    def growth(self):
+        """Return the relative growth of the metric, or None if the baseline value is 0."""
+        if self.baseline_value <= 0:
+            return None
+
+        return float(self.current_value - self.baseline_value) / self.baseline_value
+
+    def format_value(self, value):
+        """Return a human readable representation of the given metric value."""
+        if self.metric.split('.')[0] in SIZE_RESOURCES:
+            return humanfriendly.format_size(value)
+
+        return "%.2f%%" % value
+
+    def __str__(self):
+        scope = self.container if self.test is None else "%s [%s]" % (self.container, self.test)
+        growth = "" if self.growth is None else " (+%.1f%%)" % (self.growth * 100)
+        return "%s %s: %s -> %s%s" % (scope, self.metric, self.format_value(self.baseline_value),
+                                      self.format_value(self.current_value), growth)
+
+    def to_dict(self):
+        return {
+            "test": self.test,
+            "metric": self.metric,
+            "container": self.container,
+            "current": self.current_value,
+            "baseline": self.baseline_value,
+        }
+
+
+class RegressionReport(object):
+    """Result of comparing a stats summary against a baseline."""
+
+    def __init__(self, regressions, missing_containers, new_containers):
+        """Initialize the report.
+
+        :param list regressions: detected regressions.
+        :param list missing_containers: baseline containers with no stats in the current run.
+        :param list new_containers: current run containers with no stats in the baseline.
+        """
+        self.regressions = regressions
+        self.new_containers = new_containers
+        self.missing_containers = missing_containers
+
+    @property
+    def passed(self):
+        """Return True if no regressions were detected."""
+        return not self.regressions
+
+    def format(self):
+        """Return a human readable diff report."""
+        lines = ["Resource regression check: %s" % ("PASSED" if self.passed else "FAILED")]
+        lines.extend("  %s" % regression for regression in self.regressions)
+        if self.new_containers:
+            lines.append("  New containers (not in baseline): %s" % ", ".join(sorted(self.new_containers)))
+        if self.missing_containers:
+            lines.append("  Missing containers (only in baseline): %s" % ", ".join(sorted(self.missing_containers)))
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.format()
+
+    def to_dict(self):
+        return {
+            "passed": self.passed,
+            "new_containers": sorted(self.new_containers),
+            "missing_containers": sorted(self.missing_containers),
+            "regressions": [regression.to_dict() for regression in self.regressions],
+        }
+
+
+def compare(baseline, current, thresholds=None):
+    """Compare a stats summary against a baseline.
+
+    :param dict baseline: baseline numeric stats summary.
+    :param dict current: current run numeric stats summary.
+    :param dict thresholds: of format {'<resource>.<aggregation>': Threshold}, defaults to DEFAULT_THRESHOLDS.
+    :return RegressionReport: the comparison report.
+    """
+    thresholds = DEFAULT_THRESHOLDS if thresholds is None else thresholds
+
+    baseline_containers = baseline.get("containers", {})
+    current_containers = current.get("containers", {})
+
+    regressions = _compare_containers(baseline_containers, current_containers, thresholds)
+
+    baseline_tests = baseline.get("tests", {})
+    for test_name, test_containers in sorted(current.get("tests", {}).items()):
+        if test_name in baseline_tests:
+            regressions.extend(_compare_containers(baseline_tests[test_name], test_containers, thresholds,
+                                                   test=test_name))
+
+    return RegressionReport(
+        regressions=regressions,
+        new_containers=[name for name in current_containers if name not in baseline_containers],
+        missing_containers=[name for name in baseline_containers if name not in current_containers],
+    )
+
+
+def check(summary, path, mode='compare', thresholds=None, report_dir=None):
+    """Check the given stats summary against the stored baseline.
+
+    In 'update' mode (or when no baseline exists yet) the stats summary is stored as the new baseline, in 'compare'
+    mode it's compared against the baseline and the comparison report is logged.
+
+    :param dict summary: current run numeric stats summary.
+    :param str path: baseline file path.
+    :param str mode: 'compare' or 'update'.
+    :param dict thresholds: of format {'<resource>.<aggregation>': Threshold}, defaults to DEFAULT_THRESHOLDS.
+    :param str report_dir: directory to write the comparison report ('regressions.json') to, if given.
+    :return RegressionReport: the comparison report, or None if the baseline was stored.
+    """
+    if mode == 'update' or not os.path.exists(path):
+        log.info("Storing the stats summary as the stats baseline: %s", path)
+        save_baseline(summary, path)
+        return None
+
+    report = compare(baseline=load_baseline(path), current=summary, thresholds=thresholds)
+    if report_dir:
+        with open(os.path.join(report_dir, 'regressions.json'), 'w') as report_file:
+            json.dump(report.to_dict(), report_file, sort_keys=True, indent=2)
+
+    if report.passed:
+        log.info(report.format())
+    else:
+        log.error(report.format())
+
+    return report
+
+
+def _compare_containers(baseline_containers, current_containers, thresholds, test=None):
+    """Return the regressions of the containers found in both the baseline and the current stats."""
+    regressions = []
+    for name, current_stats in sorted(current_containers.items()):
+        if name not in baseline_containers:
+            continue
+
+        for metric, threshold in sorted(thresholds.items()):
+            resource, aggregation = metric.split('.')
+            try:
+                baseline_value = baseline_containers[name][resource][aggregation]
+                current_value = current_stats[resource][aggregation]
+            except KeyError:
+                continue
+
+            if baseline_value is None or current_value is None:
+                continue
+
+            if threshold.is_exceeded(baseline_value, current_value):
+                regressions.append(Regression(container=name,
+                                              metric=metric,
+                                              baseline_value=baseline_value,
+                                              current_value=current_value,
+                                              threshold=threshold,
+                                              test=test))
+    return regressions
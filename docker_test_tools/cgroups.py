@@ -0,0 +1,532 @@
+"""Utility for high frequency containers stats collection based on cgroup files.
+
+Reading the cgroup files directly avoids the docker daemon round trip per container, which allows sampling the
+environment containers at rates much higher than the ~1Hz refresh rate of `docker stats`.
+"""
+import os
+import json
+import time
+import struct
+import logging
+import threading
+
+from docker_test_tools import stats
+from docker_test_tools import columnar
+
+log = logging.getLogger(__name__)
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+PROC_ROOT = '/proc'
+
+
+class SampleRing(object):
+    """Fixed capacity ring of binary encoded resource samples.
+
+    Each sample is packed into a fixed width record of: timestamp, cpu usage (usec), ram usage (bytes), block io (bytes),
+    network io (bytes) and a reset flag - set on the first sample of a new cgroup (e.g. of a restarted container), whose
+    usage counters start over. Once the ring is full, the oldest samples are overwritten.
+    """
+    RECORD = struct.Struct('<dQQQQ?')
+
+    def __init__(self, capacity):
+        """Initialize the samples ring.
+
+        :param int capacity: max number of samples kept in the ring.
+        """
+        self.capacity = capacity
+        self.buffer = bytearray(self.RECORD.size * capacity)
+        self.count = 0
+
+    def append(self, timestamp, cpu_usage, ram_usage, block_io, net_io=0, reset=False):
+        """Add a sample to the ring, overwriting the oldest one if the ring is full."""
+        offset = (self.count % self.capacity) * self.RECORD.size
+        self.RECORD.pack_into(self.buffer, offset, timestamp, cpu_usage, ram_usage, block_io, net_io, reset)
+        self.count += 1
+
+    def latest(self):
+        """Return the latest sample or None if the ring is empty."""
+        if self.count == 0:
+            return None
+
+        return self.RECORD.unpack_from(self.buffer, ((self.count - 1) % self.capacity) * self.RECORD.size)
+
+    def __len__(self):
+        """Return the number of samples currently stored in the ring."""
+        return min(self.count, self.capacity)
+
+    def __iter__(self):
+        """Iterate over the stored samples - oldest first."""
+        for index in range(self.count - len(self), self.count):
+            yield self.RECORD.unpack_from(self.buffer, (index % self.capacity) * self.RECORD.size)
+
+
+class ContainerCgroup(object):
+    """Read a single container resource usage from its cgroup (v1 or v2) files.
+
+    The files are kept open between reads and re-read from their start, saving an open & close per sample. The network
+    usage is read from the network devices file of the container process (its network namespace), when available.
+    """
+    # Candidate cgroup directories of a container, relative to the cgroup (or v1 controller) root.
+    # Covers both the 'systemd' and the 'cgroupfs' docker cgroup drivers.
+    CONTAINER_DIRS = ('system.slice/docker-{id}.scope', 'docker/{id}')
+
+    def __init__(self, cpu_path, ram_path, ram_stat_path, io_path, version):
+        """Initialize the container cgroup reader.
+
+        :param str cpu_path: cpu usage file path.
+        :param str ram_path: memory usage file path.
+        :param str ram_stat_path: memory stat file path.
+        :param str io_path: block io stat file path (may be None).
+        :param int version: cgroup version (1 or 2).
+        """
+        self.version = version
+        self.cpu_fd = os.open(cpu_path, os.O_RDONLY)
+        self.ram_fd = os.open(ram_path, os.O_RDONLY)
+        self.ram_stat_fd = os.open(ram_stat_path, os.O_RDONLY)
+        self.io_fd = os.open(io_path, os.O_RDONLY) if io_path else None
+        self.net_fd = None
+
+    @classmethod
+    def find(cls, container_id, root=CGROUP_ROOT, pid=None, proc_root=PROC_ROOT):
+        """Return a cgroup reader for the given container, or None if its cgroup files are not readable.
+
+        :param str container_id: docker container id.
+        :param str root: cgroup file system mount point.
+        :param int pid: the container main process id, used for reading the container network usage.
+        :param str proc_root: proc file system mount point.
+        """
+        try:
+            if os.path.exists(os.path.join(root, 'cgroup.controllers')):
+                cgroup = cls._find_v2(container_id, root)
+            else:
+                cgroup = cls._find_v1(container_id, root)
+
+            if cgroup is not None and pid:
+                cgroup.net_fd = cls._open_net(pid, proc_root)
+
+            return cgroup
+
+        except (IOError, OSError) as error:
+            log.debug("Failed opening cgroup files of container %s: %s", container_id, error)
+            return None
+
+    @classmethod
+    def _find_v2(cls, container_id, root):
+        """Return a cgroup v2 (unified hierarchy) reader for the given container."""
+        container_dir = cls._find_dir(root, container_id)
+        if not container_dir:
+            return None
+
+        io_path = os.path.join(container_dir, 'io.stat')
+        return cls(cpu_path=os.path.join(container_dir, 'cpu.stat'),
+                   ram_path=os.path.join(container_dir, 'memory.current'),
+                   ram_stat_path=os.path.join(container_dir, 'memory.stat'),
+                   io_path=io_path if os.path.exists(io_path) else None,
+                   version=2)
+
+    @classmethod
+    def _find_v1(cls, container_id, root):
+        """Return a cgroup v1 reader for the given container."""
+        cpu_dir = cls._find_dir(os.path.join(root, 'cpuacct'), container_id)
+        ram_dir = cls._find_dir(os.path.join(root, 'memory'), container_id)
+        if not cpu_dir or not ram_dir:
+            return None
+
+        io_dir = cls._find_dir(os.path.join(root, 'blkio'), container_id)
+        return cls(cpu_path=os.path.join(cpu_dir, 'cpuacct.usage'),
+                   ram_path=os.path.join(ram_dir, 'memory.usage_in_bytes'),
+                   ram_stat_path=os.path.join(ram_dir, 'memory.stat'),
+                   io_path=os.path.join(io_dir, 'blkio.throttle.io_service_bytes') if io_dir else None,
+                   version=1)
+
+    @staticmethod
+    def _open_net(pid, proc_root):
+        """Open the network devices file of the given process, return None if it's not readable."""
+        try:
+            return os.open(os.path.join(proc_root, str(pid), 'net', 'dev'), os.O_RDONLY)
+        except OSError as error:
+            log.debug("Failed opening the network devices file of process %s: %s", pid, error)
+            return None
+
+    @classmethod
+    def _find_dir(cls, root, container_id):
+        """Return the container directory under the given cgroup root, or None if it doesn't exist."""
+        for container_dir in cls.CONTAINER_DIRS:
+            path = os.path.join(root, container_dir.format(id=container_id))
+            if os.path.isdir(path):
+                return path
+
+        return None
+
+    @staticmethod
+    def _read(fd):
+        """Read the whole content of an open cgroup file."""
+        os.lseek(fd, 0, os.SEEK_SET)
+        return os.read(fd, 65536).decode('utf-8')
+
+    @staticmethod
+    def _parse_stat(content):
+        """Parse a 'key value' lines cgroup stat file into a dictionary."""
+        values = {}
+        for line in content.splitlines():
+            parts = line.split()
+            if len(parts) == 2:
+                values[parts[0]] = int(parts[1])
+        return values
+
+    def read(self):
+        """Return the container current usage as a tuple of: cpu usage (usec), ram usage (bytes), block io (bytes).
+
+        Like `docker stats`, the ram usage doesn't include the inactive page cache.
+        """
+        ram_stat = self._parse_stat(self._read(self.ram_stat_fd))
+        ram_used = int(self._read(self.ram_fd))
+
+        if self.version == 2:
+            cpu_used = self._parse_stat(self._read(self.cpu_fd))['usage_usec']
+            ram_used -= ram_stat.get('inactive_file', 0)
+            block_io_used = self._read_io_v2()
+
+        else:
+            cpu_used = int(self._read(self.cpu_fd)) // 1000
+            ram_used -= ram_stat.get('total_inactive_file', 0)
+            block_io_used = self._read_io_v1()
+
+        return cpu_used, max(ram_used, 0), block_io_used
+
+    def _read_io_v2(self):
+        """Sum the read & written bytes of all devices in an 'io.stat' file."""
+        if self.io_fd is None:
+            return 0
+
+        total = 0
+        for line in self._read(self.io_fd).splitlines():
+            for field in line.split()[1:]:
+                key, _, value = field.partition('=')
+                if key in ('rbytes', 'wbytes'):
+                    total += int(value)
+        return total
+
+    def _read_io_v1(self):
+        """Sum the read & written bytes of all devices in a 'blkio.throttle.io_service_bytes' file."""
+        if self.io_fd is None:
+            return 0
+
+        total = 0
+        for line in self._read(self.io_fd).splitlines():
+            parts = line.split()
+            if len(parts) == 3 and parts[1] in ('Read', 'Write'):
+                total += int(parts[2])
+        return total
+
+    def read_net(self):
+        """Return the container network usage (received & transmitted bytes of all devices but the loopback)."""
+        if self.net_fd is None:
+            return 0
+
+        total = 0
+        # Two header lines, then '<device>: <receive bytes> <7 more receive fields> <transmit bytes> ...' lines
+        for line in self._read(self.net_fd).splitlines()[2:]:
+            device, _, fields = line.partition(':')
+            fields = fields.split()
+            if device.strip() != 'lo' and len(fields) > 8:
+                total += int(fields[0]) + int(fields[8])
+        return total
+
+    def close(self):
+        """Close the open cgroup files."""
+        for fd in (self.cpu_fd, self.ram_fd, self.ram_stat_fd, self.io_fd, self.net_fd):
+            if fd is not None:
+                os.close(fd)
+
+
+class CgroupStatsCollector(stats.StatsCollector):
+    """Utility for high frequency containers stats collection, reading the containers cgroup files.
+
+    Falls back to the `docker stats` based collection when the containers cgroup files are not readable
+    (e.g. when the docker daemon runs on a remote host or in a VM).
+
+    The collector writes the same output files as the `docker stats` based collector: a samples file per container
+    (with an additional 'time' metric), a 'summary.json' file and a 'summary.raw.json' file.
+    """
+    DEFAULT_RATE = 50
+    DEFAULT_CAPACITY = 180000
+    REDISCOVER_INTERVAL = 1.0
+
+    def __init__(self, target_dir_path, project, encoding, environment_variables, docker_client,
+                 rate=DEFAULT_RATE, capacity=DEFAULT_CAPACITY, cgroup_root=CGROUP_ROOT, output_format='json',
+                 downsample=None, proc_root=PROC_ROOT):
+        """Initialize the cgroup stats collector.
+
+        :param docker.APIClient docker_client: client used to list the project containers.
+        :param float rate: sampling rate (in Hz).
+        :param int capacity: max number of samples kept per container (older samples are dropped from the
+            samples files, but are still included in the summary).
+        :param str cgroup_root: cgroup file system mount point.
+        :param str proc_root: proc file system mount point.
+        """
+        super(CgroupStatsCollector, self).__init__(target_dir_path=target_dir_path,
+                                                   project=project,
+                                                   encoding=encoding,
+                                                   environment_variables=environment_variables,
+                                                   output_format=output_format,
+                                                   downsample=downsample)
+        self.rate = rate
+        self.capacity = capacity
+        self.cgroup_root = cgroup_root
+        self.proc_root = proc_root
+        self.docker_client = docker_client
+
+        self.fallback = False
+        self.cgroups = {}
+        self.rings = {}
+        self.summaries = {}
+        self.tests_summaries = {}
+        self.markers = []
+        self.current = {}
+        self.lost = {}
+
+        self.stop_event = threading.Event()
+        self.sampler_thread = None
+
+    def start(self):
+        """Start sampling the project containers cgroup files in a background thread."""
+        self.cgroups = self._get_cgroups()
+        if not self.cgroups:
+            log.warning("Containers cgroup files are not readable, falling back to docker stats collection")
+            self.fallback = True
+            super(CgroupStatsCollector, self).start()
+            return
+
+        log.debug("Starting cgroup stats collection from environment containers at %sHz", self.rate)
+        self.rings = {name: SampleRing(capacity=self.capacity) for name in self.cgroups}
+        self.summaries = {name: stats.ContainerStats(name=name) for name in self.cgroups}
+        self.stop_event.clear()
+        self.sampler_thread = threading.Thread(target=self._run, name='cgroup-stats-sampler')
+        self.sampler_thread.daemon = True
+        self.sampler_thread.start()
+
+    def stop(self):
+        """Stop the sampling thread and write the collected stats files."""
+        if self.fallback:
+            super(CgroupStatsCollector, self).stop()
+            return
+
+        log.debug("Stopping cgroup stats collection from environment containers")
+        if self.sampler_thread:
+            self.stop_event.set()
+            self.sampler_thread.join()
+            self.sampler_thread = None
+
+        for cgroup in self.cgroups.values():
+            cgroup.close()
+
+        self._write_samples()
+        summaries = {name: summary for name, summary in self.summaries.items() if summary.count}
+        self.summary = {
+            "containers": {name: summary.to_raw_dict() for name, summary in summaries.items()},
+            "tests": {test_name: {name: summary.to_raw_dict() for name, summary in test_summaries.items()}
+                      for test_name, test_summaries in self.tests_summaries.items()}
+        }
+        with open(self.stats_summary_path, 'w') as target:
+            json.dump({name: summary.to_dict() for name, summary in summaries.items()},
+                      target, sort_keys=True, indent=2)
+        self._write_raw_summary()
+
+    def latest(self):
+        """Return the latest sample per container.
+
+        :return dict: of format {container_name: {cpu, ram, net, block}}.
+        """
+        if self.fallback:
+            return super(CgroupStatsCollector, self).latest()
+
+        return dict(self.current)
+
+    def update(self, message):
+        """Mark the current point in time with the given message."""
+        if self.fallback:
+            super(CgroupStatsCollector, self).update(message)
+            return
+
+        self.markers.append((time.time(), message))
+
+    def follow(self, services):
+        """Start sampling the given services containers, started after the collection started."""
+        if self.fallback:
+            super(CgroupStatsCollector, self).follow(services)
+            return
+
+        if self.sampler_thread is None:
+            return
+
+        filters = {"label": "com.docker.compose.project={project}".format(project=self.project)}
+        for container in self.docker_client.containers(filters=filters):
+            name = container['Names'][0].lstrip('/')
+            if name in self.rings:
+                continue
+
+            cgroup = self._find_cgroup(container)
+            if cgroup is None:
+                log.warning("Container %s cgroup files are not readable, its stats are not collected", name)
+                continue
+
+            log.debug("Starting cgroup stats collection from service container %s", name)
+            # The sampler thread samples the container once its cgroup is added
+            self.rings[name] = SampleRing(capacity=self.capacity)
+            self.summaries[name] = stats.ContainerStats(name=name)
+            self.cgroups[name] = cgroup
+
+    def _get_cgroups(self):
+        """Return a cgroup reader per project container, or an empty dictionary if one of them is not readable."""
+        filters = {"label": "com.docker.compose.project={project}".format(project=self.project)}
+        cgroups = {}
+        for container in self.docker_client.containers(filters=filters):
+            cgroup = self._find_cgroup(container)
+            if cgroup is None:
+                for opened_cgroup in cgroups.values():
+                    opened_cgroup.close()
+                return {}
+
+            cgroups[container['Names'][0].lstrip('/')] = cgroup
+
+        return cgroups
+
+    def _find_cgroup(self, container):
+        """Return a cgroup reader of the given (listed) container, or None if its cgroup files are not readable."""
+        try:
+            pid = self.docker_client.inspect_container(container['Id'])['State']['Pid']
+        except Exception as error:
+            log.debug("Failed inspecting container %s, reason: %s", container['Id'], error)
+            pid = None
+
+        return ContainerCgroup.find(container_id=container['Id'], root=self.cgroup_root, pid=pid,
+                                    proc_root=self.proc_root)
+
+    def _run(self):
+        """Sample the containers cgroup files in the configured rate until stopped."""
+        interval = 1.0 / self.rate
+        previous = {}
+        next_sample_time = time.time()
+        while not self.stop_event.is_set():
+            self._sample(previous)
+            next_sample_time += interval
+            self.stop_event.wait(max(0, next_sample_time - time.time()))
+
+    def _sample(self, previous):
+        """Sample all the containers once.
+
+        :param dict previous: last (timestamp, cpu usage) per container, used to calculate the cpu percentage.
+        """
+        for name, retry_time in list(self.lost.items()):
+            if time.time() >= retry_time:
+                self._rediscover(name, previous)
+
+        for name, cgroup in list(self.cgroups.items()):
+            try:
+                cpu_used, ram_used, block_io_used = cgroup.read()
+                net_io_used = cgroup.read_net()
+            except (IOError, OSError, ValueError, KeyError):
+                # The container may have been stopped, restarted or recreated (with a new cgroup)
+                self._lose(name)
+                continue
+
+            timestamp = time.time()
+            # A container without previous samples may have been re-discovered with a new cgroup, the usage counters
+            # of which start over
+            self.rings[name].append(timestamp, cpu_used, ram_used, block_io_used, net_io_used,
+                                    reset=name not in previous)
+
+            if name in previous:
+                previous_timestamp, previous_cpu_used = previous[name]
+                wall_usec = (timestamp - previous_timestamp) * 1000000
+                cpu_percent = 100.0 * (cpu_used - previous_cpu_used) / wall_usec if wall_usec > 0 else 0.0
+                self.current[name] = {"cpu": cpu_percent, "ram": ram_used, "net": net_io_used,
+                                      "block": block_io_used}
+                self.summaries[name].update(cpu_used=cpu_percent,
+                                            ram_used=ram_used,
+                                            net_io_used=net_io_used,
+                                            block_io_used=block_io_used)
+
+                if self.markers:
+                    test_summaries = self.tests_summaries.setdefault(self.markers[-1][1], {})
+                    if name not in test_summaries:
+                        test_summaries[name] = stats.ContainerStats(name=name)
+
+                    test_summaries[name].update(cpu_used=cpu_percent,
+                                                ram_used=ram_used,
+                                                net_io_used=net_io_used,
+                                                block_io_used=block_io_used)
+
+            previous[name] = (timestamp, cpu_used)
+
+    def _lose(self, name):
+        """Stop sampling the given container cgroup, until the container cgroup is re-discovered."""
+        log.warning("Failed reading container %s cgroup files, stopped sampling it until it's re-discovered", name)
+        cgroup = self.cgroups.pop(name)
+        try:
+            cgroup.close()
+        except OSError:
+            pass
+
+        self.lost[name] = time.time() + self.REDISCOVER_INTERVAL
+
+    def _rediscover(self, name, previous):
+        """Look up the given (lost) container cgroup, resuming its sampling if it's found."""
+        cgroup = None
+        try:
+            for container in self.docker_client.containers(filters={'name': name}):
+                # The name filter matches partial names
+                if name in [container_name.lstrip('/') for container_name in container['Names']]:
+                    cgroup = self._find_cgroup(container)
+                    break
+
+        except Exception as error:
+            log.debug("Failed looking up container %s, reason: %s", name, error)
+
+        if cgroup is None:
+            self.lost[name] = time.time() + self.REDISCOVER_INTERVAL
+            return
+
+        log.info("Re-discovered container %s cgroup, resumed sampling it", name)
+        del self.lost[name]
+        # The cpu usage of a new cgroup starts over
+        previous.pop(name, None)
+        self.cgroups[name] = cgroup
+
+    def _write_samples(self):
+        """Write a samples file per container, in the same format of the `docker stats` based collector."""
+        for name, ring in self.rings.items():
+            markers = []
+            columns = [(metric, []) for metric in ('time', 'cpu', 'ram', 'net', 'block')]
+            times, cpus, rams, nets, blocks = [values for _, values in columns]
+
+            remaining_markers = iter(self.markers)
+            marker = next(remaining_markers, None)
+            previous = None
+            for timestamp, cpu_used, ram_used, block_io_used, net_io_used, reset in ring:
+                while marker is not None and marker[0] <= timestamp:
+                    markers.append((len(times), marker[1]))
+                    marker = next(remaining_markers, None)
+
+                # No cpu usage delta across a cgroup reset
+                if previous is not None and not reset:
+                    wall_usec = (timestamp - previous[0]) * 1000000
+                    times.append(timestamp)
+                    cpus.append(100.0 * (cpu_used - previous[1]) / wall_usec if wall_usec > 0 else 0.0)
+                    rams.append(ram_used)
+                    nets.append(net_io_used)
+                    blocks.append(block_io_used)
+                previous = (timestamp, cpu_used)
+
+            # Markers written after the last sample
+            while marker is not None:
+                markers.append((len(times), marker[1]))
+                marker = next(remaining_markers, None)
+
+            columnar.write_stats(path=os.path.join(self.work_dir, name),
+                                 columns=columns,
+                                 markers=markers,
+                                 output_format=self.output_format,
+                                 threshold=self.downsample,
+                                 x_column='time')
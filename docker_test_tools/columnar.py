@@ -0,0 +1,209 @@
+"""Utility for writing & loading containers stats samples in a compact columnar binary format.
+
+File layout (all numbers are little endian):
+
+* 4 bytes magic ('DTTC') and a 1 byte format version.
+* 4 bytes header length, followed by a json header: {"columns": [names], "count": samples, "markers": [[index, text]]}.
+* The columns data, each column is `count` contiguous float64 values.
+
+Loading a file reads each column with a single read into an `array.array('d')`, which is buffer compatible
+(e.g. `numpy.frombuffer(column)` wraps it without copying).
+"""
+import sys
+import json
+import struct
+import logging
+from array import array
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'DTTC'
+VERSION = 1
+EXTENSION = '.dttc'
+PREAMBLE = struct.Struct('<4sBI')
+
+
+class ColumnarStats(object):
+    """Loaded columnar stats - arrays per metric and markers."""
+
+    def __init__(self, columns, markers):
+        """Initialize the loaded stats.
+
+        :param dict columns: of format {metric: array('d')}.
+        :param list markers: list of (sample_index, text) tuples.
+        """
+        self.columns = columns
+        self.markers = markers
+
+    def __getitem__(self, metric):
+        return self.columns[metric]
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+
+def write_columns(path, columns, markers=()):
+    """Write the given columns into a columnar stats file.
+
+    :param str path: target file path.
+    :param list columns: list of (name, values) tuples, all values sequences should have the same length.
+    :param list markers: list of (sample_index, text) tuples.
+    """
+    count = len(columns[0][1]) if columns else 0
+    header = json.dumps({"columns": [name for name, _ in columns],
+                         "count": count,
+                         "markers": [list(marker) for marker in markers]}).encode('utf-8')
+
+    with open(path, 'wb') as target:
+        target.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        target.write(header)
+        for name, values in columns:
+            if len(values) != count:
+                raise ValueError("Column %r length (%d) doesn't match the samples count (%d)" %
+                                 (name, len(values), count))
+
+            column = values if isinstance(values, array) and values.typecode == 'd' else array('d', values)
+            if sys.byteorder == 'big':
+                column = array('d', column)
+                column.byteswap()
+            target.write(column.tostring() if sys.version_info[0] == 2 else column.tobytes())
+
+
+def load_columns(path):
+    """Load a columnar stats file.
+
+    :param str path: columnar stats file path.
+    :return ColumnarStats: the loaded columns & markers.
+    """
+    with open(path, 'rb') as source:
+        magic, version, header_length = PREAMBLE.unpack(source.read(PREAMBLE.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("'%s' is not a valid columnar stats file" % path)
+
+        header = json.loads(source.read(header_length).decode('utf-8'))
+        columns = {}
+        for name in header["columns"]:
+            column = array('d')
+            column.fromfile(source, header["count"])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns[name] = column
+
+    return ColumnarStats(columns=columns, markers=[tuple(marker) for marker in header["markers"]])
+
+
+def lttb(xs, ys, threshold):
+    """Return the indices of the points selected by the largest-triangle-three-buckets downsampling algorithm.
+
+    :param list xs: points x values (ascending).
+    :param list ys: points y values.
+    :param int threshold: max number of points to select.
+    :return list: ascending selected points indices, always including the first and the last points.
+    """
+    count = len(xs)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    selected = [0]
+    bucket_size = float(count - 2) / (threshold - 2)
+    previous = 0
+
+    for bucket in range(threshold - 2):
+        # Average point of the next bucket (the last point for the last bucket)
+        next_start = int((bucket + 1) * bucket_size) + 1
+        next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+        if next_start >= next_end:
+            next_start, next_end = count - 1, count
+        avg_x = float(sum(xs[next_start:next_end])) / (next_end - next_start)
+        avg_y = float(sum(ys[next_start:next_end])) / (next_end - next_start)
+
+        # Select the point of the current bucket forming the largest triangle with the previous and average points
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        prev_x, prev_y = xs[previous], ys[previous]
+        max_area = -1
+        for index in range(start, end):
+            area = abs((prev_x - avg_x) * (ys[index] - prev_y) - (prev_x - xs[index]) * (avg_y - prev_y))
+            if area > max_area:
+                max_area = area
+                previous = index
+
+        selected.append(previous)
+
+    selected.append(count - 1)
+    return selected
+
+
+def downsample(columns, markers, threshold, x_column=None):
+    """Downsample the given columns using LTTB, preserving the shape of every metric.
+
+    The points selected for each metric are merged, so all the columns keep sharing the same samples.
+
+    :param list columns: list of (name, values) tuples.
+    :param list markers: list of (sample_index, text) tuples.
+    :param int threshold: max number of points to select per metric.
+    :param str x_column: name of the column used as the x axis, the sample index is used when None.
+    :return tuple: (columns, markers) downsampled.
+    """
+    values = dict(columns)
+    count = len(columns[0][1]) if columns else 0
+    xs = values[x_column] if x_column else range(count)
+
+    indices = set()
+    for name, ys in columns:
+        if name != x_column:
+            indices.update(lttb(xs, ys, threshold))
+    indices = sorted(indices)
+
+    downsampled_columns = [(name, [column[index] for index in indices]) for name, column in columns]
+
+    # Map each marker to the first kept sample at or after its original position
+    downsampled_markers = []
+    position = 0
+    for marker_index, text in markers:
+        while position < len(indices) and indices[position] < marker_index:
+            position += 1
+        downsampled_markers.append((position, text))
+
+    return downsampled_columns, downsampled_markers
+
+
+def write_stats(path, columns, markers=(), output_format='json', threshold=None, x_column=None):
+    """Write samples of a container into a stats file in the given format.
+
+    :param str path: target file path, without an extension.
+    :param list columns: list of (name, values) tuples.
+    :param list markers: list of (sample_index, text) tuples.
+    :param str output_format: 'json' for a list of samples dictionaries, 'binary' for the columnar format.
+    :param int threshold: when given, downsample the samples to about this number of points per metric.
+    :param str x_column: name of the column used as the x axis when downsampling.
+    :return str: the written file path.
+    """
+    if threshold:
+        columns, markers = downsample(columns, markers, threshold=threshold, x_column=x_column)
+
+    if output_format == 'binary':
+        write_columns(path + EXTENSION, columns, markers)
+        return path + EXTENSION
+
+    if output_format != 'json':
+        raise ValueError("Invalid stats format: %r, must be one of ['json', 'binary']" % output_format)
+
+    names = [name for name, _ in columns]
+    rows = zip(*[values for _, values in columns])
+    output = []
+    markers = iter(markers)
+    marker = next(markers, None)
+    for index, row in enumerate(rows):
+        while marker is not None and marker[0] <= index:
+            output.append({"test": marker[1]})
+            marker = next(markers, None)
+        output.append(dict(zip(names, row)))
+
+    while marker is not None:
+        output.append({"test": marker[1]})
+        marker = next(markers, None)
+
+    with open(path + '.json', 'w') as stat_file:
+        json.dump(output, stat_file, indent=2)
+    return path + '.json'
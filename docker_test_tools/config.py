@@ -1,6 +1,17 @@
 import os
 from six.moves import configparser
 
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def get_env_flag(name, default):
+    """Return the given boolean environment variable value (1/ true/ yes, case insensitive), or the default if unset."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+
+    return value.lower() in TRUE_VALUES
+
 
 class Config(object):
     """Configuration for docker test tools.
@@ -11,6 +22,12 @@ class Config(object):
     * Compose project name.
     * Docker compose file path.
     * Whether or not to keep containers between test runs [True/ False].
+    * Stats collection backend [api/ cgroup] and sampling rate (in Hz, cgroup backend only).
+    * Stats samples files format [json/ binary] and downsampling threshold (0 to disable).
+    * Stats baseline path, mode [compare/ update] and regression thresholds.
+    * Live metrics endpoint port (disabled by default, 0 for an ephemeral port).
+    * Whether or not to order the tests by environment affinity [True/ False].
+    * Whether or not to start only the services required by the selected tests [True/ False].
 
     The configuration may be set via:
 
@@ -25,6 +42,20 @@ class Config(object):
         project-name = <compose project name>
         docker-compose-path = <docker compose path>
         reuse-containers = <True/ False>.
+        stats-backend = <api/ cgroup>
+        stats-rate = <sampling rate in Hz>
+        stats-format = <json/ binary>
+        stats-downsample = <max points per metric>
+        baseline-path = <stats baseline path>
+        baseline-mode = <compare/ update>
+        baseline-thresholds = <resource>.<aggregation>=<relative>[:<absolute>],...
+        metrics-port = <metrics endpoint port>
+        order-tests = <True/ False>
+        lazy-services = <True/ False>
+        background-teardown = <True/ False>
+        stop-timeout = <seconds, 0 to kill>
+        reap-stale-projects = <True/ False>
+        state-dir = <environment state cache directory>
 
     Supported environment variables:
 
@@ -33,6 +64,20 @@ class Config(object):
         DTT_COMPOSE_PATH = <docker compose path>
         DTT_REUSE_CONTAINERS = <1/0>.
         DTT_COLLECT_STATS = <1/0>
+        DTT_STATS_BACKEND = <api/ cgroup>
+        DTT_STATS_RATE = <sampling rate in Hz>
+        DTT_STATS_FORMAT = <json/ binary>
+        DTT_STATS_DOWNSAMPLE = <max points per metric>
+        DTT_BASELINE_PATH = <stats baseline path>
+        DTT_BASELINE_MODE = <compare/ update>
+        DTT_BASELINE_THRESHOLDS = <resource>.<aggregation>=<relative>[:<absolute>],...
+        DTT_METRICS_PORT = <metrics endpoint port>
+        DTT_ORDER_TESTS = <1/0>
+        DTT_LAZY_SERVICES = <1/0>
+        DTT_BACKGROUND_TEARDOWN = <1/0>
+        DTT_STOP_TIMEOUT = <seconds, 0 to kill>
+        DTT_REAP_STALE_PROJECTS = <1/0>
+        DTT_STATE_DIR = <environment state cache directory>
 
     """
     # Expected section name in the configuration file
@@ -44,6 +89,20 @@ class Config(object):
     REUSE_CONTAINERS_OPTION = 'reuse-containers'
     DOCKER_COMPOSE_PATH_OPTION = 'docker-compose-path'
     COLLECT_STATS_OPTION = 'collect-stats'
+    STATS_BACKEND_OPTION = 'stats-backend'
+    STATS_RATE_OPTION = 'stats-rate'
+    STATS_FORMAT_OPTION = 'stats-format'
+    STATS_DOWNSAMPLE_OPTION = 'stats-downsample'
+    BASELINE_PATH_OPTION = 'baseline-path'
+    BASELINE_MODE_OPTION = 'baseline-mode'
+    BASELINE_THRESHOLDS_OPTION = 'baseline-thresholds'
+    METRICS_PORT_OPTION = 'metrics-port'
+    ORDER_TESTS_OPTION = 'order-tests'
+    LAZY_SERVICES_OPTION = 'lazy-services'
+    BACKGROUND_TEARDOWN_OPTION = 'background-teardown'
+    STOP_TIMEOUT_OPTION = 'stop-timeout'
+    REAP_STALE_PROJECTS_OPTION = 'reap-stale-projects'
+    STATE_DIR_OPTION = 'state-dir'
 
     # Expected options in the configuration file
     LOG_PATH_ENV_VAR = 'DTT_LOG_PATH'
@@ -51,6 +110,20 @@ class Config(object):
     REUSE_CONTAINERS_ENV_VAR = 'DTT_REUSE_CONTAINERS'
     DOCKER_COMPOSE_PATH_ENV_VAR = 'DTT_COMPOSE_PATH'
     COLLECT_STATS_ENV_VAR = 'DTT_COLLECT_STATS'
+    STATS_BACKEND_ENV_VAR = 'DTT_STATS_BACKEND'
+    STATS_RATE_ENV_VAR = 'DTT_STATS_RATE'
+    STATS_FORMAT_ENV_VAR = 'DTT_STATS_FORMAT'
+    STATS_DOWNSAMPLE_ENV_VAR = 'DTT_STATS_DOWNSAMPLE'
+    BASELINE_PATH_ENV_VAR = 'DTT_BASELINE_PATH'
+    BASELINE_MODE_ENV_VAR = 'DTT_BASELINE_MODE'
+    BASELINE_THRESHOLDS_ENV_VAR = 'DTT_BASELINE_THRESHOLDS'
+    METRICS_PORT_ENV_VAR = 'DTT_METRICS_PORT'
+    ORDER_TESTS_ENV_VAR = 'DTT_ORDER_TESTS'
+    LAZY_SERVICES_ENV_VAR = 'DTT_LAZY_SERVICES'
+    BACKGROUND_TEARDOWN_ENV_VAR = 'DTT_BACKGROUND_TEARDOWN'
+    STOP_TIMEOUT_ENV_VAR = 'DTT_STOP_TIMEOUT'
+    REAP_STALE_PROJECTS_ENV_VAR = 'DTT_REAP_STALE_PROJECTS'
+    STATE_DIR_ENV_VAR = 'DTT_STATE_DIR'
 
     # Configuration default values
     DEFAULT_LOG_PATH = 'docker-tests.log'
@@ -58,12 +131,40 @@ class Config(object):
     DEFAULT_REUSE_CONTAINERS = False
     DEFAULT_DOCKER_COMPOSE_PATH = 'docker-compose.yml'
     DEFAULT_COLLECT_STATS = False
+    DEFAULT_STATS_BACKEND = 'api'
+    DEFAULT_STATS_RATE = 50.0
+    DEFAULT_STATS_FORMAT = 'json'
+    DEFAULT_STATS_DOWNSAMPLE = 0
+    DEFAULT_BASELINE_PATH = None
+    DEFAULT_BASELINE_MODE = 'compare'
+    DEFAULT_BASELINE_THRESHOLDS = ''
+    DEFAULT_METRICS_PORT = None
+    DEFAULT_ORDER_TESTS = False
+    DEFAULT_LAZY_SERVICES = False
+    DEFAULT_BACKGROUND_TEARDOWN = False
+    DEFAULT_STOP_TIMEOUT = None
+    DEFAULT_REAP_STALE_PROJECTS = False
+    DEFAULT_STATE_DIR = None
 
     def __init__(self,
                  config_path=None,
                  log_path=DEFAULT_LOG_PATH,
                  project_name=DEFAULT_PROJECT_NAME,
                  collect_stats=DEFAULT_COLLECT_STATS,
+                 stats_backend=DEFAULT_STATS_BACKEND,
+                 stats_rate=DEFAULT_STATS_RATE,
+                 stats_format=DEFAULT_STATS_FORMAT,
+                 stats_downsample=DEFAULT_STATS_DOWNSAMPLE,
+                 baseline_path=DEFAULT_BASELINE_PATH,
+                 baseline_mode=DEFAULT_BASELINE_MODE,
+                 baseline_thresholds=DEFAULT_BASELINE_THRESHOLDS,
+                 metrics_port=DEFAULT_METRICS_PORT,
+                 order_tests=DEFAULT_ORDER_TESTS,
+                 lazy_services=DEFAULT_LAZY_SERVICES,
+                 background_teardown=DEFAULT_BACKGROUND_TEARDOWN,
+                 stop_timeout=DEFAULT_STOP_TIMEOUT,
+                 reap_stale_projects=DEFAULT_REAP_STALE_PROJECTS,
+                 state_dir=DEFAULT_STATE_DIR,
                  reuse_containers=DEFAULT_REUSE_CONTAINERS,
                  docker_compose_path=DEFAULT_DOCKER_COMPOSE_PATH):
 
@@ -71,6 +172,20 @@ class Config(object):
         self.log_path = log_path
         self.project_name = project_name
         self.collect_stats = collect_stats
+        self.stats_backend = stats_backend
+        self.stats_rate = stats_rate
+        self.stats_format = stats_format
+        self.stats_downsample = stats_downsample
+        self.baseline_path = baseline_path
+        self.baseline_mode = baseline_mode
+        self.baseline_thresholds = baseline_thresholds
+        self.metrics_port = metrics_port
+        self.order_tests = order_tests
+        self.lazy_services = lazy_services
+        self.background_teardown = background_teardown
+        self.stop_timeout = stop_timeout
+        self.reap_stale_projects = reap_stale_projects
+        self.state_dir = state_dir
         self.reuse_containers = reuse_containers
         self.docker_compose_path = docker_compose_path
 
@@ -86,6 +201,22 @@ class Config(object):
         self.log_path = os.environ.get(self.LOG_PATH_ENV_VAR, self.log_path)
         self.project_name = os.environ.get(self.PROJECT_NAME_ENV_VAR, self.project_name)
         self.collect_stats = os.environ.get(self.COLLECT_STATS_ENV_VAR, self.collect_stats)
+        self.stats_backend = os.environ.get(self.STATS_BACKEND_ENV_VAR, self.stats_backend)
+        self.stats_rate = float(os.environ.get(self.STATS_RATE_ENV_VAR, self.stats_rate))
+        self.stats_format = os.environ.get(self.STATS_FORMAT_ENV_VAR, self.stats_format)
+        self.stats_downsample = int(os.environ.get(self.STATS_DOWNSAMPLE_ENV_VAR, self.stats_downsample))
+        self.baseline_path = os.environ.get(self.BASELINE_PATH_ENV_VAR, self.baseline_path)
+        self.baseline_mode = os.environ.get(self.BASELINE_MODE_ENV_VAR, self.baseline_mode)
+        self.baseline_thresholds = os.environ.get(self.BASELINE_THRESHOLDS_ENV_VAR, self.baseline_thresholds)
+        if os.environ.get(self.METRICS_PORT_ENV_VAR):
+            self.metrics_port = int(os.environ.get(self.METRICS_PORT_ENV_VAR))
+        self.order_tests = get_env_flag(self.ORDER_TESTS_ENV_VAR, self.order_tests)
+        self.lazy_services = get_env_flag(self.LAZY_SERVICES_ENV_VAR, self.lazy_services)
+        self.background_teardown = get_env_flag(self.BACKGROUND_TEARDOWN_ENV_VAR, self.background_teardown)
+        if os.environ.get(self.STOP_TIMEOUT_ENV_VAR):
+            self.stop_timeout = int(os.environ.get(self.STOP_TIMEOUT_ENV_VAR))
+        self.reap_stale_projects = get_env_flag(self.REAP_STALE_PROJECTS_ENV_VAR, self.reap_stale_projects)
+        self.state_dir = os.environ.get(self.STATE_DIR_ENV_VAR, self.state_dir)
         self.reuse_containers = os.environ.get(self.REUSE_CONTAINERS_ENV_VAR, self.reuse_containers)
         self.docker_compose_path = os.environ.get(self.DOCKER_COMPOSE_PATH_ENV_VAR, self.docker_compose_path)
 
@@ -104,6 +235,48 @@ class Config(object):
         if self.COLLECT_STATS_OPTION in read_options:
             self.collect_stats = config_reader.getboolean(self.SECTION_NAME, self.COLLECT_STATS_OPTION)
 
+        if self.STATS_BACKEND_OPTION in read_options:
+            self.stats_backend = config_reader.get(self.SECTION_NAME, self.STATS_BACKEND_OPTION)
+
+        if self.STATS_RATE_OPTION in read_options:
+            self.stats_rate = config_reader.getfloat(self.SECTION_NAME, self.STATS_RATE_OPTION)
+
+        if self.STATS_FORMAT_OPTION in read_options:
+            self.stats_format = config_reader.get(self.SECTION_NAME, self.STATS_FORMAT_OPTION)
+
+        if self.STATS_DOWNSAMPLE_OPTION in read_options:
+            self.stats_downsample = config_reader.getint(self.SECTION_NAME, self.STATS_DOWNSAMPLE_OPTION)
+
+        if self.BASELINE_PATH_OPTION in read_options:
+            self.baseline_path = config_reader.get(self.SECTION_NAME, self.BASELINE_PATH_OPTION)
+
+        if self.BASELINE_MODE_OPTION in read_options:
+            self.baseline_mode = config_reader.get(self.SECTION_NAME, self.BASELINE_MODE_OPTION)
+
+        if self.BASELINE_THRESHOLDS_OPTION in read_options:
+            self.baseline_thresholds = config_reader.get(self.SECTION_NAME, self.BASELINE_THRESHOLDS_OPTION)
+
+        if self.METRICS_PORT_OPTION in read_options:
+            self.metrics_port = config_reader.getint(self.SECTION_NAME, self.METRICS_PORT_OPTION)
+
+        if self.ORDER_TESTS_OPTION in read_options:
+            self.order_tests = config_reader.getboolean(self.SECTION_NAME, self.ORDER_TESTS_OPTION)
+
+        if self.LAZY_SERVICES_OPTION in read_options:
+            self.lazy_services = config_reader.getboolean(self.SECTION_NAME, self.LAZY_SERVICES_OPTION)
+
+        if self.BACKGROUND_TEARDOWN_OPTION in read_options:
+            self.background_teardown = config_reader.getboolean(self.SECTION_NAME, self.BACKGROUND_TEARDOWN_OPTION)
+
+        if self.STOP_TIMEOUT_OPTION in read_options:
+            self.stop_timeout = config_reader.getint(self.SECTION_NAME, self.STOP_TIMEOUT_OPTION)
+
+        if self.REAP_STALE_PROJECTS_OPTION in read_options:
+            self.reap_stale_projects = config_reader.getboolean(self.SECTION_NAME, self.REAP_STALE_PROJECTS_OPTION)
+
+        if self.STATE_DIR_OPTION in read_options:
+            self.state_dir = config_reader.get(self.SECTION_NAME, self.STATE_DIR_OPTION)
+
         if self.PROJECT_NAME_OPTION in read_options:
             self.project_name = config_reader.get(self.SECTION_NAME, self.PROJECT_NAME_OPTION)
 
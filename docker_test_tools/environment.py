@@ -1,20 +1,54 @@
 import os
+import re
+import six
+import time
+import yaml
 import docker
 import logging
+import threading
 import subprocess
 
 import waiting
 from functools import partial
 from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from six.moves.urllib.parse import urlsplit
 
 from docker_test_tools import logs
+from docker_test_tools import state
 from docker_test_tools import stats
 from docker_test_tools import utils
 from docker_test_tools import config
+from docker_test_tools import cgroups
+from docker_test_tools import metrics
+from docker_test_tools import reaper
+from docker_test_tools import baseline
+from docker_test_tools import transfer
+from docker_test_tools import execution
+from docker_test_tools import snapshots
 from docker_test_tools.api_version import get_server_api_version
 
 log = logging.getLogger(__name__)
 
+# Published ports host addresses, which mean the port is published on all the docker host interfaces
+ANY_HOST_ADDRESSES = ('', '0.0.0.0', '::')
+
+
+def parse_container_port(container_port):
+    """Return the (port, protocol) tuple of the given container port, e.g. 8080, '8080' or '53/udp'."""
+    port, _, protocol = str(container_port).partition('/')
+    return int(port), protocol or 'tcp'
+
+
+def get_network_address(container, project_name):
+    """Return the container IP address, preferring the compose project networks (None if not connected)."""
+    # Compose names the project networks '<project>_<network>', older versions strip the non alphanumeric characters
+    prefixes = (project_name.lower() + '_', re.sub(r'[^a-z0-9]', '', project_name.lower()) + '_')
+    networks = (container.get('NetworkSettings') or {}).get('Networks') or {}
+    addresses = sorted((not name.startswith(prefixes), name, network['IPAddress'])
+                       for name, network in networks.items() if network.get('IPAddress'))
+    return addresses[0][2] if addresses else None
+
 
 class EnvironmentController(object):
     """Utility for managing environment operations."""
@@ -24,16 +58,89 @@ class EnvironmentController(object):
                  compose_path,
                  log_path,
                  collect_stats=False,
-                 reuse_containers=False):
+                 reuse_containers=False,
+                 stats_backend=config.Config.DEFAULT_STATS_BACKEND,
+                 stats_rate=config.Config.DEFAULT_STATS_RATE,
+                 stats_format=config.Config.DEFAULT_STATS_FORMAT,
+                 stats_downsample=config.Config.DEFAULT_STATS_DOWNSAMPLE,
+                 baseline_path=config.Config.DEFAULT_BASELINE_PATH,
+                 baseline_mode=config.Config.DEFAULT_BASELINE_MODE,
+                 baseline_thresholds=config.Config.DEFAULT_BASELINE_THRESHOLDS,
+                 metrics_port=config.Config.DEFAULT_METRICS_PORT,
+                 lazy_services=config.Config.DEFAULT_LAZY_SERVICES,
+                 background_teardown=config.Config.DEFAULT_BACKGROUND_TEARDOWN,
+                 stop_timeout=config.Config.DEFAULT_STOP_TIMEOUT,
+                 reap_stale_projects=config.Config.DEFAULT_REAP_STALE_PROJECTS,
+                 state_dir=config.Config.DEFAULT_STATE_DIR):
 
         self.log_path = log_path
         self.compose_path = compose_path
         self.project_name = project_name
         self.reuse_containers = reuse_containers
 
+        # When a stop timeout is set, the environment is taken down through the docker API (see `down`)
+        self.stop_timeout = stop_timeout
+        self.reap_stale_projects = reap_stale_projects
+        self.shutdown_results = None
+
+        # In lazy services mode, the set of services started so far (None when all the services are started)
+        self.lazy_services = lazy_services
+        self.started_services = None
+        self.services_dependencies = None
+        self.services_lock = threading.Lock()
+
+        # In background teardown mode, the teardown thread (see `teardown`)
+        self.background_teardown = background_teardown
+        self.teardown_thread = None
+
+        self.baseline_path = baseline_path
+        self.baseline_mode = baseline_mode
+        self.baseline_thresholds = baseline.parse_thresholds(baseline_thresholds)
+        self.regression_report = None
+
+        self.metrics = metrics.MetricsRegistry()
+        self.metrics.describe('dtt_health_check_duration_seconds', metrics.MetricsRegistry.SUMMARY,
+                              'Containers readiness checks duration.')
+        self.metrics.describe('dtt_snapshot_restore_duration_seconds', metrics.MetricsRegistry.SUMMARY,
+                              'Services snapshot restore duration, per phase (reset/ ready).')
+        self.metrics.describe('dtt_container_shutdown_duration_seconds', metrics.MetricsRegistry.SUMMARY,
+                              'Containers stop & removal duration, on fast teardown.')
+
         self.docker_client = docker.client.APIClient()
-        self.environment_variables = self._get_environment_variables()
-        self.services = self.get_services()
+        if metrics_port is not None:
+            self.docker_client = metrics.InstrumentedDockerClient(self.docker_client, registry=self.metrics)
+
+        # The environment state shared with other processes, used instead of querying docker & docker-compose
+        self.state_cache = None
+        cached_state = {}
+        if state_dir is not None:
+            self.state_cache = state.StateCache(state_dir, project_name, compose_path,
+                                                docker_host=os.environ.get('DOCKER_HOST', ''))
+            cached_state = self.state_cache.load()
+
+        self.environment_variables = self._get_environment_variables(api_version=cached_state.get('api_version'))
+        self.services = cached_state.get('services') or self.get_services()
+        if self.state_cache is not None and 'services' not in cached_state:
+            self.state_cache.update(api_version=self.environment_variables['DOCKER_API_VERSION'],
+                                    services=self.services)
+
+        # With a state cache, the services container ids - the ones loaded from the state are verified on first use
+        self.container_ids = dict(cached_state.get('containers') or {})
+        self.verified_container_ids = set()
+
+        # Set by tests which leave the environment in a state unfit for the following tests (see `mark_dirty`)
+        self.dirty = False
+
+        # Cache of {service: (published ports, network address)}, loaded on demand and invalidated on (re)starts
+        self.service_addresses = None
+        if cached_state.get('addresses'):
+            self.service_addresses = state.load_addresses(cached_state['addresses'])
+        self.service_addresses_lock = threading.Lock()
+
+        # The project containers start events stream, dropping the cached addresses of containers (re)started outside
+        # the controller (e.g. by a restart policy), started on the first address lookup (see `watch_container_events`)
+        self.events_stream = None
+        self.events_thread = None
 
         self.encoding = self.environment_variables.get('PYTHONIOENCODING', 'utf-8')
         self.work_dir = os.path.dirname(self.log_path)
@@ -46,18 +153,19 @@ class EnvironmentController(object):
             environment_variables=self.environment_variables,
         )
 
+        self.snapshot_manager = snapshots.SnapshotManager(controller=self)
+
         self.plugins = []
         self.plugins.append(self.logs_collector)
 
         if collect_stats:
-            self.plugins.append(
-                stats.StatsCollector(
-                    encoding=self.encoding,
-                    project=self.project_name,
-                    target_dir_path=self.work_dir,
-                    environment_variables=self.environment_variables
-                )
-            )
+            self.plugins.append(self._get_stats_collector(backend=stats_backend,
+                                                          rate=stats_rate,
+                                                          output_format=stats_format,
+                                                          downsample=stats_downsample))
+
+        if metrics_port is not None:
+            self.plugins.append(metrics.MetricsExporter(controller=self, port=metrics_port))
 
     @classmethod
     def from_file(cls, config_path):
@@ -65,13 +173,66 @@ class EnvironmentController(object):
 
         :return EnvironmentController: controller based on the given config
         """
-        config_object = config.Config(config_path=config_path)
+        return cls.from_config(config.Config(config_path=config_path))
+
+    @classmethod
+    def from_config(cls, config_object):
+        """Return an environment controller based on the given config object.
+
+        :param Config config_object: the environment configuration.
+        :return EnvironmentController: controller based on the given config
+        """
         return cls(log_path=config_object.log_path,
                    project_name=config_object.project_name,
                    collect_stats=config_object.collect_stats,
+                   stats_backend=config_object.stats_backend,
+                   stats_rate=config_object.stats_rate,
+                   stats_format=config_object.stats_format,
+                   stats_downsample=config_object.stats_downsample,
+                   baseline_path=config_object.baseline_path,
+                   baseline_mode=config_object.baseline_mode,
+                   baseline_thresholds=config_object.baseline_thresholds,
+                   metrics_port=config_object.metrics_port,
+                   lazy_services=config_object.lazy_services,
+                   background_teardown=config_object.background_teardown,
+                   stop_timeout=config_object.stop_timeout,
+                   reap_stale_projects=config_object.reap_stale_projects,
+                   state_dir=config_object.state_dir,
                    compose_path=config_object.docker_compose_path,
                    reuse_containers=config_object.reuse_containers)
 
+    def _get_stats_collector(self, backend, rate, output_format, downsample):
+        """Return a stats collector plugin based on the given backend.
+
+        :param str backend: 'api' for `docker stats` based collection, 'cgroup' for cgroup files based collection.
+        :param float rate: sampling rate (in Hz), used by the cgroup backend.
+        :param str output_format: samples files format - 'json' or 'binary'.
+        :param int downsample: downsample the samples files to about this number of points per metric (0 to disable).
+        """
+        if backend == 'cgroup':
+            return cgroups.CgroupStatsCollector(
+                rate=rate,
+                downsample=downsample,
+                output_format=output_format,
+                encoding=self.encoding,
+                project=self.project_name,
+                target_dir_path=self.work_dir,
+                docker_client=self.docker_client,
+                environment_variables=self.environment_variables
+            )
+
+        if backend != 'api':
+            raise ValueError("Invalid stats backend: %r, must be one of ['api', 'cgroup']" % backend)
+
+        return stats.StatsCollector(
+            downsample=downsample,
+            output_format=output_format,
+            encoding=self.encoding,
+            project=self.project_name,
+            target_dir_path=self.work_dir,
+            environment_variables=self.environment_variables
+        )
+
     def get_services(self):
         """Get the services info based on the compose file.
 
@@ -89,41 +250,211 @@ class EnvironmentController(object):
 
         return utils.to_str(services_output).strip().split('\n')
 
-    def setup(self):
+    def get_compose_config(self):
+        """Get the resolved compose configuration.
+
+        :return dict: the compose configuration.
+        """
+        log.debug("Getting environment compose configuration, using docker compose: %s", self.compose_path)
+        try:
+            config_output = subprocess.check_output(
+                ['docker-compose', '-f', self.compose_path, '-p', self.project_name, 'config'],
+                stderr=subprocess.STDOUT, env=self.environment_variables
+            )
+
+        except subprocess.CalledProcessError as error:
+            raise RuntimeError("Failed getting environment compose configuration, reason: %s" % error.output)
+
+        return yaml.safe_load(utils.to_str(config_output))
+
+    def get_services_dependencies(self):
+        """Get the services dependencies based on the compose file `depends_on` definitions.
+
+        :return dict: of format {service: [names of the services it depends on]}.
+        """
+        services = self.get_compose_config().get('services') or {}
+        return dict((name, sorted(service.get('depends_on') or [])) for name, service in services.items())
+
+    def expand_services(self, services):
+        """Return the given services along with the services they depend on (directly or indirectly), sorted."""
+        if self.services_dependencies is None:
+            self.services_dependencies = self.get_services_dependencies()
+
+        expanded_services = set()
+        pending_services = list(services)
+        while pending_services:
+            name = pending_services.pop()
+            if name not in expanded_services:
+                expanded_services.add(name)
+                pending_services.extend(self.services_dependencies.get(name, []))
+
+        return sorted(expanded_services)
+
+    def start_services(self, services):
+        """Start the given services (and the services they depend on) which were not started yet, in lazy mode.
+
+        :param list services: service names as they appear in the docker compose file.
+        """
+        if self.started_services is None:
+            return
+
+        with self.services_lock:
+            missing_services = [name for name in self.expand_services(services) if name not in self.started_services]
+            if not missing_services:
+                return
+
+            log.info("Starting services on first use: %s", missing_services)
+            self.up(services=missing_services)
+            self.started_services.update(missing_services)
+
+        if self.logs_collector.logs_file is not None:
+            self.logs_collector.follow(missing_services)
+
+        stats_collector = self.get_stats_collector()
+        if stats_collector is not None:
+            stats_collector.follow(missing_services)
+
+    def setup(self, services=None):
         """Sets up the environment using docker commands.
 
         Should be called once before *all* the tests start.
+
+        :param list services: the services required by the selected tests, in lazy services mode only these (and
+            the services they depend on) are started, the rest are started on first use. All the services by default.
         """
+        # A previous teardown of the same project must finish before the project containers are created again
+        self.wait_for_teardown()
         try:
             log.debug("Setting up the environment")
+            if self.reap_stale_projects and not self.reuse_containers:
+                self.reap_projects()
             self.cleanup()
-            self.up()
-
-            for plugin in self.plugins:
-                try:
-                    plugin.start()
-                except:
-                    logging.warning("Failed starting Plugin %s, skipping", plugin)
+            if self.lazy_services and services is not None:
+                self.started_services = set()
+                self.start_services(services)
+            else:
+                self.started_services = None
+                self.up()
+            self.start_plugins()
 
         except:
             log.exception("Setup failure, tearing down the test environment")
             self.teardown()
             raise
 
-    def teardown(self):
+    def teardown(self, background=None):
         """Tears down the environment using docker commands.
 
         Should be called once after *all* the tests finish.
+
+        :param bool background: run the teardown (the logs & stats post-processing, the baseline check and the
+            containers removal) in a background thread, returning immediately - use `wait_for_teardown` to wait for it.
+            The thread is not a daemon thread, so the process exits only once the teardown finishes. By default, the
+            controller `background_teardown` setting is used.
+        :return threading.Thread: the teardown thread in background mode, None otherwise.
         """
+        if background is None:
+            background = self.background_teardown
+
+        if not background:
+            self._teardown()
+            return None
+
+        log.debug("Tearing down the environment in the background")
+        self.teardown_thread = threading.Thread(target=self._background_teardown,
+                                                name='teardown-%s' % self.project_name)
+        self.teardown_thread.start()
+        return self.teardown_thread
+
+    def _background_teardown(self):
+        start_time = time.time()
+        try:
+            self._teardown()
+        except:
+            log.exception("Background teardown of environment %s failed", self.project_name)
+        else:
+            log.debug("Background teardown of environment %s took %.2f seconds", self.project_name,
+                      time.time() - start_time)
+
+    def wait_for_teardown(self, timeout=None):
+        """Wait for a background teardown to finish.
+
+        :param float timeout: max time (in seconds) to wait, None to wait forever.
+        :return bool: True if no teardown is running.
+        """
+        if self.teardown_thread is None:
+            return True
+
+        self.teardown_thread.join(timeout)
+        return not self.teardown_thread.is_alive()
+
+    def _teardown(self):
         log.debug("Tearing down the environment")
         try:
-            for plugin in self.plugins:
-                try:
-                    plugin.stop()
-                except:
-                    logging.warning("Failed stopping Plugin %s, skipping", plugin)
+            self.stop_plugins()
         finally:
+            self.stop_watching_container_events()
             self.cleanup()
+            try:
+                self.snapshot_manager.remove_snapshots()
+            except:
+                log.exception("Failed removing the services snapshots, skipping")
+
+    def start_plugins(self):
+        """Start the environment plugins (logs collection, stats collection, etc.), skipping failing plugins."""
+        for plugin in self.plugins:
+            try:
+                plugin.start()
+            except:
+                logging.warning("Failed starting Plugin %s, skipping", plugin)
+
+    def stop_plugins(self):
+        """Stop the environment plugins and check the collected stats against the stats baseline."""
+        for plugin in self.plugins:
+            try:
+                plugin.stop()
+            except:
+                logging.warning("Failed stopping Plugin %s, skipping", plugin)
+
+        try:
+            self.check_baseline()
+        except:
+            log.exception("Failed checking the stats baseline, skipping")
+
+    def check_baseline(self):
+        """Compare the collected stats summary against the stats baseline, if one is configured.
+
+        In 'update' mode (or when no baseline exists yet) the collected stats summary is stored as the new baseline.
+        In 'compare' mode, the comparison report is kept in `regression_report` and written to the stats directory.
+
+        :return RegressionReport: the comparison report, or None if no comparison was made.
+        """
+        stats_collector = self.get_stats_collector()
+        if not self.baseline_path or stats_collector is None or stats_collector.summary is None:
+            return None
+
+        report = baseline.check(summary=stats_collector.summary,
+                                path=self.baseline_path,
+                                mode=self.baseline_mode,
+                                thresholds=self.baseline_thresholds,
+                                report_dir=stats_collector.work_dir)
+        if report is not None:
+            self.regression_report = report
+
+        return report
+
+    def mark_dirty(self):
+        """Mark the environment as unfit for the following tests (e.g. a pooled environment is recycled on release)."""
+        log.debug("Environment %s was marked dirty", self.project_name)
+        self.dirty = True
+
+    def get_stats_collector(self):
+        """Return the stats collector plugin, or None if stats collection is disabled."""
+        for plugin in self.plugins:
+            if isinstance(plugin, stats.StatsCollector):
+                return plugin
+
+        return None
 
     def cleanup(self):
         """Cleanup the environment.
@@ -136,19 +467,39 @@ class EnvironmentController(object):
 
         self.down()
 
-    def up(self):
-        """Run environment containers."""
+    def up(self, services=None):
+        """Run environment containers.
+
+        :param list services: the services to run, all the services by default.
+        """
         log.debug("Setting environment up, using docker compose: %s", self.compose_path)
         try:
             subprocess.check_output(
-                ['docker-compose', '-f', self.compose_path, '-p', self.project_name, 'up', '--build', '-d'],
+                ['docker-compose', '-f', self.compose_path, '-p', self.project_name, 'up', '--build', '-d'] +
+                list(services or []),
                 stderr=subprocess.STDOUT, env=self.environment_variables
             )
         except subprocess.CalledProcessError as error:
             raise RuntimeError("Failed setting up environment, reason: %s" % error.output)
+        finally:
+            self.invalidate_service_addresses()
+            self.invalidate_container_ids()
 
     def down(self):
-        """Run environment containers."""
+        """Remove the environment containers.
+
+        When a stop timeout is set, the containers are stopped (or killed, for a zero timeout) and removed
+        concurrently through the docker API, along with their anonymous volumes and the project networks - and their
+        shutdown durations are kept in `shutdown_results` (slowest first). Otherwise `docker-compose down` is used.
+        """
+        self.invalidate_service_addresses()
+        self.invalidate_container_ids()
+        if self.stop_timeout is not None:
+            log.debug("Taking environment down, using a %s seconds stop timeout", self.stop_timeout)
+            self.record_shutdown(reaper.remove_project(self.docker_client, self.project_name,
+                                                       stop_timeout=self.stop_timeout))
+            return
+
         log.debug("Taking environment down, using docker compose: %s", self.compose_path)
         try:
             subprocess.check_output(
@@ -158,6 +509,26 @@ class EnvironmentController(object):
         except subprocess.CalledProcessError as error:
             raise RuntimeError("Failed taking environment down, reason: %s" % error.output)
 
+    def record_shutdown(self, results):
+        """Record the given containers shutdown results, logging the slow to stop containers."""
+        self.shutdown_results = results
+        for result in results:
+            self.metrics.observe('dtt_container_shutdown_duration_seconds',
+                                 {'container': result.name, 'service': result.service}, result.duration)
+
+        if results:
+            log.debug("Containers shutdown durations: %s",
+                      ', '.join('%s (%.2fs)' % (result.name, result.duration) for result in results))
+
+    def reap_projects(self):
+        """Remove stale projects left behind by crashed runs - the environment project and the projects derived from it
+        (e.g. `<project>-gw0` or `<project>-replica0-1`), assuming a single run per project name on the docker host.
+        """
+        log.debug("Reaping stale projects of %s", self.project_name)
+        results = reaper.remove_project(self.docker_client, self.project_name, stop_timeout=0, derived=True)
+        if results:
+            log.info("Reaped %d stale containers of %s", len(results), self.project_name)
+
     def kill_container(self, name):
         """Kill the container.
 
@@ -166,6 +537,7 @@ class EnvironmentController(object):
         log.debug("Killing %s container", name)
         container_id = self.get_container_id(name=name)
         self.docker_client.kill(container_id)
+        self.invalidate_service_addresses(name)
 
     def restart_container(self, name):
         """Restart the container.
@@ -175,6 +547,7 @@ class EnvironmentController(object):
         log.debug("Restarting %s container", name)
         container_id = self.get_container_id(name=name)
         self.docker_client.restart(container_id)
+        self.invalidate_service_addresses(name)
 
     def pause_container(self, name):
         """Pause the container.
@@ -202,6 +575,7 @@ class EnvironmentController(object):
         log.debug("Stopping %s container", name)
         container_id = self.get_container_id(name=name)
         self.docker_client.stop(container_id)
+        self.invalidate_service_addresses(name)
 
     def start_container(self, name):
         """Start the container.
@@ -211,6 +585,7 @@ class EnvironmentController(object):
         log.debug("Starting %s container", name)
         container_id = self.get_container_id(name=name)
         self.docker_client.start(container_id)
+        self.invalidate_service_addresses(name)
 
     def inspect_container(self, name):
         """Returns the inspect content of a container
@@ -221,6 +596,166 @@ class EnvironmentController(object):
         container_id = self.get_container_id(name)
         return self.docker_client.inspect_container(container_id)
 
+    def get_service_address(self, name, container_port):
+        """Return the address the given service container port is reachable at.
+
+        The port published on the docker host is preferred, the container IP on the project network is used for
+        unpublished ports. The addresses of all the environment containers are resolved using a single containers
+        listing call, and cached until a container is (re)started - by the controller, or by anything else, as observed
+        on the docker events of the project containers.
+
+        :param str name: service name as it appears in the docker compose file.
+        :param container_port: the service container port, e.g. 8080 or '8080/tcp'.
+        :return tuple: (host, port).
+        """
+        self.validate_service_name(name)
+        self.start_services([name])
+        port_key = parse_container_port(container_port)
+        self.watch_container_events()
+
+        with self.service_addresses_lock:
+            if self.service_addresses is None or name not in self.service_addresses:
+                self.service_addresses = self._load_service_addresses()
+                if self.state_cache is not None:
+                    self.state_cache.update(addresses=state.dump_addresses(self.service_addresses))
+
+            if name not in self.service_addresses:
+                raise RuntimeError("No running container was found for name %s and project %s" % (
+                    name, self.project_name))
+
+            published_ports, network_address = self.service_addresses[name]
+
+        if port_key in published_ports:
+            return published_ports[port_key]
+
+        if network_address is None:
+            raise RuntimeError("Port %s of %s container is not published and the container has no network address" % (
+                container_port, name))
+
+        return network_address, port_key[0]
+
+    def service_url(self, name, container_port, scheme='http', path=''):
+        """Return a reference to the url of the given service container port, resolved on use.
+
+        Can be passed as the url of `utils.get_health_check` and `WiremockController`.
+
+        :param str name: service name as it appears in the docker compose file.
+        :param container_port: the service container port, e.g. 8080 or '8080/tcp'.
+        :param str scheme: url scheme.
+        :param str path: url path.
+        :return utils.ServiceReference: the service url reference.
+        """
+        self.validate_service_name(name)
+        return utils.ServiceReference(controller=self, name=name, container_port=container_port, scheme=scheme,
+                                      path=path)
+
+    def invalidate_service_addresses(self, name=None):
+        """Drop the cached service addresses - of the given service, or of all the services if not given."""
+        with self.service_addresses_lock:
+            if name is None:
+                self.service_addresses = None
+            elif self.service_addresses is not None:
+                self.service_addresses.pop(name, None)
+
+            if self.state_cache is not None:
+                self.state_cache.remove_entries('addresses', name)
+
+    def watch_container_events(self):
+        """Start dropping the cached addresses of the project containers on their docker start events.
+
+        Containers (re)started outside the controller - by a restart policy, the docker daemon or a test - may be
+        published on different host ports. Watching is started once, failures to watch are logged and not retried.
+        """
+        with self.service_addresses_lock:
+            if self.events_thread is not None:
+                return
+
+            self.events_thread = threading.Thread(target=self._handle_container_events)
+            self.events_thread.daemon = True
+            try:
+                self.events_stream = self.docker_client.events(
+                    filters={'type': 'container', 'event': ['start', 'restart'],
+                             'label': 'com.docker.compose.project={project}'.format(project=self.project_name)},
+                    decode=True
+                )
+            except Exception as error:
+                log.warning("Failed watching the %s project containers events, addresses of containers restarted "
+                            "outside the controller won't be refreshed, reason: %s", self.project_name, error)
+                return
+
+        self.events_thread.start()
+
+    def stop_watching_container_events(self):
+        """Stop watching the project containers events (see `watch_container_events`)."""
+        events_stream, self.events_stream = self.events_stream, None
+        if events_stream is None:
+            return
+
+        try:
+            events_stream.close()
+        except Exception as error:
+            log.debug("Failed closing the %s project events stream, reason: %s", self.project_name, error)
+
+    def _handle_container_events(self):
+        """Drop the cached addresses of the services whose containers were (re)started."""
+        events_stream = self.events_stream
+        try:
+            for event in events_stream:
+                service = event.get('Actor', {}).get('Attributes', {}).get('com.docker.compose.service')
+                if service is not None:
+                    log.debug("Service %s container was %sed, dropping its cached address", service,
+                              event.get('Action', event.get('status')))
+                    self.invalidate_service_addresses(service)
+
+        except Exception as error:
+            if self.events_stream is not None:
+                log.warning("Stopped watching the %s project containers events, reason: %s", self.project_name, error)
+
+    def invalidate_container_ids(self, name=None):
+        """Drop the cached container ids - of the given service, or of all the services if not given."""
+        if self.state_cache is None:
+            return
+
+        for service in ([name] if name is not None else list(self.container_ids)):
+            self.container_ids.pop(service, None)
+            self.verified_container_ids.discard(service)
+        self.state_cache.remove_entries('containers', name)
+
+    def _load_service_addresses(self):
+        """Return the {service: (published ports, network address)} of the project running containers.
+
+        Published ports are kept as a dictionary of format {(port, protocol): (host, host_port)}.
+        """
+        log.debug("Loading the %s project services addresses", self.project_name)
+        docker_host = self._get_docker_host()
+        filters = {"label": "com.docker.compose.project={project}".format(project=self.project_name)}
+
+        service_addresses = {}
+        for container in self.docker_client.containers(filters=filters):
+            service = container['Labels'].get('com.docker.compose.service')
+            if service is None or service in service_addresses:
+                continue
+
+            published_ports = {}
+            for port in container.get('Ports') or []:
+                if not port.get('PublicPort'):
+                    continue
+
+                host = docker_host if port.get('IP') in ANY_HOST_ADDRESSES else port['IP']
+                published_ports.setdefault((port['PrivatePort'], port.get('Type', 'tcp')), (host, port['PublicPort']))
+
+            service_addresses[service] = (published_ports, get_network_address(container, self.project_name))
+
+        return service_addresses
+
+    def _get_docker_host(self):
+        """Return the docker host name - the DOCKER_HOST host for remote daemons, localhost otherwise."""
+        docker_host = self.environment_variables.get('DOCKER_HOST', '')
+        if docker_host.startswith('tcp://'):
+            return urlsplit(docker_host).hostname
+
+        return 'localhost'
+
     def is_container_ready(self, name):
         """Return True if the container is in ready state.
 
@@ -229,10 +764,13 @@ class EnvironmentController(object):
 
         :param str name: container name as it appears in the docker compose file.
         """
+        start_time = time.time()
         try:
             status_output = self.inspect_container(name)['State']
         except RuntimeError:
             return False
+        finally:
+            self.metrics.observe('dtt_health_check_duration_seconds', {'service': name}, time.time() - start_time)
 
         if 'Health' in status_output:
             is_ready = status_output['Health']['Status'] == "healthy"
@@ -254,8 +792,12 @@ class EnvironmentController(object):
 
         If the service compose configuration contains an health check, the method will wait for a 'healthy' state.
         If it doesn't the method will wait for a 'running' state.
+
+        :param list services: the services to wait for, all the environment services by default - in lazy services
+            mode, the services which were not started yet are started first.
         """
         services = services if services else self.services
+        self.start_services(services)
         log.info('Waiting for %s to reach the required state', services)
         checks_callbacks = [partial(self.is_container_ready, name) for name in services]
         return utils.run_health_checks(checks=checks_callbacks, interval=interval, timeout=timeout)
@@ -285,6 +827,7 @@ class EnvironmentController(object):
             yield
         finally:
             self.docker_client.restart(container_id)
+            self.invalidate_service_addresses(name)
             self.wait_for_health(name=name, health_check=health_check, interval=interval, timeout=timeout)
 
     @contextmanager
@@ -339,8 +882,130 @@ class EnvironmentController(object):
             yield
         finally:
             self.docker_client.start(container_id)
+            self.invalidate_service_addresses(name)
             self.wait_for_health(name=name, health_check=health_check, interval=interval, timeout=timeout)
 
+    def snapshot_service(self, name, snapshot_name='default', mode='volumes', health_check=None, interval=1,
+                         timeout=60):
+        """Take a snapshot of the service state once it's healthy, for restoring it later using `restore_service`.
+
+        :param str name: container name as it appears in the docker compose file.
+        :param str snapshot_name: the snapshot name, an existing snapshot of the same name is replaced.
+        :param str mode: 'volumes' to copy the service named volumes, 'commit' to commit its container filesystem.
+        :param callable health_check: a callable used to determine if the service is healthy.
+        :param int interval: interval (in seconds) between checks.
+        :param int timeout: timeout (in seconds) for the service to become healthy.
+        :return Snapshot: the taken snapshot.
+        """
+        return self.snapshot_manager.snapshot(name=name, snapshot_name=snapshot_name, mode=mode,
+                                              health_check=health_check, interval=interval, timeout=timeout)
+
+    def restore_service(self, name, snapshot_name='default', health_check=None, interval=1, timeout=60):
+        """Restore a service snapshot, recreating only its container, and wait for the service to become healthy.
+
+        :param str name: container name as it appears in the docker compose file.
+        :param str snapshot_name: the snapshot name.
+        :param callable health_check: a callable used to determine if the service has recovered.
+        :param int interval: interval (in seconds) between checks.
+        :param int timeout: timeout (in seconds) for the service to become healthy.
+        :return RestoreResult: the time to reset and the time to healthy afterwards.
+
+        Usage:
+
+        >>> controller.snapshot_service(name='postgres.service')
+        >>> # ... mutate the service state
+        >>> result = controller.restore_service(name='postgres.service')
+        >>> log.info('Reset in %.2fs, healthy after %.2fs', result.reset_duration, result.ready_duration)
+        """
+        result = self.snapshot_manager.restore(name=name, snapshot_name=snapshot_name, health_check=health_check,
+                                               interval=interval, timeout=timeout)
+        self.metrics.observe('dtt_snapshot_restore_duration_seconds', {'service': name, 'phase': 'reset'},
+                             result.reset_duration)
+        self.metrics.observe('dtt_snapshot_restore_duration_seconds', {'service': name, 'phase': 'ready'},
+                             result.ready_duration)
+        return result
+
+    def put_files(self, name, src_paths, dest, compression=None):
+        """Copy local files & directories into a service container, streaming a tar archive.
+
+        :param name: container name as it appears in the docker compose file, or a list of names - for copying the
+            files into several containers in parallel.
+        :param list src_paths: local files & directories, copied into the destination by their base name.
+        :param str dest: the container directory to copy into, must exist.
+        :param str compression: the streamed archive compression ('gz', 'bz2' or 'xz' - python 3 only), trades CPU
+            for less transferred data - worthwhile for compressible data over a remote docker host.
+        :return int: number of transferred (possibly compressed) bytes, summed over the containers.
+
+        Usage:
+
+        >>> controller.put_files('postgres.service', ['fixtures/dump.sql', 'fixtures/blobs'], '/docker-entrypoint.d')
+        >>> controller.put_files(['shard1.service', 'shard2.service'], ['fixtures/data'], '/data', compression='gz')
+        """
+        if isinstance(src_paths, six.string_types):
+            src_paths = [src_paths]
+
+        log.debug("Copying %s into %s:%s", src_paths, name, dest)
+        if isinstance(name, six.string_types):
+            return transfer.put_files(self.docker_client, self.get_container_id(name), src_paths, dest,
+                                      compression=compression)
+
+        container_ids = [self.get_container_id(service) for service in name]
+        pool = ThreadPool(processes=len(container_ids))
+        try:
+            return sum(pool.map(lambda container_id: transfer.put_files(
+                self.docker_client, container_id, src_paths, dest, compression=compression), container_ids))
+        finally:
+            pool.close()
+            pool.join()
+
+    def get_files(self, name, src_paths, dest):
+        """Copy files & directories out of a service container, streaming a tar archive.
+
+        :param str name: container name as it appears in the docker compose file.
+        :param list src_paths: container files & directories, copied into the destination by their base name.
+        :param str dest: local directory to copy into, created if missing.
+        :return int: number of transferred bytes.
+        """
+        if isinstance(src_paths, six.string_types):
+            src_paths = [src_paths]
+
+        log.debug("Copying %s:%s into %s", name, src_paths, dest)
+        return transfer.get_files(self.docker_client, self.get_container_id(name), src_paths, dest)
+
+    def exec_batch(self, name, commands, parallelism=1, session=False, timeout=None):
+        """Execute shell commands inside a service container.
+
+        :param str name: container name as it appears in the docker compose file.
+        :param list commands: shell command lines, or lists of arguments.
+        :param int parallelism: number of commands executed concurrently (number of shell sessions in session mode).
+        :param bool session: execute the commands through persistent shell sessions, saving the exec overhead per
+            command - the commands of a session share its shell state.
+        :param float timeout: max time (in seconds) to wait for each command in session mode, None to wait forever.
+        :return list: the commands results (ExecResult - exit code, output & duration), in the commands order.
+
+        Usage:
+
+        >>> results = controller.exec_batch('postgres.service', ['pg_isready', 'psql -c "SELECT 1"'], session=True)
+        >>> assert all(result.ok for result in results)
+        """
+        return execution.exec_batch(self.docker_client, self.get_container_id(name), commands,
+                                    parallelism=parallelism, session=session, timeout=timeout)
+
+    @contextmanager
+    def shell_session(self, name, shell=execution.SHELL):
+        """Keep a shell open inside a service container for the context duration, for running many commands.
+
+        :param str name: container name as it appears in the docker compose file.
+        :param str shell: the session shell.
+
+        Usage:
+
+        >>> with controller.shell_session('postgres.service') as session:
+        >>>     result = session.run('psql -c "SELECT count(*) FROM users"', timeout=10)
+        """
+        with execution.ShellSession(self.docker_client, self.get_container_id(name), shell=shell) as session:
+            yield session
+
     def wait_for_health(self, name, health_check=None, interval=1, timeout=60):
         """Container stopped context manager.
 
@@ -354,9 +1019,12 @@ class EnvironmentController(object):
         waiting.wait(health_check, sleep_seconds=interval, timeout_seconds=timeout)
 
     @staticmethod
-    def _get_environment_variables():
-        """Set the compose api version according to the server's api version"""
-        server_api_version = get_server_api_version()
+    def _get_environment_variables(api_version=None):
+        """Set the compose api version according to the server's api version
+
+        :param str api_version: the server api version if already known (e.g. from the state cache).
+        """
+        server_api_version = api_version or get_server_api_version()
         log.debug("docker server api version is %s, updating environment_variables", server_api_version)
         env = os.environ.copy()
         env['COMPOSE_API_VERSION'] = env['DOCKER_API_VERSION'] = server_api_version
@@ -372,6 +1040,11 @@ class EnvironmentController(object):
         :param str name: container name as it appears in the docker compose file.
         """
         self.validate_service_name(name)
+        self.start_services([name])
+
+        container_id = self._get_cached_container_id(name)
+        if container_id is not None:
+            return container_id
 
         # Filter the required container by container name docker-compose project.
         # Since the python docker client support filtering only by one label, the second filter is done manually
@@ -383,8 +1056,38 @@ class EnvironmentController(object):
         if len(containers) != 1:
             raise RuntimeError("Unexpected containers number (%d) were found for name %s and project %s" % (
                 len(containers), name, self.project_name))
+
+        if self.state_cache is not None:
+            self.container_ids[name] = containers[0]['Id']
+            self.verified_container_ids.add(name)
+            self.state_cache.set_entry('containers', name, containers[0]['Id'])
+
         return containers[0]['Id']
 
+    def _get_cached_container_id(self, name):
+        """Return the cached container id of the given service, None if it's not cached (or no longer valid).
+
+        A container id loaded from the state cache is verified once - the container must still exist and belong to
+        the project service.
+        """
+        container_id = self.container_ids.get(name)
+        if container_id is None or name in self.verified_container_ids:
+            return container_id
+
+        try:
+            labels = self.docker_client.inspect_container(container_id)['Config']['Labels'] or {}
+        except docker.errors.NotFound:
+            labels = {}
+
+        if (labels.get('com.docker.compose.service') != name or
+                labels.get('com.docker.compose.project') != reaper.normalize_project_name(self.project_name)):
+            log.debug("Cached container id of %s is no longer valid", name)
+            self.invalidate_container_ids(name)
+            return None
+
+        self.verified_container_ids.add(name)
+        return container_id
+
     def validate_service_name(self, name):
         if name not in self.services:
             raise ValueError('Invalid service name: %r, must be one of %s' % (name, self.services))
@@ -0,0 +1,244 @@
+"""Batched command execution inside containers.
+
+Commands are shell command lines, executed either by a `docker exec` per command (optionally several in parallel), or
+through persistent shell sessions - a single exec'd shell per session, fed the commands through its stdin, with the
+output of every command framed by a unique end marker carrying its exit code. Sessions save the exec create / start /
+inspect calls and the new connection per command, and keep the shell state (e.g. working directory) between commands.
+"""
+import re
+import time
+import uuid
+import select
+import struct
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+import six
+from six.moves import queue
+from six.moves import shlex_quote
+
+from docker_test_tools import utils
+
+log = logging.getLogger(__name__)
+
+SHELL = 'sh'
+
+# Docker multiplexed streams frame header: stream type (1 byte), 3 padding bytes and the frame size (4 bytes)
+FRAME_HEADER_FORMAT = '>BxxxL'
+FRAME_HEADER_SIZE = struct.calcsize(FRAME_HEADER_FORMAT)
+
+
+class ExecError(Exception):
+    pass
+
+
+class ExecResult(object):
+    """Result of a command executed inside a container.
+
+    :ivar str command: the executed command.
+    :ivar int exit_code: the command exit code.
+    :ivar str output: the command output (stdout & stderr).
+    :ivar float duration: the time (in seconds) the command took, including the execution overhead.
+    """
+
+    def __init__(self, command, exit_code, output, duration):
+        self.command = command
+        self.exit_code = exit_code
+        self.output = output
+        self.duration = duration
+
+    @property
+    def ok(self):
+        return self.exit_code == 0
+
+    def __repr__(self):
+        return '<ExecResult %r exit code: %s (%.3fs)>' % (self.command, self.exit_code, self.duration)
+
+
+def to_command_line(command):
+    """Return the given command (a command line or a list of arguments) as a shell command line."""
+    if isinstance(command, six.string_types):
+        return command
+
+    return ' '.join(shlex_quote(argument) for argument in command)
+
+
+def exec_command(docker_client, container_id, command):
+    """Execute the given command in a new exec instance of the given container.
+
+    :param docker.APIClient docker_client: the docker API client.
+    :param str container_id: the container to execute the command in.
+    :param command: a shell command line, or a list of arguments.
+    :return ExecResult: the command result.
+    """
+    start_time = time.time()
+    exec_id = docker_client.exec_create(container_id, [SHELL, '-c', to_command_line(command)])['Id']
+    output = docker_client.exec_start(exec_id)
+    exit_code = docker_client.exec_inspect(exec_id)['ExitCode']
+    return ExecResult(command=command, exit_code=exit_code, output=utils.to_str(output),
+                      duration=time.time() - start_time)
+
+
+class ShellSession(object):
+    """A persistent shell session inside a container, executing commands one at a time.
+
+    The session shell state is shared by its commands, a command reading its stdin reads /dev/null.
+
+    Usage:
+
+    >>> with ShellSession(docker_client, container_id) as session:
+    >>>     session.run('cd /var/lib/data')
+    >>>     result = session.run('ls | wc -l')
+    """
+
+    def __init__(self, docker_client, container_id, shell=SHELL):
+        """Initialize the shell session.
+
+        :param docker.APIClient docker_client: the docker API client.
+        :param str container_id: the container to open the session in.
+        :param str shell: the session shell.
+        """
+        self.docker_client = docker_client
+        self.container_id = container_id
+        self.shell = shell
+        self.socket = None
+        self.buffer = b''
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def raw_socket(self):
+        # On python 3 the exec socket is wrapped by a SocketIO object
+        return getattr(self.socket, '_sock', self.socket)
+
+    def open(self):
+        """Open the session shell."""
+        exec_id = self.docker_client.exec_create(self.container_id, [self.shell], stdin=True)['Id']
+        self.socket = self.docker_client.exec_start(exec_id, socket=True)
+        self.buffer = b''
+        log.debug("Opened a shell session in %s", self.container_id)
+
+    def close(self):
+        """Close the session shell."""
+        if self.socket is None:
+            return
+
+        try:
+            self.raw_socket.sendall(b'exit\n')
+        except EnvironmentError:
+            pass
+
+        self.socket.close()
+        self.socket = None
+        # Drop the partial output of an interrupted command, so it isn't prepended to the next session commands
+        self.buffer = b''
+        log.debug("Closed the shell session in %s", self.container_id)
+
+    def _read_frame(self, deadline):
+        """Read the next output frame data, waiting until the given deadline."""
+        header = self._read_exactly(FRAME_HEADER_SIZE, deadline)
+        _, size = struct.unpack(FRAME_HEADER_FORMAT, header)
+        return self._read_exactly(size, deadline)
+
+    def _read_exactly(self, size, deadline):
+        data = b''
+        while len(data) < size:
+            remaining = None if deadline is None else max(deadline - time.time(), 0)
+            readable, _, _ = select.select([self.raw_socket], [], [], remaining)
+            if not readable:
+                raise ExecError("Timed out waiting for the shell session output in %s" % self.container_id)
+
+            chunk = self.raw_socket.recv(size - len(data))
+            if not chunk:
+                raise ExecError("The shell session in %s ended unexpectedly" % self.container_id)
+            data += chunk
+
+        return data
+
+    def run(self, command, timeout=None):
+        """Run the given command in the session.
+
+        :param command: a shell command line, or a list of arguments.
+        :param float timeout: max time (in seconds) to wait for the command, None to wait forever. The session is
+            closed on a timeout, since its state is unknown.
+        :return ExecResult: the command result.
+        """
+        with self.lock:
+            if self.socket is None:
+                raise ExecError("The shell session in %s is closed" % self.container_id)
+
+            marker = 'dtt-end-%s' % uuid.uuid4().hex
+            end_pattern = re.compile(b'\n' + marker.encode() + b' (\\d+)\n')
+            start_time = time.time()
+            deadline = None if timeout is None else start_time + timeout
+
+            # The end marker is printed on a line of its own, also after output without a trailing new line
+            self.raw_socket.sendall(("{ %s\n} </dev/null 2>&1; printf '\\n%s %%d\\n' $?\n" %
+                                     (to_command_line(command), marker)).encode())
+            try:
+                match = end_pattern.search(self.buffer)
+                while match is None:
+                    self.buffer += self._read_frame(deadline)
+                    match = end_pattern.search(self.buffer)
+            except:
+                self.close()
+                raise
+
+            output, self.buffer = self.buffer[:match.start()], self.buffer[match.end():]
+            return ExecResult(command=command, exit_code=int(match.group(1)), output=utils.to_str(output),
+                              duration=time.time() - start_time)
+
+
+def exec_batch(docker_client, container_id, commands, parallelism=1, session=False, timeout=None):
+    """Execute the given commands in the given container.
+
+    :param docker.APIClient docker_client: the docker API client.
+    :param str container_id: the container to execute the commands in.
+    :param list commands: shell command lines, or lists of arguments.
+    :param int parallelism: number of commands executed concurrently (number of shell sessions in session mode).
+    :param bool session: execute the commands through persistent shell sessions instead of an exec per command.
+    :param float timeout: max time (in seconds) to wait for each command in session mode, None to wait forever.
+    :return list: the commands results (ExecResult), in the given commands order.
+    """
+    parallelism = max(min(parallelism, len(commands)), 1)
+    start_time = time.time()
+
+    if session:
+        sessions = [ShellSession(docker_client, container_id) for _ in range(parallelism)]
+        available = queue.Queue()
+        for shell_session in sessions:
+            available.put(shell_session)
+
+        def run_command(command):
+            shell_session = available.get()
+            try:
+                if shell_session.socket is None:
+                    shell_session.open()
+                return shell_session.run(command, timeout=timeout)
+            finally:
+                available.put(shell_session)
+
+    else:
+        sessions = []
+
+        def run_command(command):
+            return exec_command(docker_client, container_id, command)
+
+    pool = ThreadPool(processes=parallelism)
+    try:
+        results = pool.map(run_command, commands, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+        for shell_session in sessions:
+            shell_session.close()
+
+    log.debug("Executed %d commands in %s in %.2f seconds", len(commands), container_id, time.time() - start_time)
+    return results
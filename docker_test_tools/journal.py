@@ -0,0 +1,191 @@
+"""Utility for analyzing wiremock request journals.
+
+Turns the journal serve events into per stub and per url request rates, inter-arrival distributions, concurrency over
+time and server side timing percentiles - e.g. for asserting the tested service calls rate to a dependency stays under a
+budget, or that its retries don't amplify the load.
+
+The journal is consumed in a single pass, keeping only compact arrays of the requests times and timings per group.
+"""
+import logging
+from array import array
+
+from six.moves.urllib.parse import urlsplit
+
+log = logging.getLogger(__name__)
+
+# Server side timings (in milliseconds) recorded by wiremock per serve event
+TIMINGS = ('totalTime', 'serveTime', 'processTime', 'responseSendTime', 'addedDelay')
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values, percent):
+    """Return the given percentile of the sorted values, using linear interpolation between the closest ranks."""
+    if not sorted_values:
+        return None
+
+    rank = (len(sorted_values) - 1) * percent / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def summarize(values, percentiles=PERCENTILES):
+    """Return the distribution summary of the given values.
+
+    :return dict: of format {"count": count, "min": min, "max": max, "avg": avg, "p50": p50, ...}, only the count
+        when there are no values.
+    """
+    if not values:
+        return {"count": 0}
+
+    sorted_values = sorted(values)
+    summary = {"count": len(sorted_values),
+               "min": sorted_values[0],
+               "max": sorted_values[-1],
+               "avg": sum(sorted_values) / len(sorted_values)}
+    for percent in percentiles:
+        summary["p%d" % percent] = percentile(sorted_values, percent)
+    return summary
+
+
+class RequestsStats(object):
+    """Stats of a group of journal requests (e.g. the requests of a stub or a url)."""
+
+    def __init__(self):
+        self.times = array('d')
+        self.durations = array('d')
+        self.timings = dict((name, array('d')) for name in TIMINGS)
+        self._sorted_times = None
+
+    def add(self, logged_time, timing=None):
+        """Add a request.
+
+        :param float logged_time: the request logged time (epoch, in seconds).
+        :param dict timing: the request server side timings (in milliseconds), if recorded.
+        """
+        timing = timing or {}
+        self.times.append(logged_time)
+        self.durations.append(timing.get('totalTime', 0) / 1000.0)
+        for name in TIMINGS:
+            if name in timing:
+                self.timings[name].append(timing[name])
+        self._sorted_times = None
+
+    @property
+    def count(self):
+        return len(self.times)
+
+    @property
+    def sorted_times(self):
+        if self._sorted_times is None:
+            self._sorted_times = sorted(self.times)
+        return self._sorted_times
+
+    @property
+    def span(self):
+        """Return the time (in seconds) between the first and the last requests."""
+        return self.sorted_times[-1] - self.sorted_times[0] if self.times else 0
+
+    def rate(self, duration=None):
+        """Return the average requests rate (per second).
+
+        :param float duration: the duration (in seconds) to average over, the requests span by default.
+        :return float: the requests rate, None if the duration is 0.
+        """
+        duration = self.span if duration is None else duration
+        return self.count / float(duration) if duration > 0 else None
+
+    def peak_rate(self, window=1.0):
+        """Return the peak requests rate (per second) - the max number of requests in any window of the given size."""
+        times = self.sorted_times
+        peak = 0
+        start = 0
+        for end in range(len(times)):
+            while times[end] - times[start] > window:
+                start += 1
+            peak = max(peak, end - start + 1)
+        return peak / float(window)
+
+    def inter_arrivals(self):
+        """Return the times (in seconds) between consecutive requests."""
+        times = self.sorted_times
+        return array('d', (times[index] - times[index - 1] for index in range(1, len(times))))
+
+    def concurrency(self):
+        """Return the number of requests in flight over time, based on the requests server side total time.
+
+        :return list: of (time, concurrency) tuples, an item per change.
+        """
+        # Ends sort before starts of the same time, so back to back requests don't overlap
+        changes = sorted([(end, -1) for end in (start + duration for start, duration in zip(self.times, self.durations))] +
+                         [(start, 1) for start in self.times])
+        timeline = []
+        current = 0
+        for change_time, change in changes:
+            current += change
+            if timeline and timeline[-1][0] == change_time:
+                timeline[-1] = (change_time, current)
+            else:
+                timeline.append((change_time, current))
+        return timeline
+
+    @property
+    def max_concurrency(self):
+        return max([concurrency for _, concurrency in self.concurrency()] or [0])
+
+    def timing(self, name='totalTime'):
+        """Return the distribution summary of the given server side timing (in milliseconds)."""
+        return summarize(self.timings[name])
+
+    def to_dict(self):
+        """Return a dictionary representation of the stats."""
+        return {"count": self.count,
+                "rate": self.rate(),
+                "peak_rate": self.peak_rate(),
+                "inter_arrival": summarize(self.inter_arrivals()),
+                "max_concurrency": self.max_concurrency,
+                "timing": dict((name, self.timing(name)) for name in TIMINGS if self.timings[name])}
+
+
+class JournalAnalytics(object):
+    """Requests stats of a wiremock journal, in total, per stub and per url path.
+
+    Usage example:
+
+    >>> analytics = controller.get_journal_analytics()
+    >>> assert analytics.urls['/api/items'].peak_rate(window=1) <= 10
+    >>> assert analytics.stubs[stub_id].timing('totalTime')['p99'] < 100
+    """
+
+    def __init__(self):
+        self.total = RequestsStats()
+        self.stubs = {}
+        self.urls = {}
+
+    @classmethod
+    def from_events(cls, serve_events):
+        """Return the analytics of the given journal serve events (e.g. a streamed journal iterator)."""
+        analytics = cls()
+        for serve_event in serve_events:
+            analytics.add(serve_event)
+        return analytics
+
+    def add(self, serve_event):
+        """Add a journal serve event, unmatched requests are grouped under the None stub."""
+        request = serve_event["request"]
+        logged_time = request["loggedDate"] / 1000.0
+        timing = serve_event.get("timing")
+
+        stub_mapping = serve_event.get("stubMapping") or {}
+        stub_id = (stub_mapping.get("id") or stub_mapping.get("uuid")) if serve_event.get("wasMatched") else None
+        url_path = urlsplit(request["url"]).path
+
+        for stats in (self.total, self.stubs.setdefault(stub_id, RequestsStats()),
+                      self.urls.setdefault(url_path, RequestsStats())):
+            stats.add(logged_time, timing)
+
+    def to_dict(self):
+        """Return a dictionary representation of the analytics."""
+        return {"total": self.total.to_dict(),
+                "stubs": dict((stub_id, stats.to_dict()) for stub_id, stats in self.stubs.items()),
+                "urls": dict((url, stats.to_dict()) for url, stats in self.urls.items())}
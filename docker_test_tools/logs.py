@@ -24,6 +24,9 @@ class LogCollector(object):
         self.logs_file = None
         self.logs_process = None
 
+        # Log collection processes of services started after the collection started
+        self.follow_processes = []
+
     def start(self):
         """Start a log collection process which writes docker-compose logs into a file."""
         log.debug("Starting logs collection from environment containers")
@@ -36,14 +39,24 @@ class LogCollector(object):
     def stop(self):
         """Stop the log collection process and close the log file."""
         log.debug("Stopping logs collection from environment containers")
-        if self.logs_process:
-            self.logs_process.kill()
-            self.logs_process.wait()
+        for logs_process in [self.logs_process] + self.follow_processes:
+            if logs_process:
+                logs_process.kill()
+                logs_process.wait()
 
         if self.logs_file:
             self.logs_file.close()
             self._split_logs()
 
+    def follow(self, services):
+        """Start collecting the logs of the given services, started after the collection started."""
+        log.debug("Starting logs collection from services: %s", services)
+        self.follow_processes.append(subprocess.Popen(
+            ['docker-compose', '-f', self.compose_path, '-p', self.project_name, 'logs', '--no-color', '-f', '-t'] +
+            list(services),
+            stdout=self.logs_file, env=self.environment_variables
+        ))
+
     def update(self, message):
         """Write a common log message to the container logs."""
         self.logs_file.write(self.COMMON_LOG_FORMAT.format(message=message))
@@ -0,0 +1,296 @@
+"""Utility for exposing live environment metrics in the OpenMetrics (Prometheus) text format.
+
+The exporter serves an HTTP endpoint on localhost, so a local Prometheus (or any simple scraper) can chart the
+environment containers resource usage, health state and the controller internals while the tests run.
+"""
+import re
+import os
+import io
+import time
+import logging
+import threading
+from functools import wraps
+
+from six.moves import socketserver
+from six.moves import BaseHTTPServer
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+class MetricsRegistry(object):
+    """Thread safe registry of counter, gauge and summary metrics."""
+
+    COUNTER = 'counter'
+    GAUGE = 'gauge'
+    SUMMARY = 'summary'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def describe(self, name, metric_type, description):
+        """Register a metric.
+
+        :param str name: metric name (without the '_total' suffix for counters).
+        :param str metric_type: one of COUNTER, GAUGE or SUMMARY.
+        :param str description: metric help text.
+        """
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = (metric_type, description, {})
+
+    def inc(self, name, labels=None, value=1):
+        """Increase a counter metric by the given value."""
+        with self.lock:
+            samples = self.metrics[name][2]
+            key = self._key(labels)
+            samples[key] = samples.get(key, 0) + value
+
+    def set(self, name, labels=None, value=0):
+        """Set a gauge metric to the given value."""
+        with self.lock:
+            self.metrics[name][2][self._key(labels)] = value
+
+    def clear(self, name):
+        """Remove all the samples of a metric (e.g. gauges of containers which no longer exist)."""
+        with self.lock:
+            self.metrics[name][2].clear()
+
+    def observe(self, name, labels=None, value=0):
+        """Add an observation to a summary metric."""
+        with self.lock:
+            samples = self.metrics[name][2]
+            key = self._key(labels)
+            count, total = samples.get(key, (0, 0))
+            samples[key] = (count + 1, total + value)
+
+    def get(self, name, labels=None):
+        """Return the current value of a metric sample, or None if it doesn't exist."""
+        with self.lock:
+            return self.metrics[name][2].get(self._key(labels))
+
+    @staticmethod
+    def _key(labels):
+        """Return a hashable key for the given labels dictionary."""
+        return tuple(sorted(labels.items())) if labels else ()
+
+    @staticmethod
+    def _format_labels(key, extra=()):
+        """Return the OpenMetrics representation of the given labels key."""
+        labels = list(key) + list(extra)
+        if not labels:
+            return ''
+
+        return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                                 for name, value in labels)
+
+    def render(self):
+        """Return all the registered metrics in the OpenMetrics text format."""
+        lines = []
+        with self.lock:
+            for name, (metric_type, description, samples) in sorted(self.metrics.items()):
+                lines.append('# TYPE %s %s' % (name, metric_type))
+                lines.append('# HELP %s %s' % (name, description))
+                for key, value in sorted(samples.items()):
+                    if metric_type == self.COUNTER:
+                        lines.append('%s_total%s %s' % (name, self._format_labels(key), value))
+                    elif metric_type == self.SUMMARY:
+                        lines.append('%s_count%s %s' % (name, self._format_labels(key), value[0]))
+                        lines.append('%s_sum%s %s' % (name, self._format_labels(key), value[1]))
+                    else:
+                        lines.append('%s%s %s' % (name, self._format_labels(key), value))
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+class InstrumentedDockerClient(object):
+    """Docker API client proxy, counting and timing the daemon API calls."""
+
+    def __init__(self, docker_client, registry):
+        """Initialize the client proxy.
+
+        :param docker.APIClient docker_client: the proxied docker client.
+        :param MetricsRegistry registry: registry to record the API calls metrics in.
+        """
+        self.__dict__['_docker_client'] = docker_client
+        self.__dict__['_registry'] = registry
+        registry.describe('dtt_docker_api_calls', MetricsRegistry.COUNTER, 'Docker daemon API calls.')
+        registry.describe('dtt_docker_api_call_duration_seconds', MetricsRegistry.SUMMARY,
+                          'Docker daemon API calls duration.')
+
+    def __getattr__(self, name):
+        attribute = getattr(self._docker_client, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        registry = self._registry
+
+        @wraps(attribute)
+        def timed_call(*args, **kwargs):
+            start_time = time.time()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                registry.inc('dtt_docker_api_calls', {'method': name})
+                registry.observe('dtt_docker_api_call_duration_seconds', {'method': name}, time.time() - start_time)
+
+        return timed_call
+
+    def __setattr__(self, name, value):
+        setattr(self._docker_client, name, value)
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threading HTTP server, handling each scrape in its own thread."""
+    daemon_threads = True
+
+
+class MetricsExporter(object):
+    """Environment plugin, serving the environment metrics on a localhost HTTP endpoint ('/metrics').
+
+    The exporter collects on each scrape:
+
+    * Per container cpu, ram, net & block io usage (from the stats collector, when stats collection is enabled).
+    * Per container state & health state (using a single containers listing).
+    * Log lines per service (by tailing the collected log file).
+    * The controller internal metrics recorded in the registry (health checks latency, docker API calls).
+    """
+    HOST = '127.0.0.1'
+
+    # Collected log lines are in a format of: 'service.name_number  | message'
+    LOG_LINE_REGEX = re.compile(r'^(?P<service>[^|\s]+)\s*\|')
+    HEALTH_REGEX = re.compile(r'\((?P<health>healthy|unhealthy|health: starting)\)')
+
+    def __init__(self, controller, port=0):
+        """Initialize the metrics exporter.
+
+        :param EnvironmentController controller: the environment controller.
+        :param int port: local port to listen on, 0 for an ephemeral port.
+        """
+        self.controller = controller
+        self.port = port
+        self.registry = controller.metrics
+
+        self.server = None
+        self.server_thread = None
+        self.log_offset = 0
+
+        self.registry.describe('dtt_tests_started', MetricsRegistry.COUNTER, 'Tests started.')
+        self.registry.describe('dtt_log_lines', MetricsRegistry.COUNTER, 'Collected log lines per service.')
+        self.registry.describe('dtt_container_running', MetricsRegistry.GAUGE, 'Whether the container is running.')
+        self.registry.describe('dtt_container_healthy', MetricsRegistry.GAUGE,
+                               'Whether the container health check passes (-1 when no health check is defined).')
+        self.registry.describe('dtt_container_cpu_percent', MetricsRegistry.GAUGE, 'Container cpu usage.')
+        self.registry.describe('dtt_container_ram_bytes', MetricsRegistry.GAUGE, 'Container ram usage.')
+        self.registry.describe('dtt_container_net_io_bytes', MetricsRegistry.GAUGE, 'Container network io.')
+        self.registry.describe('dtt_container_block_io_bytes', MetricsRegistry.GAUGE, 'Container block io.')
+
+    @property
+    def url(self):
+        """Return the metrics endpoint url."""
+        return 'http://%s:%d/metrics' % (self.HOST, self.port)
+
+    def start(self):
+        """Start serving the metrics endpoint in a background thread."""
+        exporter = self
+
+        class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            """Serve the metrics on GET '/metrics'."""
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = exporter.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                """Silence the default stderr request logging."""
+
+        self.server = _ThreadingHTTPServer((self.HOST, self.port), MetricsHandler)
+        self.port = self.server.server_address[1]
+        self.server_thread = threading.Thread(target=self.server.serve_forever, name='metrics-exporter')
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        log.info("Serving environment metrics on %s", self.url)
+
+    def stop(self):
+        """Stop serving the metrics endpoint."""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server_thread.join()
+            self.server = None
+
+    def update(self, message):
+        """Count the started tests."""
+        self.registry.inc('dtt_tests_started')
+
+    def render(self):
+        """Collect the current environment metrics and return them in the OpenMetrics text format."""
+        for collect in (self.collect_containers_state, self.collect_containers_stats, self.collect_log_lines):
+            try:
+                collect()
+            except Exception as error:
+                log.debug("Failed collecting metrics using %s: %s", collect.__name__, error)
+
+        return self.registry.render()
+
+    def collect_containers_state(self):
+        """Update the containers running & health state gauges."""
+        filters = {"label": "com.docker.compose.project={project}".format(project=self.controller.project_name)}
+        containers = self.controller.docker_client.containers(all=True, filters=filters)
+
+        self.registry.clear('dtt_container_running')
+        self.registry.clear('dtt_container_healthy')
+        for container in containers:
+            labels = {'container': container['Names'][0].lstrip('/'),
+                      'service': container['Labels'].get('com.docker.compose.service', '')}
+            self.registry.set('dtt_container_running', labels, int(container['State'] == 'running'))
+
+            health = self.HEALTH_REGEX.search(container.get('Status', ''))
+            healthy = -1 if not health else int(health.group('health') == 'healthy')
+            self.registry.set('dtt_container_healthy', labels, healthy)
+
+    def collect_containers_stats(self):
+        """Update the containers resource usage gauges from the stats collector latest samples."""
+        stats_collector = self.controller.get_stats_collector()
+        if stats_collector is None:
+            return
+
+        for name, sample in stats_collector.latest().items():
+            labels = {'container': name}
+            self.registry.set('dtt_container_cpu_percent', labels, sample['cpu'])
+            self.registry.set('dtt_container_ram_bytes', labels, sample['ram'])
+            self.registry.set('dtt_container_net_io_bytes', labels, sample['net'])
+            self.registry.set('dtt_container_block_io_bytes', labels, sample['block'])
+
+    def collect_log_lines(self):
+        """Count the log lines collected since the last scrape, per service."""
+        log_path = self.controller.logs_collector.log_path
+        if not os.path.exists(log_path):
+            return
+
+        with io.open(log_path, 'rb') as log_file:
+            log_file.seek(self.log_offset)
+            content = log_file.read()
+
+        # Count complete lines only, a partial line will be counted on the next scrape
+        content = content[:content.rfind(b'\n') + 1]
+        self.log_offset += len(content)
+
+        counts = {}
+        for line in content.decode(self.controller.encoding, 'replace').splitlines():
+            match = self.LOG_LINE_REGEX.match(line)
+            if match:
+                counts[match.group('service')] = counts.get(match.group('service'), 0) + 1
+
+        for service, count in counts.items():
+            self.registry.inc('dtt_log_lines', {'service': service}, count)
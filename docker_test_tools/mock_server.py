@@ -0,0 +1,815 @@
+"""Lightweight WireMock compatible mock HTTP server.
+
+Implements the subset of the WireMock admin API used by the `WiremockController` (mappings CRUD & import, reset,
+request journal, requests find & count, global settings, scenarios & recordings), the core request matching, response
+templating, proxying, delays and faults - so it can replace a JVM WireMock container for fast local tests, either in-process:
+
+>>> with MockServer() as server:
+>>>     controller = WiremockController(url=server.url)
+
+Or as a tiny container / process, serving the stubs under '<root-dir>/mappings' (bodies under '<root-dir>/__files'):
+
+$ python -m docker_test_tools.mock_server --port 9999 --root-dir /home/wiremock
+"""
+import os
+import re
+import json
+import glob
+import time
+import math
+import struct
+import socket
+import random
+import uuid
+import base64
+import logging
+import argparse
+import datetime
+import threading
+import collections
+
+import six
+import requests
+from six.moves import socketserver
+from six.moves import BaseHTTPServer
+from six.moves.urllib.parse import urlsplit, parse_qs
+
+log = logging.getLogger(__name__)
+
+ADMIN_PREFIX = '/__admin'
+DEFAULT_PRIORITY = 5
+TEMPLATE_TRANSFORMER = 'response-template'
+STARTED_STATE = 'Started'
+PROXY_STUB_PRIORITY = 1
+# Headers which are not forwarded when proxying (hop-by-hop headers & headers recalculated by the server)
+NOT_PROXIED_HEADERS = ('connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+                       'transfer-encoding', 'upgrade', 'host', 'content-length', 'content-encoding')
+NOT_MATCHED_BODY = b'No response could be served as there are no stub mappings which match this request'
+
+
+def to_date_string(timestamp):
+    """Return the ISO 8601 representation of the given epoch timestamp (in seconds)."""
+    date = datetime.datetime.utcfromtimestamp(timestamp)
+    return date.strftime('%Y-%m-%dT%H:%M:%S.') + '%03dZ' % (date.microsecond // 1000)
+
+
+def parse_date_string(date_string):
+    """Return the epoch timestamp (in seconds) of the given ISO 8601 UTC date string."""
+    date_string = date_string.rstrip('Z')
+    date_format = '%Y-%m-%dT%H:%M:%S.%f' if '.' in date_string else '%Y-%m-%dT%H:%M:%S'
+    date = datetime.datetime.strptime(date_string, date_format)
+    return (date - datetime.datetime(1970, 1, 1)).total_seconds()
+
+
+def get_json_path(document, expression):
+    """Return the values selected by a simple json path expression (e.g. '$.items[0].name', "$['name']").
+
+    :return list: the selected values, empty if the path doesn't exist.
+    """
+    values = [document]
+    for name, index in re.findall(r"\.([^.\[\]]+)|\[['\"]?([^\]'\"]+)['\"]?\]", expression.lstrip('$')):
+        selected = []
+        for value in values:
+            key = name or index
+            if isinstance(value, dict) and key in value:
+                selected.append(value[key])
+            elif isinstance(value, list) and key == '*':
+                selected.extend(value)
+            elif isinstance(value, list) and re.match(r'^-?\d+$', key) and -len(value) <= int(key) < len(value):
+                selected.append(value[int(key)])
+        values = selected
+
+    return values
+
+
+def match_value(matcher, value):
+    """Return True if the given value matches a wiremock value matcher (e.g. {"equalTo": "value"}).
+
+    :param dict matcher: the value matcher.
+    :param str value: the value to match, None if the value is absent.
+    """
+    if matcher.get('absent'):
+        return value is None
+    if value is None:
+        return False
+
+    if 'equalTo' in matcher:
+        if matcher.get('caseInsensitive'):
+            return value.lower() == matcher['equalTo'].lower()
+        return value == matcher['equalTo']
+    if 'contains' in matcher:
+        return matcher['contains'] in value
+    if 'matches' in matcher:
+        return re.match('(?:%s)\\Z' % matcher['matches'], value, re.DOTALL) is not None
+    if 'doesNotMatch' in matcher:
+        return re.match('(?:%s)\\Z' % matcher['doesNotMatch'], value, re.DOTALL) is None
+    if 'equalToJson' in matcher:
+        expected = matcher['equalToJson']
+        try:
+            return json.loads(value) == (json.loads(expected) if isinstance(expected, six.string_types) else expected)
+        except ValueError:
+            return False
+    if 'matchesJsonPath' in matcher:
+        return match_json_path(matcher['matchesJsonPath'], value)
+
+    log.warning("Unsupported value matcher: %s", matcher)
+    return False
+
+
+def match_json_path(json_path, value):
+    """Return True if the given json document matches a json path matcher.
+
+    :param json_path: either an expression which should select a value, or a dictionary of an expression and a
+        value matcher the selected values should match (e.g. {"expression": "$.name", "equalTo": "test"}).
+    :param str value: the json document.
+    """
+    try:
+        document = json.loads(value)
+    except ValueError:
+        return False
+
+    if not isinstance(json_path, dict):
+        return any(selected is not None and selected != [] for selected in get_json_path(document, json_path))
+
+    matcher = dict((key, matcher_value) for key, matcher_value in json_path.items() if key != 'expression')
+    for selected in get_json_path(document, json_path['expression']):
+        selected = selected if isinstance(selected, six.string_types) else json.dumps(selected)
+        if match_value(matcher, selected):
+            return True
+    return False
+
+
+class LoggedRequest(object):
+    """A request received by the mock server."""
+
+    def __init__(self, method, url, headers, body, client_ip, absolute_url):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.body = body
+        self.client_ip = client_ip
+        self.absolute_url = absolute_url
+        self.logged_date = time.time()
+
+        split_url = urlsplit(url)
+        self.path = split_url.path
+        self.query = parse_qs(split_url.query, keep_blank_values=True)
+
+    @property
+    def body_text(self):
+        return self.body.decode('utf-8', 'replace')
+
+    def get_header(self, name):
+        """Return the value of the given header (case insensitive), None if it's missing."""
+        for header, value in self.headers.items():
+            if header.lower() == name.lower():
+                return value
+        return None
+
+    def to_dict(self):
+        """Return the wiremock journal representation of the request."""
+        return {"url": self.url,
+                "absoluteUrl": self.absolute_url,
+                "method": self.method,
+                "clientIp": self.client_ip,
+                "headers": dict(self.headers),
+                "cookies": {},
+                "browserProxyRequest": False,
+                "loggedDate": int(self.logged_date * 1000),
+                "loggedDateString": to_date_string(self.logged_date),
+                "body": self.body_text,
+                "bodyAsBase64": base64.b64encode(self.body).decode('ascii'),
+                "queryParams": dict((name, {"key": name, "values": values}) for name, values in self.query.items())}
+
+
+def match_request(pattern, request):
+    """Return True if the given request matches the given wiremock request pattern."""
+    method = pattern.get('method', 'ANY')
+    if method not in ('ANY', None) and method != request.method:
+        return False
+
+    if 'url' in pattern and pattern['url'] != request.url:
+        return False
+    if 'urlPattern' in pattern and not re.match('(?:%s)\\Z' % pattern['urlPattern'], request.url):
+        return False
+    if 'urlPath' in pattern and pattern['urlPath'] != request.path:
+        return False
+    if 'urlPathPattern' in pattern and not re.match('(?:%s)\\Z' % pattern['urlPathPattern'], request.path):
+        return False
+
+    for name, matcher in (pattern.get('headers') or {}).items():
+        if not match_value(matcher, request.get_header(name)):
+            return False
+
+    for name, matcher in (pattern.get('queryParameters') or {}).items():
+        values = request.query.get(name)
+        if not any(match_value(matcher, value) for value in (values or [None])):
+            return False
+
+    for matcher in pattern.get('bodyPatterns') or []:
+        if not match_value(matcher, request.body_text):
+            return False
+
+    return True
+
+
+class TemplateRenderer(object):
+    """Renders the handlebars response templates subset supported by the mock server.
+
+    Supported expressions: request.url, request.path, request.path.[n], request.method, request.body,
+    request.query.<name>, request.query.<name>.[n], request.headers.<name> and jsonPath request.body '<path>'.
+    Unsupported or missing values render as an empty string.
+    """
+    EXPRESSION_REGEX = re.compile(r'{{\s*(.+?)\s*}}')
+    JSON_PATH_REGEX = re.compile(r'''^jsonPath\s+request\.body\s+['"](?P<path>.+)['"]$''')
+    INDEX_REGEX = re.compile(r'^\[(\d+)\]$')
+
+    def __init__(self, request):
+        self.request = request
+
+    def render(self, template):
+        return self.EXPRESSION_REGEX.sub(lambda match: self.evaluate(match.group(1)), template)
+
+    def evaluate(self, expression):
+        """Return the string value of the given template expression."""
+        json_path = self.JSON_PATH_REGEX.match(expression)
+        if json_path:
+            try:
+                values = get_json_path(json.loads(self.request.body_text), json_path.group('path'))
+            except ValueError:
+                return ''
+            if not values:
+                return ''
+            return values[0] if isinstance(values[0], six.string_types) else json.dumps(values[0])
+
+        parts = expression.split('.')
+        if parts[0] != 'request' or len(parts) < 2:
+            return ''
+
+        if len(parts) == 2:
+            return {'url': self.request.url,
+                    'path': self.request.path,
+                    'method': self.request.method,
+                    'body': self.request.body_text}.get(parts[1], '')
+
+        if parts[1] == 'path':
+            index = self.INDEX_REGEX.match(parts[2])
+            segments = [segment for segment in self.request.path.split('/') if segment]
+            return segments[int(index.group(1))] if index and int(index.group(1)) < len(segments) else ''
+
+        if parts[1] == 'query':
+            values = self.request.query.get(parts[2]) or ['']
+            index = self.INDEX_REGEX.match(parts[3]) if len(parts) > 3 else None
+            return values[int(index.group(1))] if index and int(index.group(1)) < len(values) else values[0]
+
+        if parts[1] == 'headers':
+            return self.request.get_header(parts[2].strip('[]')) or ''
+
+        return ''
+
+
+class MockResponse(object):
+    """A mock server response.
+
+    :ivar int status: response status code.
+    :ivar list headers: list of (name, value) tuples.
+    :ivar bytes body: response body.
+    :ivar str fault: fault to simulate instead of responding (e.g. 'CONNECTION_RESET_BY_PEER').
+    :ivar int chunks: number of chunks to send the body in.
+    :ivar float chunk_delay: delay (in seconds) before sending each chunk.
+    """
+
+    def __init__(self, status, headers, body, fault=None, chunks=1, chunk_delay=0):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.fault = fault
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+
+    def to_dict(self):
+        """Return the wiremock journal representation of the response."""
+        return {"status": self.status,
+                "headers": dict(self.headers),
+                "body": self.body.decode('utf-8', 'replace'),
+                "bodyAsBase64": base64.b64encode(self.body).decode('ascii')}
+
+
+def get_recorded_stub(serve_event):
+    """Return a stub reproducing the proxied response of the given serve event."""
+    response = serve_event["response"]
+    stub_response = {"status": response["status"]}
+    if response["headers"]:
+        stub_response["headers"] = response["headers"]
+
+    body = base64.b64decode(response["bodyAsBase64"])
+    try:
+        stub_response["body"] = body.decode('utf-8')
+    except UnicodeDecodeError:
+        stub_response["base64Body"] = response["bodyAsBase64"]
+
+    return {"id": str(uuid.uuid4()),
+            "request": {"url": serve_event["request"]["url"], "method": serve_event["request"]["method"]},
+            "response": stub_response}
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threading HTTP server, handling each connection in its own thread."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MockRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Dispatch the received requests to the mock server."""
+    protocol_version = 'HTTP/1.1'
+
+    def handle_request(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        headers = dict((name, value) for name, value in self.headers.items())
+        absolute_url = 'http://%s%s' % (self.headers.get('Host', '%s:%d' % self.server.server_address), self.path)
+
+        request = LoggedRequest(method=self.command, url=self.path, headers=headers, body=body,
+                                client_ip=self.client_address[0], absolute_url=absolute_url)
+        try:
+            response = self.server.mock_server.handle(request)
+        except Exception as error:
+            log.exception("Failed handling request: %s %s", request.method, request.url)
+            response = MockResponse(500, [('Content-Type', 'text/plain')], str(error).encode('utf-8'))
+
+        if response.fault is not None:
+            self.send_fault(response.fault)
+            return
+
+        self.send_response(response.status)
+        for name, value in response.headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(response.body)))
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+
+        chunk_size = int(math.ceil(float(len(response.body)) / response.chunks)) or 1
+        for index in range(0, len(response.body), chunk_size):
+            if response.chunk_delay:
+                self.wfile.flush()
+                time.sleep(response.chunk_delay)
+            self.wfile.write(response.body[index:index + chunk_size])
+
+    def send_fault(self, fault):
+        """Simulate the given fault and close the connection."""
+        self.close_connection = True
+        if fault == 'CONNECTION_RESET_BY_PEER':
+            # Closing the socket with a zero linger time resets the connection
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        elif fault == 'MALFORMED_RESPONSE_CHUNK':
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.wfile.write(b'lskdu018973t09sylgasjkfg1][]')
+        elif fault == 'RANDOM_DATA_THEN_CLOSE':
+            self.wfile.write(os.urandom(1024))
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_HEAD = do_OPTIONS = handle_request
+
+    def log_message(self, message_format, *args):
+        log.debug("%s - %s", self.client_address[0], message_format % args)
+
+
+class MockServer(object):
+    """WireMock compatible mock HTTP server, running in a background thread."""
+
+    def __init__(self, host='127.0.0.1', port=0, root_dir=None, max_journal_entries=None, global_templating=False):
+        """Initialize the mock server.
+
+        :param str host: host to listen on.
+        :param int port: port to listen on, 0 for an ephemeral port.
+        :param str root_dir: directory holding the default stubs ('mappings') and bodies files ('__files').
+        :param int max_journal_entries: max number of requests to keep in the journal, None for no limit.
+        :param bool global_templating: whether to render all the responses as templates.
+        """
+        self.host = host
+        self.port = port
+        self.root_dir = root_dir
+        self.global_templating = global_templating
+
+        self.lock = threading.RLock()
+        self.mappings = collections.OrderedDict()
+        self.scenarios = {}
+        self.settings = {}
+        self.recording = None
+        self.journal = collections.deque(maxlen=max_journal_entries)
+        self.server = None
+        self.server_thread = None
+
+        self.routes = [
+            ('GET', r'/?$', self.get_root),
+            ('GET', r'/mappings/?$', self.get_mappings),
+            ('POST', r'/mappings/?$', self.create_mapping),
+            ('DELETE', r'/mappings/?$', self.delete_mappings),
+            ('POST', r'/mappings/reset/?$', self.reset_mappings),
+            ('POST', r'/mappings/import/?$', self.import_mappings),
+            ('GET', r'/mappings/(?P<stub_id>[^/]+)$', self.get_mapping),
+            ('PUT', r'/mappings/(?P<stub_id>[^/]+)$', self.update_mapping),
+            ('DELETE', r'/mappings/(?P<stub_id>[^/]+)$', self.delete_mapping),
+            ('GET', r'/requests/?$', self.get_requests),
+            ('DELETE', r'/requests/?$', self.delete_requests),
+            ('POST', r'/requests/reset/?$', self.delete_requests),
+            ('POST', r'/requests/find/?$', self.find_requests),
+            ('POST', r'/requests/count/?$', self.count_requests),
+            ('GET', r'/settings/?$', self.get_settings),
+            ('POST', r'/settings/?$', self.update_settings),
+            ('GET', r'/scenarios/?$', self.get_scenarios),
+            ('POST', r'/scenarios/reset/?$', self.reset_scenarios),
+            ('POST', r'/recordings/start/?$', self.start_recording),
+            ('POST', r'/recordings/stop/?$', self.stop_recording),
+            ('POST', r'/recordings/snapshot/?$', self.snapshot_recording),
+            ('GET', r'/recordings/status/?$', self.get_recording_status),
+            ('POST', r'/reset/?$', self.reset),
+        ]
+
+        self.load_default_mappings()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def url(self):
+        """Return the mock server url."""
+        return 'http://%s:%d' % (self.host, self.port)
+
+    def start(self):
+        """Start serving in a background thread."""
+        self.server = _ThreadingHTTPServer((self.host, self.port), MockRequestHandler)
+        self.server.mock_server = self
+        self.port = self.server.server_address[1]
+        self.server_thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05},
+                                              name='mock-server-%d' % self.port)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        log.debug("Mock server listening on %s", self.url)
+
+    def stop(self):
+        """Stop serving."""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server_thread.join()
+            self.server = None
+
+    def serve_forever(self):
+        """Serve in the current thread, until interrupted."""
+        self.start()
+        try:
+            while self.server_thread.is_alive():
+                self.server_thread.join(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def load_default_mappings(self):
+        """Load the stubs from the root dir 'mappings' directory, replacing all the current stubs."""
+        with self.lock:
+            self.mappings.clear()
+            self.scenarios.clear()
+            if self.root_dir is None:
+                return
+
+            for json_path in sorted(glob.glob(os.path.join(self.root_dir, 'mappings', '*.json'))):
+                with open(json_path, 'r') as json_file:
+                    content = json.load(json_file)
+                for stub in content.get('mappings', [content]):
+                    self.add_mapping(stub)
+
+    def add_mapping(self, stub):
+        """Add (or replace) a stub, return it with its id."""
+        stub = dict(stub)
+        stub['id'] = stub['uuid'] = stub.get('id') or stub.get('uuid') or str(uuid.uuid4())
+        with self.lock:
+            # Newer stubs take precedence over older stubs of the same priority
+            self.mappings.pop(stub['id'], None)
+            self.mappings[stub['id']] = stub
+        return stub
+
+    def find_stub(self, request):
+        """Return the stub matching the given request (and advance its scenario state), None if no stub matches."""
+        with self.lock:
+            matched = None
+            for stub in reversed(self.mappings.values()):
+                scenario = stub.get('scenarioName')
+                if scenario is not None and 'requiredScenarioState' in stub and \
+                        self.scenarios.get(scenario, STARTED_STATE) != stub['requiredScenarioState']:
+                    continue
+
+                if match_request(stub.get('request', {}), request):
+                    if matched is None or \
+                            stub.get('priority', DEFAULT_PRIORITY) < matched.get('priority', DEFAULT_PRIORITY):
+                        matched = stub
+
+            if matched is not None and matched.get('scenarioName') and 'newScenarioState' in matched:
+                self.scenarios[matched['scenarioName']] = matched['newScenarioState']
+
+        return matched
+
+    def handle(self, request):
+        """Handle a received request.
+
+        :return MockResponse: the response to send.
+        """
+        if request.path == ADMIN_PREFIX or request.path.startswith(ADMIN_PREFIX + '/'):
+            return self.handle_admin(request)
+
+        stub = self.find_stub(request)
+        serve_event = {"id": str(uuid.uuid4()), "request": request.to_dict(), "wasMatched": stub is not None}
+        if stub is not None:
+            serve_event["stubMapping"] = stub
+            serve_event["responseDefinition"] = stub.get('response', {})
+        else:
+            serve_event["responseDefinition"] = {"status": 404}
+
+        with self.lock:
+            self.journal.append((request, serve_event))
+
+        if stub is None:
+            log.debug("No stub matched request: %s %s", request.method, request.url)
+            return MockResponse(404, [('Content-Type', 'text/plain')], NOT_MATCHED_BODY)
+
+        start_time = time.time()
+        response = self.render_response(stub.get('response', {}), request)
+        serve_time = int((time.time() - start_time) * 1000)
+        serve_event["timing"] = {"serveTime": serve_time, "totalTime": serve_time}
+        if 'proxyBaseUrl' in stub.get('response', {}) and response.fault is None:
+            serve_event["response"] = response.to_dict()
+        return response
+
+    @staticmethod
+    def proxy(base_url, request):
+        """Forward the given request to the given base url, return its response."""
+        headers = dict((name, value) for name, value in request.headers.items()
+                       if name.lower() not in NOT_PROXIED_HEADERS)
+        response = requests.request(request.method, base_url.rstrip('/') + request.url, headers=headers,
+                                    data=request.body, allow_redirects=False, timeout=60)
+        headers = [(name, value) for name, value in response.headers.items() if name.lower() not in NOT_PROXIED_HEADERS]
+        return MockResponse(response.status_code, headers, response.content)
+
+    def get_delay(self, response):
+        """Return the delay (in seconds) of the given stub response definition, falling back to the global delay."""
+        for fixed_delay, distribution in ((response.get('fixedDelayMilliseconds'), response.get('delayDistribution')),
+                                          (self.settings.get('fixedDelay'), self.settings.get('delayDistribution'))):
+            if fixed_delay:
+                return fixed_delay / 1000.0
+            if distribution and distribution.get('type') == 'uniform':
+                return random.uniform(distribution['lower'], distribution['upper']) / 1000.0
+            if distribution and distribution.get('type') == 'lognormal':
+                return random.lognormvariate(math.log(distribution['median']), distribution['sigma']) / 1000.0
+        return 0
+
+    def render_response(self, response, request):
+        """Return the mock response of the given stub response definition."""
+        delay = self.get_delay(response)
+        if delay:
+            time.sleep(delay)
+
+        if response.get('fault'):
+            return MockResponse(None, [], b'', fault=response['fault'])
+
+        if response.get('proxyBaseUrl'):
+            return self.proxy(response['proxyBaseUrl'], request)
+
+        headers = []
+        for name, value in (response.get('headers') or {}).items():
+            headers.extend((name, item) for item in (value if isinstance(value, list) else [value]))
+
+        if 'base64Body' in response:
+            body = base64.b64decode(response['base64Body'])
+        elif 'bodyFileName' in response:
+            with open(os.path.join(self.root_dir or '.', '__files', response['bodyFileName']), 'rb') as body_file:
+                body = body_file.read()
+        elif 'jsonBody' in response:
+            body = six.text_type(json.dumps(response['jsonBody']))
+        else:
+            body = six.text_type(response.get('body', ''))
+
+        if self.global_templating or TEMPLATE_TRANSFORMER in (response.get('transformers') or []):
+            renderer = TemplateRenderer(request)
+            headers = [(name, renderer.render(value)) for name, value in headers]
+            if isinstance(body, six.text_type):
+                body = renderer.render(body)
+
+        if isinstance(body, six.text_type):
+            body = body.encode('utf-8')
+
+        dribble = response.get('chunkedDribbleDelay')
+        if dribble and body:
+            chunks = max(1, min(dribble['numberOfChunks'], len(body)))
+            return MockResponse(response.get('status', 200), headers, body, chunks=chunks,
+                                chunk_delay=dribble['totalDuration'] / 1000.0 / chunks)
+
+        return MockResponse(response.get('status', 200), headers, body)
+
+    def handle_admin(self, request):
+        """Handle an admin API request."""
+        path = request.path[len(ADMIN_PREFIX):]
+        for method, pattern, handler in self.routes:
+            match = re.match(pattern, path)
+            if match and method == request.method:
+                try:
+                    payload = json.loads(request.body_text) if request.body else None
+                except ValueError as error:
+                    return self.json_response(400, {"errors": [{"title": "Invalid json: %s" % error}]})
+
+                status, result = handler(request, payload, **match.groupdict())
+                return self.json_response(status, result)
+
+        return self.json_response(404, {"errors": [{"title": "Unsupported admin API call"}]})
+
+    @staticmethod
+    def json_response(status, result):
+        body = b'' if result is None else json.dumps(result).encode('utf-8')
+        return MockResponse(status, [('Content-Type', 'application/json')], body)
+
+    def get_root(self, request, payload):
+        return 200, {"status": "ok"}
+
+    def get_mappings(self, request, payload):
+        with self.lock:
+            mappings = list(reversed(self.mappings.values()))
+        return 200, {"mappings": mappings, "meta": {"total": len(mappings)}}
+
+    def create_mapping(self, request, payload):
+        return 201, self.add_mapping(payload)
+
+    def delete_mappings(self, request, payload):
+        with self.lock:
+            self.mappings.clear()
+        return 200, None
+
+    def reset_mappings(self, request, payload):
+        self.load_default_mappings()
+        return 200, None
+
+    def import_mappings(self, request, payload):
+        payload = payload or {}
+        options = payload.get('importOptions') or {}
+        stubs = payload.get('mappings') or []
+        with self.lock:
+            if options.get('deleteAllNotInImport'):
+                self.mappings.clear()
+            for stub in stubs:
+                stub_id = stub.get('id') or stub.get('uuid')
+                if stub_id in self.mappings and options.get('duplicatePolicy') == 'IGNORE':
+                    continue
+                self.add_mapping(stub)
+        return 200, None
+
+    def get_mapping(self, request, payload, stub_id):
+        with self.lock:
+            stub = self.mappings.get(stub_id)
+        if stub is None:
+            return 404, None
+        return 200, stub
+
+    def update_mapping(self, request, payload, stub_id):
+        with self.lock:
+            if stub_id not in self.mappings:
+                return 404, None
+            stub = dict(payload, id=stub_id, uuid=stub_id)
+            self.mappings[stub_id] = stub
+        return 200, stub
+
+    def delete_mapping(self, request, payload, stub_id):
+        with self.lock:
+            if self.mappings.pop(stub_id, None) is None:
+                return 404, None
+        return 200, None
+
+    def get_requests(self, request, payload):
+        since = request.query.get('since', [None])[0]
+        limit = request.query.get('limit', [None])[0]
+        stub_id = request.query.get('matchingStub', [None])[0]
+
+        with self.lock:
+            serve_events = list(reversed(self.journal))
+
+        total = len(serve_events)
+        if since is not None:
+            since = parse_date_string(since)
+            serve_events = [event for logged, event in serve_events if logged.logged_date > since]
+        else:
+            serve_events = [event for _, event in serve_events]
+        if stub_id is not None:
+            serve_events = [event for event in serve_events if event.get('stubMapping', {}).get('id') == stub_id]
+        if limit is not None:
+            serve_events = serve_events[:int(limit)]
+
+        return 200, {"requests": serve_events, "meta": {"total": total}, "requestJournalDisabled": False}
+
+    def delete_requests(self, request, payload):
+        with self.lock:
+            self.journal.clear()
+        return 200, None
+
+    def get_matching_requests(self, pattern):
+        """Return the journal requests (oldest first) matching the given request pattern."""
+        with self.lock:
+            logged_requests = [logged for logged, _ in self.journal]
+        return [logged.to_dict() for logged in logged_requests if match_request(pattern or {}, logged)]
+
+    def find_requests(self, request, payload):
+        return 200, {"requests": self.get_matching_requests(payload)}
+
+    def count_requests(self, request, payload):
+        return 200, {"count": len(self.get_matching_requests(payload))}
+
+    def get_settings(self, request, payload):
+        with self.lock:
+            return 200, {"settings": dict(self.settings)}
+
+    def update_settings(self, request, payload):
+        with self.lock:
+            self.settings = dict(payload or {})
+        return 200, None
+
+    def get_scenarios(self, request, payload):
+        with self.lock:
+            names = set(stub['scenarioName'] for stub in self.mappings.values() if stub.get('scenarioName'))
+            return 200, {"scenarios": [{"id": name, "name": name, "state": self.scenarios.get(name, STARTED_STATE)}
+                                       for name in sorted(names)]}
+
+    def reset_scenarios(self, request, payload):
+        with self.lock:
+            self.scenarios.clear()
+        return 200, None
+
+    def get_recorded_stubs(self, since=None):
+        """Return the stubs of the proxied journal requests, logged after the given time (a stub per request)."""
+        with self.lock:
+            serve_events = [event for logged, event in self.journal
+                            if 'response' in event and (since is None or logged.logged_date >= since)]
+
+        stubs = collections.OrderedDict()
+        for serve_event in serve_events:
+            key = (serve_event["request"]["method"], serve_event["request"]["url"])
+            if key not in stubs:
+                stubs[key] = get_recorded_stub(serve_event)
+        return list(stubs.values())
+
+    def start_recording(self, request, payload):
+        with self.lock:
+            if self.recording is not None:
+                return 409, {"errors": [{"title": "Already recording"}]}
+
+            proxy_stub = self.add_mapping({"priority": PROXY_STUB_PRIORITY,
+                                           "request": {"method": "ANY"},
+                                           "response": {"proxyBaseUrl": payload["targetBaseUrl"]}})
+            self.recording = (proxy_stub['id'], time.time())
+        return 200, None
+
+    def stop_recording(self, request, payload):
+        with self.lock:
+            if self.recording is None:
+                return 400, {"errors": [{"title": "Not recording"}]}
+
+            proxy_stub_id, start_time = self.recording
+            self.mappings.pop(proxy_stub_id, None)
+            self.recording = None
+        return 200, {"mappings": self.get_recorded_stubs(since=start_time)}
+
+    def snapshot_recording(self, request, payload):
+        return 200, {"mappings": self.get_recorded_stubs()}
+
+    def get_recording_status(self, request, payload):
+        with self.lock:
+            return 200, {"status": "Recording" if self.recording is not None else "Stopped"}
+
+    def reset(self, request, payload):
+        self.load_default_mappings()
+        self.delete_requests(request, payload)
+        return 200, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WireMock compatible mock HTTP server.')
+    parser.add_argument('--host', default='0.0.0.0', help='host to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on')
+    parser.add_argument('--root-dir', help="directory holding the default stubs ('mappings') and files ('__files')")
+    parser.add_argument('--max-request-journal-entries', type=int, help='max number of requests kept in the journal')
+    parser.add_argument('--global-response-templating', action='store_true', help='render all responses as templates')
+    parser.add_argument('--verbose', action='store_true', help='log the received requests')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    server = MockServer(host=args.host, port=args.port, root_dir=args.root_dir,
+                        max_journal_entries=args.max_request_journal_entries,
+                        global_templating=args.global_response_templating)
+    log.info("Mock server listening on %s:%d", args.host, args.port)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Environment affinity based tests ordering.
+
+Tests declare the services they require and the services they disrupt (see `BaseDockerTest.REQUIRED_SERVICES` and
+`BaseDockerTest.DISRUPTS`). Tests requiring the same services are grouped together, keeping the groups in their
+original order, and within each group the disruptive tests run last - so the restarts & recovery waits they cause are
+paid once per group instead of by every following test.
+"""
+import logging
+import unittest
+
+log = logging.getLogger(__name__)
+
+
+def get_required_services(test_class):
+    """Return the services the given test class requires, None if it requires all the environment services."""
+    required_services = getattr(test_class, 'REQUIRED_SERVICES', None)
+    return None if required_services is None else frozenset(required_services)
+
+
+def get_disrupted_services(test_class):
+    """Return the services the given test class disrupts, None if it disrupts the whole environment (DISRUPTS = True).
+
+    :return tuple: sorted services names (empty if the test class is not disruptive), or None.
+    """
+    disrupts = getattr(test_class, 'DISRUPTS', False)
+    if disrupts is True:
+        return None
+
+    return tuple(sorted(disrupts or ()))
+
+
+def get_order_key(test_class):
+    """Return the in-group sort key of the given test class - non disruptive tests first, whole environment disruptive
+    tests last, tests disrupting the same services next to each other."""
+    disrupted_services = get_disrupted_services(test_class)
+    if disrupted_services is None:
+        return 2, ()
+
+    return (1 if disrupted_services else 0), disrupted_services
+
+
+def order(tests, get_test_class=type):
+    """Return the given tests ordered by environment affinity.
+
+    :param list tests: the tests to order.
+    :param callable get_test_class: returns the class holding the environment declarations of a test.
+    :return list: the ordered tests.
+    """
+    groups = {}
+    groups_order = []
+    for test in tests:
+        required_services = get_required_services(get_test_class(test))
+        if required_services not in groups:
+            groups[required_services] = []
+            groups_order.append(required_services)
+        groups[required_services].append(test)
+
+    ordered_tests = []
+    for required_services in groups_order:
+        # Sorting is stable, keeping the original order of tests of the same key
+        ordered_tests.extend(sorted(groups[required_services], key=lambda test: get_order_key(get_test_class(test))))
+
+    log.debug("Ordered %d tests in %d environment groups", len(ordered_tests), len(groups_order))
+    return ordered_tests
+
+
+def get_tests_services(tests, get_test_class=type):
+    """Return the union of the services required by the given tests, None if one of them requires all the services.
+
+    :param tests: the tests (e.g. the selected tests).
+    :param callable get_test_class: returns the class holding the environment declarations of a test.
+    :return list: sorted services names, or None.
+    """
+    services = set()
+    for test in tests:
+        required_services = get_required_services(get_test_class(test))
+        if required_services is None:
+            return None
+        services.update(required_services)
+
+    return sorted(services)
+
+
+def get_items_services(items):
+    """Return the union of the services required by the given pytest items (see `get_tests_services`)."""
+    return get_tests_services(items, get_test_class=lambda item: getattr(item, 'cls', None))
+
+
+def iter_tests(suite):
+    """Iterate the tests of the given (possibly nested) unittest suite."""
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            for nested_test in iter_tests(test):
+                yield nested_test
+        else:
+            yield test
+
+
+def order_suite(suite):
+    """Return a flat unittest suite of the given suite tests, ordered by environment affinity."""
+    return unittest.TestSuite(order(list(iter_tests(suite))))
+
+
+def order_items(items):
+    """Order the given pytest items in place by environment affinity (for `pytest_collection_modifyitems`)."""
+    items[:] = order(items, get_test_class=lambda item: getattr(item, 'cls', None))
@@ -1,6 +1,7 @@
 # pylint: disable=unused-argument
 from nose2.events import Plugin
 
+from docker_test_tools import ordering
 from docker_test_tools.config import Config
 from docker_test_tools.environment import EnvironmentController
 
@@ -20,6 +21,20 @@ class EnvironmentPlugin(Plugin):
             log_path=self.config.as_str('log-path', Config.DEFAULT_LOG_PATH),
             project_name=self.config.as_str('project-name', Config.DEFAULT_PROJECT_NAME),
             collect_stats=self.config.as_bool('collect-stats', Config.DEFAULT_COLLECT_STATS),
+            stats_backend=self.config.as_str('stats-backend', Config.DEFAULT_STATS_BACKEND),
+            stats_rate=self.config.as_float('stats-rate', Config.DEFAULT_STATS_RATE),
+            stats_format=self.config.as_str('stats-format', Config.DEFAULT_STATS_FORMAT),
+            stats_downsample=self.config.as_int('stats-downsample', Config.DEFAULT_STATS_DOWNSAMPLE),
+            baseline_path=self.config.as_str('baseline-path', Config.DEFAULT_BASELINE_PATH),
+            baseline_mode=self.config.as_str('baseline-mode', Config.DEFAULT_BASELINE_MODE),
+            baseline_thresholds=self.config.as_str('baseline-thresholds', Config.DEFAULT_BASELINE_THRESHOLDS),
+            metrics_port=self.config.as_int('metrics-port', Config.DEFAULT_METRICS_PORT),
+            order_tests=self.config.as_bool('order-tests', Config.DEFAULT_ORDER_TESTS),
+            lazy_services=self.config.as_bool('lazy-services', Config.DEFAULT_LAZY_SERVICES),
+            background_teardown=self.config.as_bool('background-teardown', Config.DEFAULT_BACKGROUND_TEARDOWN),
+            stop_timeout=self.config.as_int('stop-timeout', Config.DEFAULT_STOP_TIMEOUT),
+            reap_stale_projects=self.config.as_bool('reap-stale-projects', Config.DEFAULT_REAP_STALE_PROJECTS),
+            state_dir=self.config.as_str('state-dir', Config.DEFAULT_STATE_DIR),
             reuse_containers=self.config.as_bool('reuse-containers', Config.DEFAULT_REUSE_CONTAINERS),
             docker_compose_path=self.config.as_str('docker-compose-path', Config.DEFAULT_DOCKER_COMPOSE_PATH)
         )
@@ -27,10 +42,26 @@ class EnvironmentPlugin(Plugin):
             log_path=config.log_path,
             project_name=config.project_name,
             collect_stats=config.collect_stats,
+            stats_backend=config.stats_backend,
+            stats_rate=config.stats_rate,
+            stats_format=config.stats_format,
+            stats_downsample=config.stats_downsample,
+            baseline_path=config.baseline_path,
+            baseline_mode=config.baseline_mode,
+            baseline_thresholds=config.baseline_thresholds,
+            metrics_port=config.metrics_port,
             compose_path=config.docker_compose_path,
             reuse_containers=config.reuse_containers,
+            lazy_services=config.lazy_services,
+            background_teardown=config.background_teardown,
+            stop_timeout=config.stop_timeout,
+            reap_stale_projects=config.reap_stale_projects,
+            state_dir=config.state_dir,
         )
-        self.controller.setup()
+        self.controller.setup(services=ordering.get_tests_services(ordering.iter_tests(event.suite)))
+
+        if config.order_tests:
+            event.suite = ordering.order_suite(event.suite)
 
     def startTest(self, event):
         """Run on test start.
@@ -46,3 +77,13 @@ class EnvironmentPlugin(Plugin):
         """Tears down the environment using docker commands."""
         if self.controller:
             self.controller.teardown()
+
+    def wasSuccessful(self, event):
+        """Fail the test run on containers resource regressions."""
+        if self.controller and self.controller.baseline_path:
+            # The stats baseline is checked on teardown, which may still run in the background
+            self.controller.wait_for_teardown()
+
+        report = self.controller.regression_report if self.controller else None
+        if report is not None and not report.passed:
+            event.success = False
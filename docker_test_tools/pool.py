@@ -0,0 +1,266 @@
+"""Pool of identical environments (replicas), for running tests which are not safe to run concurrently against shared
+containers in parallel.
+
+Each replica is a distinct compose project with its own logs & stats directory (see `sharding`). Tests lease a single
+replica at a time - the scheduler hands every test to whichever replica frees up first, and a replica marked dirty by a
+test (`controller.mark_dirty()`) is recycled (torn down and set up again as a new generation, in the background) before
+being leased again. In double-buffer mode, the new generation is set up while the dirty one is torn down. A replica
+which failed recycling is dropped from the pool, and once no replicas are left the leases fail instead of waiting.
+"""
+import logging
+import threading
+import unittest
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+from six.moves import queue
+
+from docker_test_tools import sharding
+from docker_test_tools import ordering
+from docker_test_tools.environment import EnvironmentController
+
+log = logging.getLogger(__name__)
+
+
+class EnvironmentPoolError(Exception):
+    pass
+
+
+class Replica(object):
+    """A single environment of the pool.
+
+    :ivar int index: the replica index in the pool.
+    :ivar int generation: number of times the replica was recycled.
+    :ivar EnvironmentController controller: the replica environment controller.
+    """
+
+    def __init__(self, index, generation, controller):
+        self.index = index
+        self.generation = generation
+        self.controller = controller
+
+    @property
+    def name(self):
+        return get_replica_name(self.index, self.generation)
+
+
+def get_replica_name(index, generation=0):
+    """Return the name of the given replica generation, used as its worker id."""
+    return 'replica%d' % index if generation == 0 else 'replica%d-%d' % (index, generation)
+
+
+class EnvironmentPool(object):
+    """Pool of identical environments.
+
+    Usage example:
+
+    >>> pool = EnvironmentPool(Config(config_path='test.cfg'), size=4)
+    >>> pool.setup()
+    >>> try:
+    >>>     with pool.lease(name='test_example') as controller:
+    >>>         controller.kill_container('consul.service')
+    >>>         controller.mark_dirty()
+    >>>
+    >>>     pool.run_suite(unittest.defaultTestLoader.discover('tests'), result=unittest.TestResult())
+    >>> finally:
+    >>>     pool.teardown()
+    """
+
+    def __init__(self, config_object, size, double_buffer=False):
+        """Initialize the environments pool.
+
+        :param Config config_object: the environment configuration, each replica derives its own project name and
+            logs & stats directory from it.
+        :param int size: number of replicas.
+        :param bool double_buffer: set up the next generation of a dirty replica (a distinct compose project) while
+            the dirty one is torn down, instead of after it. Requires the resources of an extra environment per
+            recycled replica.
+        """
+        self.config = config_object
+        self.size = size
+        self.double_buffer = double_buffer
+        self.replicas = []
+        self.live = 0
+        self.available = queue.Queue()
+        self.replicas_lock = threading.Lock()
+        self.recycles = []
+        self.regression_report = None
+
+        # Used for setting up, tearing down and recycling the replicas concurrently
+        self.pool = ThreadPool(processes=size * 2 if double_buffer else size)
+
+    def _create_replica(self, index, generation=0):
+        worker_config = sharding.get_worker_config(self.config, get_replica_name(index, generation))
+        return Replica(index=index, generation=generation, controller=EnvironmentController.from_config(worker_config))
+
+    def setup(self):
+        """Set up all the replicas concurrently."""
+        log.info("Setting up %d environment replicas", self.size)
+        sharding.clear_worker_dirs(self.config)
+        self.replicas = [self._create_replica(index) for index in range(self.size)]
+        self.pool.map(lambda replica: replica.controller.setup(), self.replicas)
+        self.live = len(self.replicas)
+        for replica in self.replicas:
+            self.available.put(replica)
+
+    def teardown(self):
+        """Tear down all the replicas concurrently (once the pending recycles finish) and merge their reports."""
+        for recycle in self.recycles:
+            recycle.wait()
+
+        # Replicas which failed recycling were already torn down
+        replicas = [replica for replica in self.replicas if replica is not None]
+        log.info("Tearing down %d environment replicas", len(replicas))
+        self.pool.map(self._teardown_replica, replicas)
+        self.pool.close()
+        self.pool.join()
+        self.regression_report = sharding.merge_worker_reports(self.config)
+
+    @staticmethod
+    def _teardown_replica(replica):
+        try:
+            # Already off the tests critical path, and the reports are merged once all the replicas are torn down
+            replica.controller.teardown(background=False)
+        except:
+            log.exception("Failed tearing down environment replica %s", replica.name)
+
+    @contextmanager
+    def lease(self, name=None, timeout=None):
+        """Lease a replica for the context duration, waiting for one to free up.
+
+        :param str name: the lease name (e.g. the test name), written to the replica logs & stats.
+        :param float timeout: max time (in seconds) to wait for a replica, None to wait forever.
+        :raise EnvironmentPoolError: if no replica freed up within the timeout, or all the replicas failed recycling.
+        """
+        try:
+            replica = self.available.get(timeout=timeout)
+        except queue.Empty:
+            raise EnvironmentPoolError("No environment replica freed up within %s seconds" % timeout)
+
+        if replica is None:
+            # Put back for the other waiting leases
+            self.available.put(None)
+            raise EnvironmentPoolError("All the environment replicas failed recycling")
+
+        log.debug("Leasing environment replica %s to %s", replica.name, name)
+        if name is not None:
+            replica.controller.update_plugins(name)
+
+        try:
+            yield replica.controller
+        finally:
+            self.release(replica)
+
+    def release(self, replica):
+        """Return the given replica to the pool, recycling it first if it was marked dirty."""
+        if not replica.controller.dirty:
+            self.available.put(replica)
+            return
+
+        log.info("Environment replica %s was marked dirty, recycling it", replica.name)
+        if self.double_buffer:
+            self.recycles.append(self.pool.apply_async(self._teardown_replica, (replica,)))
+        self.recycles.append(self.pool.apply_async(self._recycle, (replica, not self.double_buffer)))
+
+    def _recycle(self, replica, teardown=True):
+        if teardown:
+            self._teardown_replica(replica)
+        try:
+            new_replica = self._create_replica(replica.index, replica.generation + 1)
+            new_replica.controller.setup()
+        except:
+            log.exception("Failed recycling environment replica %s, the pool shrinks by one replica", replica.name)
+            with self.replicas_lock:
+                self.replicas[replica.index] = None
+                self.live -= 1
+                depleted = self.live == 0
+
+            if depleted:
+                log.error("All the environment replicas failed recycling, failing the pending leases")
+                self.available.put(None)
+            return
+
+        with self.replicas_lock:
+            self.replicas[replica.index] = new_replica
+        self.available.put(new_replica)
+
+    def run(self, tests, timeout=None):
+        """Run the given tests on the replicas, each test on whichever replica frees up first.
+
+        :param list tests: list of (name, callable) tuples, the callables are called with the leased controller.
+        :param float timeout: max time (in seconds) for a test to wait for a replica, None to wait forever.
+        :return list: the tests results (or the raised exceptions), in the given tests order.
+        """
+        def run_test(test):
+            name, test_callable = test
+            try:
+                with self.lease(name=name, timeout=timeout) as controller:
+                    return test_callable(controller)
+            except Exception as error:
+                return error
+
+        scheduler = ThreadPool(processes=self.size)
+        try:
+            # Every scheduler thread holds a single lease at a time and picks the next test once done
+            return scheduler.map(run_test, tests, chunksize=1)
+        finally:
+            scheduler.close()
+            scheduler.join()
+
+    def run_suite(self, suite, result, timeout=None):
+        """Run the given unittest suite on the replicas, assigning the leased controller to each test.
+
+        The tests of a class run together on a single lease (in a suite of their own, so the class & module fixtures
+        run), the classes run on whichever replica frees up first.
+
+        :param unittest.TestSuite suite: the tests to run.
+        :param unittest.TestResult result: the result to collect the tests outcomes into.
+        :param float timeout: max time (in seconds) for a tests class to wait for a replica, None to wait forever.
+        :return unittest.TestResult: the given result.
+        """
+        result_lock = threading.Lock()
+
+        def run_class(controller, class_tests):
+            for test in class_tests:
+                test.controller = controller
+
+            class_result = LeaseTestResult(controller)
+            unittest.TestSuite(class_tests)(class_result)
+            with result_lock:
+                merge_results(result, class_result)
+
+        classes_tests = []
+        for test in ordering.iter_tests(suite):
+            if classes_tests and classes_tests[-1][0].__class__ is test.__class__:
+                classes_tests[-1].append(test)
+            else:
+                classes_tests.append([test])
+
+        # The lease is named by each test (see LeaseTestResult)
+        tests = [(None, lambda controller, class_tests=class_tests: run_class(controller, class_tests))
+                 for class_tests in classes_tests]
+        for class_tests, outcome in zip(classes_tests, self.run(tests, timeout=timeout)):
+            if isinstance(outcome, EnvironmentPoolError):
+                with result_lock:
+                    result.errors.extend((test, str(outcome)) for test in class_tests)
+
+        return result
+
+
+class LeaseTestResult(unittest.TestResult):
+    """Test result marking the leased controller logs & stats with the name (id) of each test it runs."""
+
+    def __init__(self, controller):
+        super(LeaseTestResult, self).__init__()
+        self.controller = controller
+
+    def startTest(self, test):
+        self.controller.update_plugins(test.id())
+        super(LeaseTestResult, self).startTest(test)
+
+
+def merge_results(result, test_result):
+    """Merge the outcomes collected by the given test result into the given result."""
+    result.testsRun += test_result.testsRun
+    for outcomes in ('errors', 'failures', 'skipped', 'expectedFailures', 'unexpectedSuccesses'):
+        getattr(result, outcomes).extend(getattr(test_result, outcomes))
@@ -0,0 +1,131 @@
+"""Fast, docker API based removal of compose projects.
+
+Instead of `docker-compose down` (which stops the containers one after the other, waiting up to the stop timeout for
+each), the project containers are killed (or stopped with a short timeout) and removed concurrently, along with their
+anonymous volumes and the project networks. The same removal reaps stale projects left behind by crashed runs.
+"""
+import re
+import time
+import docker
+import logging
+from multiprocessing.pool import ThreadPool
+
+log = logging.getLogger(__name__)
+
+PROJECT_LABEL = 'com.docker.compose.project'
+SERVICE_LABEL = 'com.docker.compose.service'
+RUNNING_STATES = ('running', 'paused', 'restarting')
+PARALLELISM = 8
+
+# Suffixes of the project names derived by the xdist workers (see `sharding`) and the pool replicas (see `pool`)
+DERIVED_PROJECT_SUFFIX = re.compile(r'-(gw\d+|replica\d+(-\d+)?)$')
+
+
+class ShutdownResult(object):
+    """Result of shutting down a single container.
+
+    :ivar str name: the container name.
+    :ivar str service: the container compose service.
+    :ivar float duration: the time (in seconds) it took to stop & remove the container.
+    :ivar Exception error: the raised error, None if the container was removed.
+    """
+
+    def __init__(self, name, service, duration, error=None):
+        self.name = name
+        self.service = service
+        self.duration = duration
+        self.error = error
+
+    def __repr__(self):
+        return '<ShutdownResult %s (%.2fs)%s>' % (self.name, self.duration, ' failed' if self.error else '')
+
+
+def normalize_project_name(project_name):
+    """Return the given project name as docker-compose labels the project resources."""
+    return re.sub(r'[^-_a-z0-9]', '', project_name.lower())
+
+
+def matches_project(labels, project_name, derived=False):
+    """Return True if the given resource labels belong to the given (normalized) project.
+
+    :param bool derived: also match the projects derived from the given project (`<project>-gw0`,
+        `<project>-replica0` or `<project>-replica0-1`), but not other projects sharing its prefix (`<project>-api`).
+    """
+    value = (labels or {}).get(PROJECT_LABEL, '')
+    if value == project_name:
+        return True
+
+    return derived and value.startswith(project_name) and \
+        DERIVED_PROJECT_SUFFIX.match(value[len(project_name):]) is not None
+
+
+def shutdown_container(docker_client, container, stop_timeout=0):
+    """Stop and remove the given container, along with its anonymous volumes.
+
+    :param docker.APIClient docker_client: the docker API client.
+    :param dict container: the container, as listed by the docker API.
+    :param int stop_timeout: seconds to wait for the container to stop before killing it, 0 to kill it right away.
+    :return ShutdownResult: the shutdown result.
+    """
+    start_time = time.time()
+    error = None
+    try:
+        if stop_timeout and container['State'] in RUNNING_STATES:
+            docker_client.stop(container['Id'], timeout=stop_timeout)
+
+        # A forced removal kills the container if it's still running
+        docker_client.remove_container(container['Id'], v=True, force=True)
+
+    except docker.errors.NotFound:
+        pass  # Already removed (e.g. an auto removed container)
+
+    except docker.errors.APIError as api_error:
+        error = api_error
+
+    return ShutdownResult(name=container['Names'][0].lstrip('/'),
+                          service=(container.get('Labels') or {}).get(SERVICE_LABEL, ''),
+                          duration=time.time() - start_time,
+                          error=error)
+
+
+def remove_project(docker_client, project_name, stop_timeout=0, derived=False, parallelism=PARALLELISM):
+    """Remove the given compose project containers (with their anonymous volumes) and networks.
+
+    :param docker.APIClient docker_client: the docker API client.
+    :param str project_name: the compose project name.
+    :param int stop_timeout: seconds to wait for each container to stop before killing it, 0 to kill right away.
+    :param bool derived: also remove the projects derived from the given project (e.g. `<project>-gw0`).
+    :param int parallelism: max number of containers removed concurrently.
+    :return list: the containers shutdown results (ShutdownResult), slowest first.
+    :raise RuntimeError: if some of the resources could not be removed (after attempting to remove all of them).
+    """
+    project_name = normalize_project_name(project_name)
+    containers = [container for container in docker_client.containers(all=True, filters={'label': PROJECT_LABEL})
+                  if matches_project(container.get('Labels'), project_name, derived)]
+
+    pool = ThreadPool(processes=max(min(len(containers), parallelism), 1))
+    try:
+        results = pool.map(lambda container: shutdown_container(docker_client, container, stop_timeout),
+                           containers)
+    finally:
+        pool.close()
+        pool.join()
+
+    errors = ['%s: %s' % (result.name, result.error) for result in results if result.error]
+
+    # The networks are removed once they have no containers attached
+    for network in docker_client.networks(filters={'label': PROJECT_LABEL}):
+        if not matches_project(network.get('Labels'), project_name, derived):
+            continue
+
+        try:
+            docker_client.remove_network(network['Id'])
+        except docker.errors.NotFound:
+            pass
+        except docker.errors.APIError as error:
+            errors.append('%s: %s' % (network['Name'], error))
+
+    if errors:
+        raise RuntimeError("Failed removing project %s resources: %s" % (project_name, '; '.join(errors)))
+
+    return sorted(results, key=lambda result: result.duration, reverse=True)
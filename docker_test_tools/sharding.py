@@ -0,0 +1,289 @@
+"""Utilities for running the tests on parallel workers (e.g. pytest-xdist), each worker with its own environment.
+
+Every worker gets a derived compose project name, its own logs & stats directory and an ephemeral metrics port, so
+several environments of the same compose file can run side by side on one host (publish the services ports on
+ephemeral host ports and address them using `EnvironmentController.service_url`).
+
+Alternatively, workers may share a single (read-only) environment - the first worker to start sets it up and the last
+worker to finish tears it down, coordinated using a cross-process lock and a reference count.
+
+Once all the workers finish, their logs and stats summaries are merged into the main log & stats paths.
+"""
+import os
+import re
+import io
+import copy
+import glob
+import json
+import fcntl
+import shutil
+import logging
+from contextlib import contextmanager
+
+from docker_test_tools import stats
+from docker_test_tools import baseline
+from docker_test_tools.environment import EnvironmentController
+
+log = logging.getLogger(__name__)
+
+# Environment variables set by pytest-xdist on its workers
+WORKER_ENV_VAR = 'PYTEST_XDIST_WORKER'
+TEST_RUN_ENV_VAR = 'PYTEST_XDIST_TESTRUNUID'
+
+WORKERS_DIR_NAME = 'workers'
+RAW_SUMMARY_FILE_NAME = 'summary.raw.json'
+WORKER_LOG_HEADER = u'\n>>> Worker {worker_id} logs\n\n'
+
+
+def get_worker_id():
+    """Return the current worker id (e.g. 'gw0'), None if not running on a worker."""
+    return os.environ.get(WORKER_ENV_VAR)
+
+
+def is_xdist_controller(pytest_config):
+    """Return True if the given pytest config belongs to an xdist controller process (which runs no tests)."""
+    return getattr(pytest_config.option, 'dist', 'no') != 'no' and not hasattr(pytest_config, 'workerinput')
+
+
+def get_worker_project_name(project_name, worker_id):
+    """Return the compose project name of the given worker."""
+    return '%s-%s' % (project_name, worker_id)
+
+
+def get_worker_dir(log_path, worker_id):
+    """Return the logs & stats directory of the given worker."""
+    return os.path.join(os.path.dirname(log_path), WORKERS_DIR_NAME, worker_id)
+
+
+def clear_worker_dirs(config_object):
+    """Remove the workers logs & stats directories left by previous runs, so they're not merged into this run."""
+    workers_dir = os.path.join(os.path.dirname(config_object.log_path), WORKERS_DIR_NAME)
+    # The trailing separator matches directories only, the shared environment lock files are kept
+    for worker_dir in glob.glob(os.path.join(workers_dir, '*', '')):
+        log.debug("Removing the worker directory of a previous run: %s", worker_dir)
+        shutil.rmtree(worker_dir, ignore_errors=True)
+
+
+def get_worker_config(config_object, worker_id, shared=False):
+    """Return a copy of the given environment config, adjusted for the given worker.
+
+    :param Config config_object: the environment configuration.
+    :param str worker_id: the worker id.
+    :param bool shared: whether the worker shares the environment with the other workers (keeping the project name).
+    :return Config: the worker environment configuration.
+    """
+    worker_config = copy.copy(config_object)
+    worker_dir = get_worker_dir(config_object.log_path, worker_id)
+    if not os.path.exists(worker_dir):
+        os.makedirs(worker_dir)
+
+    worker_config.log_path = os.path.join(worker_dir, os.path.basename(config_object.log_path))
+    if not shared:
+        worker_config.project_name = get_worker_project_name(config_object.project_name, worker_id)
+
+    if config_object.metrics_port is not None:
+        worker_config.metrics_port = 0
+
+    # Each worker runs a subset of the tests, the baseline is compared against the merged stats summary
+    worker_config.baseline_path = None
+    return worker_config
+
+
+class WorkerEnvironment(object):
+    """The environment of a single test worker.
+
+    Usage example (conftest.py):
+
+    >>> environment = WorkerEnvironment(Config(config_path='pytest.cfg'))
+    >>>
+    >>> def pytest_configure(config):
+    >>>     environment.setup(pytest_config=config)
+    >>>
+    >>> def pytest_sessionfinish(session, exitstatus):
+    >>>     environment.teardown(pytest_config=session.config)
+    """
+
+    def __init__(self, config_object, worker_id=None, shared=False):
+        """Initialize the worker environment.
+
+        :param Config config_object: the environment configuration.
+        :param str worker_id: the worker id, detected from the environment variables if not given.
+        :param bool shared: whether to share a single environment between all the workers.
+        """
+        self.config = config_object
+        self.worker_id = worker_id if worker_id is not None else get_worker_id()
+        self.shared = shared
+        self.controller = None
+        self.regression_report = None
+
+        state_dir = os.path.join(os.path.dirname(os.path.abspath(config_object.log_path)), WORKERS_DIR_NAME)
+        self.lock_path = os.path.join(state_dir, '%s.lock' % config_object.project_name)
+        self.refcount_path = os.path.join(state_dir, '%s.refcount' % config_object.project_name)
+
+    def get_controller(self):
+        """Return the environment controller of the worker (created on the first call)."""
+        if self.controller is None:
+            worker_config = self.config
+            if self.worker_id is not None:
+                worker_config = get_worker_config(self.config, self.worker_id, shared=self.shared)
+            self.controller = EnvironmentController.from_config(worker_config)
+        return self.controller
+
+    def setup(self, pytest_config=None):
+        """Set up the worker environment, nothing is set up on the xdist controller process."""
+        if pytest_config is not None and is_xdist_controller(pytest_config):
+            # The workers start once the controller is configured
+            clear_worker_dirs(self.config)
+            return
+
+        controller = self.get_controller()
+        if self.worker_id is None or not self.shared:
+            controller.setup()
+            return
+
+        with self.shared_lock():
+            references = self._read_references()
+            if references == 0:
+                log.debug("Setting up the shared environment %s", self.config.project_name)
+                controller.cleanup()
+                controller.up()
+            self._write_references(references + 1)
+
+        controller.start_plugins()
+
+    def teardown(self, pytest_config=None):
+        """Tear down the worker environment, on the xdist controller process merge the workers reports instead."""
+        if pytest_config is not None and is_xdist_controller(pytest_config):
+            self.regression_report = merge_worker_reports(self.config)
+            return
+
+        controller = self.get_controller()
+        if self.worker_id is None or not self.shared:
+            # The xdist controller merges the workers reports once they finish, so workers tear down in the foreground
+            controller.teardown(background=False if self.worker_id is not None else None)
+            if controller.baseline_path:
+                controller.wait_for_teardown()
+            self.regression_report = controller.regression_report
+            return
+
+        try:
+            controller.stop_plugins()
+        finally:
+            with self.shared_lock():
+                references = max(self._read_references() - 1, 0)
+                if references == 0:
+                    log.debug("Tearing down the shared environment %s", self.config.project_name)
+                    controller.cleanup()
+                self._write_references(references)
+
+    @contextmanager
+    def shared_lock(self):
+        """Cross-process lock of the shared environment state."""
+        if not os.path.exists(os.path.dirname(self.lock_path)):
+            try:
+                os.makedirs(os.path.dirname(self.lock_path))
+            except OSError:
+                pass  # Created by another worker
+
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_references(self):
+        """Return the number of workers using the shared environment, references of previous runs are ignored."""
+        if not os.path.exists(self.refcount_path):
+            return 0
+
+        with open(self.refcount_path) as refcount_file:
+            state = json.load(refcount_file)
+        return state['references'] if state.get('run') == os.environ.get(TEST_RUN_ENV_VAR) else 0
+
+    def _write_references(self, references):
+        with open(self.refcount_path, 'w') as refcount_file:
+            json.dump({'run': os.environ.get(TEST_RUN_ENV_VAR), 'references': references}, refcount_file)
+
+
+def merge_stats_summaries(summaries, project_name):
+    """Merge the stats summaries of the workers into a single summary.
+
+    The workers containers of the same service are merged (worst min & max, average of the averages), the per test
+    stats are kept as is (each test runs on a single worker).
+
+    :param dict summaries: the workers summaries, of format {worker_id: summary}.
+    :param str project_name: the base compose project name.
+    :return dict: the merged summary.
+    """
+    containers = {}
+    tests = {}
+    for worker_id, summary in sorted(summaries.items()):
+        worker_project = re.escape(get_worker_project_name(project_name, worker_id))
+        for name, container in summary.get("containers", {}).items():
+            containers.setdefault(re.sub('^' + worker_project, project_name, name), []).append(container)
+        tests.update(summary.get("tests", {}))
+
+    merged_containers = {}
+    for name, container_summaries in containers.items():
+        merged_containers[name] = dict(
+            (metric, {"min": min(summary[metric]["min"] for summary in container_summaries),
+                      "max": max(summary[metric]["max"] for summary in container_summaries),
+                      "avg": sum(summary[metric]["avg"] for summary in container_summaries) / len(container_summaries)})
+            for metric in container_summaries[0])
+
+    return {"containers": merged_containers, "tests": tests}
+
+
+def merge_worker_reports(config_object):
+    """Merge the workers logs & stats summaries into the main log & stats paths.
+
+    When a stats baseline is configured, the merged stats summary is compared against it (or stored, in 'update' mode).
+
+    :param Config config_object: the (base) environment configuration.
+    :return RegressionReport: the baseline comparison report, or None if no comparison was made.
+    """
+    workers_dir = os.path.join(os.path.dirname(config_object.log_path), WORKERS_DIR_NAME)
+    log_name = os.path.basename(config_object.log_path)
+    worker_ids = sorted(os.path.basename(os.path.dirname(path))
+                        for path in glob.glob(os.path.join(workers_dir, '*', log_name)))
+    log.debug("Merging the reports of workers: %s", worker_ids)
+
+    with io.open(config_object.log_path, 'w', encoding='utf-8') as merged_log:
+        for worker_id in worker_ids:
+            merged_log.write(WORKER_LOG_HEADER.format(worker_id=worker_id))
+            with io.open(os.path.join(workers_dir, worker_id, log_name), encoding='utf-8', errors='replace') as worker_log:
+                for line in worker_log:
+                    merged_log.write(line)
+
+    summaries = {}
+    for worker_id in worker_ids:
+        summary_path = os.path.join(workers_dir, worker_id, 'stats', RAW_SUMMARY_FILE_NAME)
+        if os.path.exists(summary_path):
+            with open(summary_path) as summary_file:
+                summaries[worker_id] = json.load(summary_file)
+
+    if not summaries:
+        return None
+
+    stats_dir = os.path.join(os.path.dirname(config_object.log_path), 'stats')
+    if not os.path.exists(stats_dir):
+        os.makedirs(stats_dir)
+
+    summary = merge_stats_summaries(summaries, config_object.project_name)
+    with open(os.path.join(stats_dir, RAW_SUMMARY_FILE_NAME), 'w') as summary_file:
+        json.dump(summary, summary_file, sort_keys=True, indent=2)
+
+    with open(os.path.join(stats_dir, 'summary.json'), 'w') as summary_file:
+        json.dump(dict((name, stats.format_container_stats(container_stats))
+                       for name, container_stats in summary["containers"].items()),
+                  summary_file, sort_keys=True, indent=2)
+
+    if not config_object.baseline_path:
+        return None
+
+    return baseline.check(summary=summary,
+                          path=config_object.baseline_path,
+                          mode=config_object.baseline_mode,
+                          thresholds=baseline.parse_thresholds(config_object.baseline_thresholds),
+                          report_dir=stats_dir)
@@ -0,0 +1,278 @@
+"""Service state snapshots, for resetting a service state between tests without a full environment cycle.
+
+Two snapshot modes are supported:
+
+* 'volumes': the service named volumes are copied into snapshot volumes (streaming tar within a helper container,
+  while the service is stopped). Restoring re-fills the service volumes from the snapshot volumes and recreates only
+  the service container.
+* 'commit': the service container filesystem is committed to an image. Restoring recreates only the service container
+  from the snapshot image. A commit doesn't capture the contents of volumes - restoring would start the service with
+  empty anonymous volumes (e.g. the data directory VOLUME of database images) and keep the named volumes as they are -
+  so services mounting volumes are snapshot in 'volumes' mode only.
+"""
+import os
+import re
+import time
+import yaml
+import docker
+import logging
+import subprocess
+
+from docker_test_tools import utils
+
+log = logging.getLogger(__name__)
+
+HELPER_IMAGE = 'busybox:latest'
+SNAPSHOT_LABEL = 'com.docker-test-tools.snapshot'
+SNAPSHOT_MODES = ('volumes', 'commit')
+ANONYMOUS_VOLUME_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Helper container commands, the source volumes are mounted under /source/<index> and the target under /target/<index>
+COPY_COMMAND = 'cd /source/{index} && tar cf - . | tar xf - -C /target/{index}'
+CLEAR_COMMAND = 'find /target/{index} -mindepth 1 -delete'
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def to_docker_name(value):
+    """Return the given value as a valid docker image / volume name component."""
+    return re.sub(r'[^a-z0-9_.-]', '-', value.lower())
+
+
+class Snapshot(object):
+    """A service state snapshot.
+
+    :ivar str service: the service name.
+    :ivar str name: the snapshot name.
+    :ivar list volumes: list of (service volume, snapshot volume) tuples, in 'volumes' mode.
+    :ivar str image: the snapshot image, in 'commit' mode.
+    :ivar float duration: the time (in seconds) taking the snapshot took.
+    """
+
+    def __init__(self, service, name, volumes=None, image=None, duration=None):
+        self.service = service
+        self.name = name
+        self.volumes = volumes or []
+        self.image = image
+        self.duration = duration
+
+    @property
+    def mode(self):
+        return 'commit' if self.image else 'volumes'
+
+    def __repr__(self):
+        return '<Snapshot %s of %s (%s)>' % (self.name, self.service, self.mode)
+
+
+class RestoreResult(object):
+    """Result of restoring a service snapshot.
+
+    :ivar Snapshot snapshot: the restored snapshot.
+    :ivar float reset_duration: the time (in seconds) it took to reset the service state and recreate its container.
+    :ivar float ready_duration: the time (in seconds) it took the recreated service to become healthy.
+    """
+
+    def __init__(self, snapshot, reset_duration, ready_duration):
+        self.snapshot = snapshot
+        self.reset_duration = reset_duration
+        self.ready_duration = ready_duration
+
+    @property
+    def duration(self):
+        return self.reset_duration + self.ready_duration
+
+    def __repr__(self):
+        return '<RestoreResult %s reset: %.2fs, ready: %.2fs>' % (self.snapshot, self.reset_duration,
+                                                                  self.ready_duration)
+
+
+class SnapshotManager(object):
+    """Takes and restores the snapshots of an environment services."""
+
+    def __init__(self, controller, helper_image=HELPER_IMAGE):
+        """Initialize the snapshot manager.
+
+        :param EnvironmentController controller: the environment controller.
+        :param str helper_image: image of the helper containers used for copying volumes (requires sh, tar & find).
+        """
+        self.controller = controller
+        self.helper_image = helper_image
+        self.snapshots = {}
+
+    @property
+    def docker_client(self):
+        return self.controller.docker_client
+
+    def get_volumes(self, container_id):
+        """Return the named volumes mounted by the given container (anonymous volumes don't survive recreation)."""
+        mounts = self.docker_client.inspect_container(container_id).get('Mounts') or []
+        return [mount['Name'] for mount in mounts
+                if mount.get('Type') == 'volume' and not ANONYMOUS_VOLUME_PATTERN.match(mount['Name'])]
+
+    def run_helper(self, volumes, commands):
+        """Run the given commands in a helper container.
+
+        :param list volumes: list of (source volume, target volume) tuples, mounted under /source/<index> (read only)
+            and /target/<index>.
+        :param list commands: shell commands to run, in order.
+        """
+        try:
+            self.docker_client.inspect_image(self.helper_image)
+        except docker.errors.ImageNotFound:
+            log.debug("Pulling the snapshots helper image %s", self.helper_image)
+            self.docker_client.pull(self.helper_image)
+
+        binds = {}
+        for index, (source, target) in enumerate(volumes):
+            binds[source] = {'bind': '/source/%d' % index, 'mode': 'ro'}
+            binds[target] = {'bind': '/target/%d' % index, 'mode': 'rw'}
+
+        container = self.docker_client.create_container(
+            image=self.helper_image, command=['sh', '-c', ' && '.join(commands)],
+            host_config=self.docker_client.create_host_config(binds=binds),
+            labels={SNAPSHOT_LABEL: self.controller.project_name})
+        try:
+            self.docker_client.start(container)
+            result = self.docker_client.wait(container)
+            status_code = result['StatusCode'] if isinstance(result, dict) else result
+            if status_code != 0:
+                raise SnapshotError("Snapshot helper container failed (%s): %s" % (
+                    status_code, utils.to_str(self.docker_client.logs(container))))
+        finally:
+            self.docker_client.remove_container(container, force=True)
+
+    def snapshot(self, name, snapshot_name='default', mode='volumes', health_check=None, interval=1, timeout=60):
+        """Take a snapshot of the given service state, once it's healthy.
+
+        :param str name: service name as it appears in the docker compose file.
+        :param str snapshot_name: the snapshot name, an existing snapshot of the same name is replaced.
+        :param str mode: 'volumes' to copy the service named volumes, 'commit' to commit its container filesystem.
+        :param callable health_check: a callable used to determine if the service is healthy.
+        :param int interval: interval (in seconds) between health checks.
+        :param int timeout: timeout (in seconds) for the service to become healthy.
+        :return Snapshot: the taken snapshot.
+        """
+        if mode not in SNAPSHOT_MODES:
+            raise ValueError("Invalid snapshot mode: %r, must be one of %s" % (mode, list(SNAPSHOT_MODES)))
+
+        self.controller.wait_for_health(name=name, health_check=health_check, interval=interval, timeout=timeout)
+        start_time = time.time()
+        container_id = self.controller.get_container_id(name)
+        prefix = '%s_dtt-snapshot-%s-%s' % (to_docker_name(self.controller.project_name), to_docker_name(name),
+                                            to_docker_name(snapshot_name))
+        log.debug("Taking %s snapshot %s of %s", mode, snapshot_name, name)
+
+        if mode == 'commit':
+            mounts = self.docker_client.inspect_container(container_id).get('Mounts') or []
+            volumes = [mount['Name'] for mount in mounts if mount.get('Type') == 'volume']
+            if volumes:
+                raise SnapshotError("Service %s mounts volumes (%s), which a commit snapshot doesn't capture - "
+                                    "use a 'volumes' snapshot instead" % (name, ', '.join(volumes)))
+
+            image = self.docker_client.commit(container_id, repository=prefix)['Id']
+            snapshot = Snapshot(service=name, name=snapshot_name, image=image)
+
+        else:
+            volumes = [(volume, '%s-%d' % (prefix, index)) for index, volume in enumerate(self.get_volumes(container_id))]
+            if not volumes:
+                raise SnapshotError("Service %s has no named volumes to snapshot" % name)
+
+            for _, snapshot_volume in volumes:
+                self.docker_client.create_volume(name=snapshot_volume,
+                                                 labels={SNAPSHOT_LABEL: self.controller.project_name})
+
+            # Copy the volumes while the service is stopped, for a consistent snapshot
+            with self.controller.container_stopped(name, health_check=health_check, interval=interval,
+                                                   timeout=timeout):
+                self.run_helper(volumes, [CLEAR_COMMAND.format(index=index) for index in range(len(volumes))] +
+                                [COPY_COMMAND.format(index=index) for index in range(len(volumes))])
+
+            snapshot = Snapshot(service=name, name=snapshot_name, volumes=volumes)
+
+        snapshot.duration = time.time() - start_time
+        self.snapshots[(name, snapshot_name)] = snapshot
+        log.info("Took %s in %.2f seconds", snapshot, snapshot.duration)
+        return snapshot
+
+    def restore(self, name, snapshot_name='default', health_check=None, interval=1, timeout=60):
+        """Restore the given service snapshot, recreating only the service container.
+
+        :param str name: service name as it appears in the docker compose file.
+        :param str snapshot_name: the snapshot name.
+        :param callable health_check: a callable used to determine if the service has recovered.
+        :param int interval: interval (in seconds) between health checks.
+        :param int timeout: timeout (in seconds) for the service to become healthy.
+        :return RestoreResult: the restore durations.
+        """
+        snapshot = self.snapshots.get((name, snapshot_name))
+        if snapshot is None:
+            raise SnapshotError("No snapshot %s was taken of %s" % (snapshot_name, name))
+
+        log.debug("Restoring %s", snapshot)
+        start_time = time.time()
+        container_id = self.controller.get_container_id(name)
+        self.docker_client.stop(container_id)
+        # The anonymous volumes would otherwise be left behind by each restore
+        self.docker_client.remove_container(container_id, v=True)
+        self.controller.invalidate_service_addresses(name)
+        self.controller.invalidate_container_ids(name)
+
+        if snapshot.mode == 'commit':
+            self.recreate_from_image(name, snapshot.image)
+        else:
+            volumes = [(snapshot_volume, volume) for volume, snapshot_volume in snapshot.volumes]
+            self.run_helper(volumes, [CLEAR_COMMAND.format(index=index) for index in range(len(volumes))] +
+                            [COPY_COMMAND.format(index=index) for index in range(len(volumes))])
+            self.controller.up(services=[name])
+
+        reset_time = time.time()
+        self.controller.wait_for_health(name=name, health_check=health_check, interval=interval, timeout=timeout)
+        result = RestoreResult(snapshot=snapshot, reset_duration=reset_time - start_time,
+                               ready_duration=time.time() - reset_time)
+
+        if self.controller.logs_collector.logs_file is not None:
+            self.controller.logs_collector.follow([name])
+
+        log.info("Restored %s", result)
+        return result
+
+    def recreate_from_image(self, name, image):
+        """Recreate the given service container from the given image, using a compose override file."""
+        compose_config = self.controller.get_compose_config()
+        override = {'services': {name: {'image': image}}}
+        if 'version' in compose_config:
+            override['version'] = compose_config['version']
+
+        override_path = os.path.join(self.controller.work_dir or '.', '.dtt-snapshot-%s.yml' % to_docker_name(name))
+        with open(override_path, 'w') as override_file:
+            yaml.safe_dump(override, override_file, default_flow_style=False)
+
+        try:
+            subprocess.check_output(
+                ['docker-compose', '-f', self.controller.compose_path, '-f', override_path,
+                 '-p', self.controller.project_name, 'up', '-d', '--no-deps', '--force-recreate', name],
+                stderr=subprocess.STDOUT, env=self.controller.environment_variables
+            )
+        except subprocess.CalledProcessError as error:
+            raise SnapshotError("Failed recreating %s from snapshot image, reason: %s" % (name, error.output))
+        finally:
+            os.remove(override_path)
+
+    def remove_snapshots(self):
+        """Remove all the snapshots volumes and images."""
+        for snapshot in self.snapshots.values():
+            for _, snapshot_volume in snapshot.volumes:
+                try:
+                    self.docker_client.remove_volume(snapshot_volume, force=True)
+                except docker.errors.APIError:
+                    log.warning("Failed removing snapshot volume %s", snapshot_volume)
+
+            if snapshot.image:
+                try:
+                    self.docker_client.remove_image(snapshot.image, force=True)
+                except docker.errors.APIError:
+                    log.warning("Failed removing snapshot image %s", snapshot.image)
+
+        self.snapshots.clear()
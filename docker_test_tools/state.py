@@ -0,0 +1,147 @@
+"""On-disk environment state cache, shared by the processes using the same environment.
+
+The state of an environment (the docker server API version, the compose services, and the services containers ids &
+addresses) is kept in a small JSON file per project and compose file hash - so secondary processes (e.g. xdist workers
+sharing an environment) attach to it without running docker-compose or querying the docker daemon version. The file is
+written atomically (write & rename) under a cross-process lock, and its entries are validated lazily by their users.
+"""
+import os
+import json
+import fcntl
+import hashlib
+import logging
+import tempfile
+from contextlib import contextmanager
+
+from docker_test_tools import reaper
+
+log = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+
+def get_compose_hash(compose_path, docker_host=''):
+    """Return a hash of the given compose file contents and docker host (the environment variables used for the
+    compose file interpolation are not included, they may differ between the processes)."""
+    digest = hashlib.sha1(docker_host.encode('utf-8'))
+    try:
+        with open(compose_path, 'rb') as compose_file:
+            digest.update(compose_file.read())
+    except (IOError, OSError):
+        digest.update(compose_path.encode('utf-8'))
+
+    return digest.hexdigest()[:16]
+
+
+class StateCache(object):
+    """The state cache file of an environment.
+
+    The state is a dictionary of format:
+
+        {'version': STATE_VERSION,
+         'api_version': <docker server api version>,
+         'services': [<service name>, ...],
+         'containers': {<service>: <container id>},
+         'addresses': {<service>: [[[port, protocol, host, host port], ...], <network address>]}}
+    """
+
+    def __init__(self, state_dir, project_name, compose_path, docker_host=''):
+        """Initialize the state cache.
+
+        :param str state_dir: the directory of the state files, created if missing.
+        :param str project_name: the compose project name.
+        :param str compose_path: the compose file path.
+        :param str docker_host: the docker host the environment runs on.
+        """
+        self.state_dir = state_dir
+        self.path = os.path.join(state_dir, '%s-%s.json' % (reaper.normalize_project_name(project_name),
+                                                            get_compose_hash(compose_path, docker_host)))
+
+    def load(self):
+        """Return the cached state, an empty state if there's none (or it's unreadable)."""
+        try:
+            with open(self.path) as state_file:
+                state = json.load(state_file)
+        except (IOError, OSError):
+            return {}
+        except ValueError:
+            log.warning("Ignoring corrupted environment state file: %s", self.path)
+            return {}
+
+        if state.get('version') != STATE_VERSION:
+            log.debug("Ignoring environment state file of version %s: %s", state.get('version'), self.path)
+            return {}
+
+        return state
+
+    @contextmanager
+    def lock(self):
+        """Cross-process lock of the state file."""
+        if not os.path.exists(self.state_dir):
+            try:
+                os.makedirs(self.state_dir)
+            except OSError:
+                pass  # Created by another process
+
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, state):
+        state['version'] = STATE_VERSION
+        state_fd, temp_path = tempfile.mkstemp(dir=self.state_dir, prefix='.state-')
+        try:
+            with os.fdopen(state_fd, 'w') as state_file:
+                json.dump(state, state_file, sort_keys=True)
+            os.rename(temp_path, self.path)
+        except:
+            os.remove(temp_path)
+            raise
+
+    def update(self, **values):
+        """Update the given top level state values."""
+        with self.lock():
+            state = self.load()
+            state.update(values)
+            self._write(state)
+
+    def set_entry(self, key, name, value):
+        """Set the given service entry (e.g. the service container id under 'containers')."""
+        with self.lock():
+            state = self.load()
+            state.setdefault(key, {})[name] = value
+            self._write(state)
+
+    def remove_entries(self, key, name=None):
+        """Remove the given service entry - or all the entries of the given key, if no service is given."""
+        with self.lock():
+            state = self.load()
+            if name is None:
+                state.pop(key, None)
+            else:
+                state.get(key, {}).pop(name, None)
+            self._write(state)
+
+    def clear(self):
+        """Remove the state file."""
+        with self.lock():
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def dump_addresses(service_addresses):
+    """Return the given {service: (published ports, network address)} addresses in their JSON state format."""
+    return dict((service, [[[port, protocol, host, host_port]
+                            for (port, protocol), (host, host_port) in sorted(published_ports.items())],
+                           network_address])
+                for service, (published_ports, network_address) in service_addresses.items())
+
+
+def load_addresses(addresses):
+    """Return the given JSON state addresses in their {service: (published ports, network address)} format."""
+    return dict((service, (dict(((port, protocol), (host, host_port))
+                                for port, protocol, host, host_port in published_ports), network_address))
+                for service, (published_ports, network_address) in addresses.items())
@@ -7,6 +7,7 @@ import subprocess
 import humanfriendly
 
 from docker_test_tools import utils
+from docker_test_tools import columnar
 
 log = logging.getLogger(__name__)
 
@@ -14,6 +15,58 @@ COMMON_STATS_PREFIX = '>>>'
 COMMON_STATS_FORMAT = u'{prefix} {{message}}\n'.format(prefix=COMMON_STATS_PREFIX)
 
 
+def get_bytes(raw_value):
+    """Get the number as used bytes number"""
+    if isinstance(raw_value, int):
+        return raw_value
+
+    return humanfriendly.parse_size(raw_value.split('/')[0], binary=True)
+
+
+def format_container_stats(raw_stats):
+    """Return the given numeric container stats summary (see `ContainerStats.to_raw_dict`) in its readable format."""
+    return dict((metric, dict((aggregation, "%.2f" % value if metric == "cpu" else humanfriendly.format_size(value))
+                              for aggregation, value in values.items()))
+                for metric, values in raw_stats.items())
+
+
+def parse_sample(line):
+    """Parse a collected `docker stats` line into a sample dictionary.
+
+    :return dict: of format {name, cpu, ram, net, block}, or None if the line is not a valid sample.
+    """
+    try:
+        # Split the stat data to it's raw components
+        components = json.loads(line)
+
+        if components['name'] == '--':
+            # skip metrics with no service name
+            return None
+
+        # Handle bad stats metrics
+        for key, val in components.items():
+            if '--' in val:
+                components[key] = 0
+
+        # Skip bad stats metrics
+        if len(components) != 5:
+            return None
+
+        if not isinstance(components['cpu'], int):
+            # Get the used CPU percentage as a floating number
+            components['cpu'] = float(components['cpu'][:-1])
+
+        # Get the used stats numbers as used bytes number
+        components['ram'] = get_bytes(components['ram'])
+        components['net'] = get_bytes(components['net'])
+        components['block'] = get_bytes(components['block'])
+
+        return components
+    except:
+        logging.debug("Failed parsing line: %r", line)
+        return None
+
+
 class StatsCollector(object):
     """Utility for containers stats collection."""
 
@@ -25,11 +78,14 @@ class StatsCollector(object):
              '"block": "{{.BlockIO}}"' \
              '}'
 
-    def __init__(self, target_dir_path, project, encoding, environment_variables):
+    def __init__(self, target_dir_path, project, encoding, environment_variables, output_format='json',
+                 downsample=None):
         """Initialize the stats collector."""
         logging.debug("Stats monitor initializing")
         self.project = project
         self.encoding = encoding
+        self.downsample = downsample
+        self.output_format = output_format
         self.environment_variables = environment_variables
 
         self.work_dir = os.path.join(target_dir_path, 'stats')
@@ -38,31 +94,71 @@ class StatsCollector(object):
 
         self.stats_file_path = os.path.join(self.work_dir, 'stats.json')
         self.stats_summary_path = os.path.join(self.work_dir, 'summary.json')
+        self.stats_raw_summary_path = os.path.join(self.work_dir, 'summary.raw.json')
 
         self.stats_file = None
         self.stats_process = None
 
+        # The collected containers, and the stats collection processes of containers started after the collection
+        self.containers = []
+        self.follow_processes = []
+
+        # Numeric stats summary, available once the collection is stopped
+        self.summary = None
+
+        # Latest sample per container, updated by tailing the stats file
+        self.latest_samples = {}
+        self.read_offset = 0
+
     def start(self):
         """Start a stats collection process which writes docker-compose stats into a file."""
         log.debug("Starting stats collection from environment containers")
         self.stats_file = io.open(self.stats_file_path, 'w', encoding=self.encoding)
+        self.containers = self._get_filters()
         self.stats_process = subprocess.Popen(
-            ['docker', 'stats', '--format', self.FORMAT] + self._get_filters(),
+            ['docker', 'stats', '--format', self.FORMAT] + self.containers,
             stdout=self.stats_file, env=self.environment_variables,
         )
 
     def stop(self):
         """Stop the stats collection process and close the stats file."""
         log.debug("Stopping stats collection from environment containers")
-        if self.stats_process:
-            self.stats_process.kill()
-            self.stats_process.wait()
+        for stats_process in [self.stats_process] + self.follow_processes:
+            if stats_process:
+                stats_process.kill()
+                stats_process.wait()
 
         if self.stats_file:
             self.stats_file.close()
+            cluster_stats = ClusterStats(stat_file_path=self.stats_file_path,
+                                         encoding=self.encoding,
+                                         output_format=self.output_format,
+                                         downsample=self.downsample)
+            self.summary = cluster_stats.to_raw_dict()
             with open(self.stats_summary_path, 'w') as target:
-                cluster_stats = ClusterStats(stat_file_path=self.stats_file_path, encoding=self.encoding).to_dict()
-                json.dump(cluster_stats, target, sort_keys=True, indent=2)
+                json.dump(cluster_stats.to_dict(), target, sort_keys=True, indent=2)
+            self._write_raw_summary()
+
+    def _write_raw_summary(self):
+        """Write the numeric stats summary, used for merging the workers stats and comparing against a baseline."""
+        with open(self.stats_raw_summary_path, 'w') as target:
+            json.dump(self.summary, target, sort_keys=True, indent=2)
+
+    def follow(self, services):
+        """Start collecting the stats of the given services containers, started after the collection started."""
+        if self.stats_process is None:
+            return
+
+        containers = [name for name in self._get_filters() if name and name not in self.containers]
+        if not containers:
+            return
+
+        log.debug("Starting stats collection from services %s containers: %s", services, containers)
+        self.containers.extend(containers)
+        self.follow_processes.append(subprocess.Popen(
+            ['docker', 'stats', '--format', self.FORMAT] + containers,
+            stdout=self.stats_file, env=self.environment_variables,
+        ))
 
     def _get_filters(self):
         """Return the docker-compose project containers."""
@@ -72,6 +168,29 @@ class StatsCollector(object):
         )
         return utils.to_str(filters_output).strip().split('\n')
 
+    def latest(self):
+        """Return the latest collected sample per container.
+
+        :return dict: of format {container_name: {cpu, ram, net, block}}.
+        """
+        if not os.path.exists(self.stats_file_path):
+            return {}
+
+        with io.open(self.stats_file_path, 'rb') as stats_file:
+            stats_file.seek(self.read_offset)
+            content = stats_file.read()
+
+        # Parse complete lines only, a partial line will be parsed on the next call
+        content = content[:content.rfind(b'\n') + 1]
+        self.read_offset += len(content)
+
+        for raw_line in content.decode(self.encoding, 'replace').splitlines():
+            sample = parse_sample(raw_line.lstrip(ClusterStats.SAMPLE_PREFIX))
+            if sample:
+                self.latest_samples[sample.pop('name')] = sample
+
+        return dict(self.latest_samples)
+
     def update(self, message):
         """Write a common log message to the container logs."""
         self.stats_file.flush()
@@ -84,9 +203,18 @@ class ClusterStats(object):
 
     SAMPLE_PREFIX = "\x1b[2J\x1b[H"
 
-    def __init__(self, stat_file_path, encoding):
+    def __init__(self, stat_file_path, encoding, output_format='json', downsample=None):
+        """Parse the collected stats file and write the samples file per service.
+
+        :param str output_format: samples files format - 'json' or 'binary' (see `columnar`).
+        :param int downsample: when given, downsample the samples files to about this number of points per metric.
+        """
         self.encoding = encoding
+        self.downsample = downsample
+        self.output_format = output_format
         self.summary_data = {}
+        self.tests_data = {}
+        self.current_test = None
         self._split_logs(stat_file_path)
 
     def parse_file(self, stat_file_path):
@@ -115,10 +243,10 @@ class ClusterStats(object):
                     raw_line = raw_line.lstrip(self.SAMPLE_PREFIX)
 
                     if raw_line.startswith(COMMON_STATS_PREFIX):
-                        value = {"test": raw_line.lstrip(COMMON_STATS_PREFIX).strip()}
-                        common_stats.append(value)
+                        self.current_test = raw_line.lstrip(COMMON_STATS_PREFIX).strip()
+                        common_stats.append(self.current_test)
                         for service_stats in services_stats.values():
-                            service_stats.append(value)
+                            service_stats.markers.append((len(service_stats), self.current_test))
 
                     else:
                         parsed_line = self.parse_line(line=raw_line)
@@ -127,14 +255,17 @@ class ClusterStats(object):
 
                         service_name = parsed_line.pop("name")
                         if service_name not in services_stats:
-                            services_stats[service_name] = common_stats[:]
+                            services_stats[service_name] = ServiceSamples(markers=[(0, test) for test in common_stats])
 
                         services_stats[service_name].append(parsed_line)
         finally:
             dir_path = os.path.dirname(stat_file_path)
             for service_name, service_stats in services_stats.items():
-                with open(os.path.join(dir_path, service_name + ".json"), 'w') as stat_file:
-                    json.dump(service_stats, stat_file, indent=2)
+                columnar.write_stats(path=os.path.join(dir_path, service_name),
+                                     columns=service_stats.columns,
+                                     markers=service_stats.markers,
+                                     output_format=self.output_format,
+                                     threshold=self.downsample)
 
     def parse_line(self, line):
         """Parse the stats line.
@@ -142,55 +273,39 @@ class ClusterStats(object):
         - Extract the line data from the raw string.
         - Add the data to the stats summary info.
         """
-        try:
-            # Split the stat data to it's raw components
-            components = json.loads(line)
-
-            if components['name'] == '--':
-                # skip metrics with no service name
-                return
-
-            # Handle bad stats metrics
-            for key, val in components.items():
-                if '--' in val:
-                    components[key] = 0
-
-            # Skip bad stats metrics
-            if len(components) != 5:
-                return
-
-            name = components['name']
-
-            if not isinstance(components['cpu'], int):
-                # Get the used CPU percentage as a floating number
-                components['cpu'] = float(components['cpu'][:-1])
-
-            # Get the used stats numbers as used bytes number
-            components['ram'] = self.get_bytes(components['ram'])
-            components['net'] = self.get_bytes(components['net'])
-            components['block'] = self.get_bytes(components['block'])
+        components = parse_sample(line)
+        if not components:
+            return
+
+        name = components['name']
+        if name not in self.summary_data:
+            self.summary_data[name] = ContainerStats(name=name)
+
+        self.summary_data[name].update(
+            cpu_used=components['cpu'],
+            ram_used=components['ram'],
+            net_io_used=components['net'],
+            block_io_used=components['block']
+        )
 
-            if name not in self.summary_data:
-                self.summary_data[name] = ContainerStats(name=name)
+        if self.current_test is not None:
+            test_data = self.tests_data.setdefault(self.current_test, {})
+            if name not in test_data:
+                test_data[name] = ContainerStats(name=name)
 
-            self.summary_data[name].update(
+            test_data[name].update(
                 cpu_used=components['cpu'],
                 ram_used=components['ram'],
                 net_io_used=components['net'],
                 block_io_used=components['block']
             )
 
-            return components
-        except:
-            logging.debug("Failed parsing line: %r", line)
+        return components
 
     @staticmethod
     def get_bytes(raw_value):
         """Get the number as used bytes number"""
-        if isinstance(raw_value, int):
-            return raw_value
-
-        return humanfriendly.parse_size(raw_value.split('/')[0], binary=True)
+        return get_bytes(raw_value)
 
     def __str__(self):
         """Return a string representation of the collected stats."""
@@ -201,6 +316,34 @@ class ClusterStats(object):
         return {container_summary.name: container_summary.to_dict()
                 for container_summary in self.summary_data.values()}
 
+    def to_raw_dict(self):
+        """Return a numeric dictionary representation of the collected stats, per container and per test."""
+        return {
+            "containers": {container_summary.name: container_summary.to_raw_dict()
+                           for container_summary in self.summary_data.values()},
+            "tests": {test_name: {container_summary.name: container_summary.to_raw_dict()
+                                  for container_summary in test_data.values()}
+                      for test_name, test_data in self.tests_data.items()}
+        }
+
+
+class ServiceSamples(object):
+    """Samples of a single service, kept as columns."""
+
+    METRICS = ('cpu', 'ram', 'net', 'block')
+
+    def __init__(self, markers):
+        self.markers = markers
+        self.columns = [(metric, []) for metric in self.METRICS]
+
+    def append(self, sample):
+        """Add a sample dictionary to the columns."""
+        for metric, values in self.columns:
+            values.append(sample[metric])
+
+    def __len__(self):
+        return len(self.columns[0][1])
+
 
 class ContainerStats(object):
     """Parse and calculate a single container session stats."""
@@ -283,6 +426,15 @@ class ContainerStats(object):
         """Return a string representation of the collected container stats."""
         return str(self.to_dict())
 
+    def to_raw_dict(self):
+        """Return a numeric dictionary representation of the collected container stats."""
+        return {
+            "cpu": {"min": self.cpu_min, "max": self.cpu_max, "avg": self.cpu_avg},
+            "ram": {"min": self.ram_min, "max": self.ram_max, "avg": self.ram_avg},
+            "net_io": {"min": self.net_io_min, "max": self.net_io_max, "avg": self.net_io_avg},
+            "block_io": {"min": self.block_io_min, "max": self.block_io_max, "avg": self.block_io_avg},
+        }
+
     def to_dict(self):
         return {
             "cpu": {
@@ -0,0 +1,222 @@
+"""Streaming tar based files transfer into and out of containers.
+
+Archives are produced and consumed on the fly, in fixed size chunks - the local files are archived into a pipe by a
+writer thread while the docker API client uploads the pipe contents, and downloaded archives are extracted as they
+arrive - so the memory use doesn't depend on the transferred data size, and nothing is staged on disk.
+"""
+import os
+import time
+import tarfile
+import logging
+import threading
+
+import six
+
+try:
+    import lzma  # noqa: F401
+    # Python 2 tarfile doesn't support xz compression, even with an lzma backport installed
+    XZ_SUPPORTED = six.PY3
+except ImportError:
+    XZ_SUPPORTED = False
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+COMPRESSIONS = (None, 'gz', 'bz2', 'xz')
+
+
+class TransferError(Exception):
+    pass
+
+
+def get_write_mode(compression=None):
+    """Return the tarfile streaming write mode of the given compression."""
+    if compression not in COMPRESSIONS:
+        raise ValueError("Invalid compression: %r, must be one of %s" % (compression, list(COMPRESSIONS)))
+
+    if compression == 'xz' and not XZ_SUPPORTED:
+        raise ValueError("The xz compression requires python 3 with the lzma module")
+
+    return 'w|%s' % (compression or '')
+
+
+def iter_archive(src_paths, compression=None, chunk_size=CHUNK_SIZE):
+    """Archive the given local paths, yielding the archive chunks as they are written.
+
+    :param list src_paths: local files & directories, added to the archive root by their base name.
+    :param str compression: the archive compression (one of COMPRESSIONS), None for an uncompressed archive.
+    :param int chunk_size: the yielded chunks size.
+    :raise TransferError: if a source path is missing (on the call), or archiving failed (while iterating).
+    """
+    mode = get_write_mode(compression)
+    missing_paths = [src_path for src_path in src_paths if not os.path.exists(src_path)]
+    if missing_paths:
+        raise TransferError("Missing transfer source paths: %s" % missing_paths)
+
+    return _iter_pipe_archive(src_paths, mode, chunk_size)
+
+
+def _iter_pipe_archive(src_paths, mode, chunk_size):
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def write_archive():
+        try:
+            with os.fdopen(write_fd, 'wb') as pipe_writer:
+                archive = tarfile.open(fileobj=pipe_writer, mode=mode, bufsize=chunk_size)
+                try:
+                    for src_path in src_paths:
+                        archive.add(src_path, arcname=os.path.basename(os.path.normpath(src_path)))
+                finally:
+                    archive.close()
+        except Exception as error:
+            errors.append(error)
+
+    writer = threading.Thread(target=write_archive, name='archive-writer')
+    writer.daemon = True
+    writer.start()
+
+    # Closing the pipe (also when the consumer stops early) releases a writer blocked on a full pipe
+    with os.fdopen(read_fd, 'rb') as pipe_reader:
+        while True:
+            chunk = pipe_reader.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    writer.join()
+    if errors:
+        raise TransferError("Failed archiving %s, reason: %s" % (src_paths, errors[0]))
+
+
+class ChunksReader(object):
+    """Read-only file object over an iterable of chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.chunk = b''
+        self.offset = 0
+
+    def read(self, size=-1):
+        pieces = []
+        while size != 0:
+            if self.offset >= len(self.chunk):
+                self.chunk, self.offset = next(self.chunks, None), 0
+                if self.chunk is None:
+                    self.chunk = b''
+                    break
+                continue
+
+            end = len(self.chunk) if size < 0 else min(len(self.chunk), self.offset + size)
+            pieces.append(self.chunk[self.offset:end])
+            if size > 0:
+                size -= end - self.offset
+            self.offset = end
+
+        return b''.join(pieces)
+
+
+def is_inside(path, directory):
+    """Return True if the given path (resolving symbolic links) is inside the given directory."""
+    path = os.path.realpath(path)
+    return path == directory or path.startswith(directory + os.sep)
+
+
+def is_safe_member(member, dest):
+    """Return True if the given archive member extracts inside the given directory.
+
+    Symbolic links may point anywhere (they usually point within the container), members extracted through them are
+    validated by their resolved path.
+    """
+    if member.islnk():
+        return (is_inside(os.path.join(dest, member.linkname), dest) and
+                is_inside(os.path.join(dest, member.name), dest))
+
+    if not (member.isfile() or member.isdir() or member.issym()):
+        return False
+
+    return is_inside(os.path.join(dest, member.name), dest)
+
+
+def extract_archive(chunks, dest):
+    """Extract the archive of the given chunks into the given local directory, as the chunks arrive.
+
+    Members which would be extracted outside the directory (and devices) are skipped.
+
+    :param chunks: iterable of the archive chunks.
+    :param str dest: local directory to extract into, created if missing.
+    :return int: number of extracted members.
+    """
+    dest = os.path.realpath(dest)
+    if not os.path.isdir(dest):
+        os.makedirs(dest)
+
+    extracted = 0
+    archive = tarfile.open(fileobj=ChunksReader(chunks), mode='r|*')
+    try:
+        for member in archive:
+            if not is_safe_member(member, dest):
+                log.warning("Skipping unsafe archive member: %s", member.name)
+                continue
+
+            archive.extract(member, dest)
+            extracted += 1
+    finally:
+        archive.close()
+
+    return extracted
+
+
+class CountingChunks(object):
+    """Iterable wrapper counting the size of the chunks passing through."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.size += len(chunk)
+            yield chunk
+
+
+def put_files(docker_client, container_id, src_paths, dest, compression=None, chunk_size=CHUNK_SIZE):
+    """Stream an archive of the given local paths into the given container directory.
+
+    :param docker.APIClient docker_client: the docker API client.
+    :param str container_id: the target container.
+    :param list src_paths: local files & directories, copied into the directory by their base name.
+    :param str dest: the container directory to copy into, must exist.
+    :param str compression: the streamed archive compression, trades CPU for less transferred data.
+    :param int chunk_size: the streamed chunks size.
+    :return int: number of transferred (possibly compressed) bytes.
+    """
+    start_time = time.time()
+    chunks = CountingChunks(iter_archive(src_paths, compression=compression, chunk_size=chunk_size))
+    docker_client.put_archive(container_id, dest, chunks)
+    log.debug("Transferred %d bytes into %s:%s in %.2f seconds", chunks.size, container_id, dest,
+              time.time() - start_time)
+    return chunks.size
+
+
+def get_files(docker_client, container_id, src_paths, dest, chunk_size=CHUNK_SIZE):
+    """Stream archives of the given container paths, extracting them into the given local directory.
+
+    :param docker.APIClient docker_client: the docker API client.
+    :param str container_id: the source container.
+    :param list src_paths: container files & directories, copied into the directory by their base name.
+    :param str dest: local directory to copy into, created if missing.
+    :param int chunk_size: the streamed chunks size.
+    :return int: number of transferred bytes.
+    """
+    start_time = time.time()
+    size = 0
+    for src_path in src_paths:
+        stream, _ = docker_client.get_archive(container_id, src_path, chunk_size=chunk_size)
+        chunks = CountingChunks(stream)
+        extract_archive(chunks, dest)
+        size += chunks.size
+
+    log.debug("Transferred %d bytes from %s:%s in %.2f seconds", size, container_id, src_paths,
+              time.time() - start_time)
+    return size
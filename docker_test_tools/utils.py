@@ -43,11 +43,52 @@ def is_responsive(address, expected_status=http_client.OK):
         return False
 
 
+class ServiceReference(object):
+    """Reference to the url of a service container port, resolved on use.
+
+    Allows addressing services published on ephemeral host ports, which are known only once the containers are up
+    (and may change when a container is restarted).
+
+    Usage example:
+
+    >>> url = ServiceReference(controller, name='consul.service', container_port=8500, path='/v1/status/leader')
+    >>> requests.get(url.url)
+    """
+
+    def __init__(self, controller, name, container_port, scheme='http', path=''):
+        """Initialize the service reference.
+
+        :param EnvironmentController controller: the controller of the service environment.
+        :param str name: service name as it appears in the docker compose file.
+        :param container_port: the service container port, e.g. 8080 or '8080/tcp'.
+        :param str scheme: url scheme.
+        :param str path: url path.
+        """
+        self.controller = controller
+        self.name = name
+        self.container_port = container_port
+        self.scheme = scheme
+        self.path = path
+
+    @property
+    def url(self):
+        host, port = self.controller.get_service_address(self.name, self.container_port)
+        return '%s://%s:%s%s' % (self.scheme, host, port, self.path)
+
+    def __repr__(self):
+        return '<ServiceReference %s:%s%s>' % (self.name, self.container_port, self.path)
+
+
+def resolve_url(url):
+    """Return the url of the given url or service reference."""
+    return url.url if isinstance(url, ServiceReference) else url
+
+
 def get_health_check(service_name, url, expected_status=http_client.OK):
     """Return a function used to determine if the given service is responsive.
 
     :param string service_name: service name.
-    :param string url: service url 'hostname:port'.
+    :param url: service url 'hostname:port', or a ServiceReference resolved on every check.
     :param int expected_status: expected response status code.
 
     :return function: function used to determine if the given service is responsive.
@@ -56,7 +97,7 @@ def get_health_check(service_name, url, expected_status=http_client.OK):
 
     def url_health_check():
         """Return True if the service is responsive."""
-        is_ready = is_responsive(url, expected_status)
+        is_ready = is_responsive(resolve_url(url), expected_status)
         log.debug('Service %s ready: %s', service_name, is_ready)
         return is_ready
 
@@ -3,20 +3,522 @@
 For more info about wiremock visit: http://wiremock.org
 """
 import os
+import re
 import json
+import math
+import copy
+import base64
 import glob
-from six.moves import http_client
+import time
+import uuid
+import hashlib
+import numbers
 import logging
+import threading
+import datetime
+import fractions
+import collections
+from functools import partial
+from contextlib import contextmanager
+import six
+from six.moves import http_client
+from multiprocessing.pool import ThreadPool
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from docker_test_tools import utils
+from docker_test_tools import journal
 
 log = logging.getLogger(__name__)
 
+# Stub metadata key holding the stub content hash, used for syncing stubs
+STUB_HASH_KEY = 'dtt-hash'
+
 
 class WiremockError(Exception):
     """Raised on wiremock controller failures."""
 
 
+class WiremockClusterError(WiremockError):
+    """Raised when an operation failed on some of the cluster instances.
+
+    :ivar dict results: of format {instance_name: InstanceResult}, the results of all the instances.
+    """
+
+    def __init__(self, message, results):
+        super(WiremockClusterError, self).__init__(message)
+        self.results = results
+
+
+class WiremockMappingError(WiremockError, ValueError):
+    """Raised when some of the stubs failed to load or upload.
+
+    A ValueError, as raised for invalid stub files before the stubs were loaded in bulk.
+
+    :ivar dict errors: of format {json_file_path: error}, the stubs which failed.
+    :ivar dict stub_ids: of format {json_file_path: stub_uuid}, the stubs which were uploaded.
+    """
+
+    def __init__(self, message, errors, stub_ids):
+        super(WiremockMappingError, self).__init__(message)
+        self.errors = errors
+        self.stub_ids = stub_ids
+
+
+def with_stub_id(json_object):
+    """Return the stub json object with an id, generating one if the stub doesn't define it.
+
+    Stub ids are generated on the client side, so the stubs uuids are known without a response per stub.
+    """
+    if 'id' in json_object:
+        return json_object
+
+    json_object = dict(json_object)
+    json_object['id'] = json_object.get('uuid') or str(uuid.uuid4())
+    return json_object
+
+
+def get_stub_hash(json_object):
+    """Return the content hash of a stub - the sha1 of its normalized json, ignoring its ids and hash metadata."""
+    normalized = dict((key, value) for key, value in json_object.items() if key not in ('id', 'uuid'))
+    metadata = dict(normalized.pop('metadata', None) or {})
+    metadata.pop(STUB_HASH_KEY, None)
+    if metadata:
+        normalized['metadata'] = metadata
+
+    content = json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def with_stub_hash(json_object, stub_hash):
+    """Return the stub json object with the given content hash stamped in its metadata."""
+    json_object = dict(json_object)
+    json_object['metadata'] = dict(json_object.get('metadata') or {}, **{STUB_HASH_KEY: stub_hash})
+    return json_object
+
+
+def request_pattern(method='ANY', url=None, url_pattern=None, url_path=None, url_path_pattern=None, headers=None,
+                    body_json_paths=None):
+    """Return a wiremock request pattern (as used by the requests find & count admin API) for the given criteria.
+
+    :param str method: request method, 'ANY' to match all methods.
+    :param str url: exact url (path & query) to match.
+    :param str url_pattern: regex of the url (path & query) to match.
+    :param str url_path: exact url path to match.
+    :param str url_path_pattern: regex of the url path to match.
+    :param dict headers: of format {header: value}, a value is either a string to match exactly or a wiremock
+        matcher dictionary (e.g. {"contains": "json"}).
+    :param list body_json_paths: json path expressions the request body should match, an expression is either a
+        string or a wiremock json path matcher dictionary (e.g. {"expression": "$.name", "equalTo": "test"}).
+    :return dict: the request pattern.
+    """
+    pattern = {"method": method}
+    for key, value in (('url', url), ('urlPattern', url_pattern),
+                       ('urlPath', url_path), ('urlPathPattern', url_path_pattern)):
+        if value is not None:
+            pattern[key] = value
+
+    if headers:
+        pattern["headers"] = dict((name, value if isinstance(value, dict) else {"equalTo": value})
+                                  for name, value in headers.items())
+
+    if body_json_paths:
+        pattern["bodyPatterns"] = [{"matchesJsonPath": expression} for expression in body_json_paths]
+
+    return pattern
+
+
+def format_since(since):
+    """Return the ISO 8601 representation of a journal 'since' filter.
+
+    :param since: either an ISO 8601 string or a datetime (naive datetimes are considered UTC).
+    """
+    if isinstance(since, datetime.datetime):
+        if since.utcoffset() is not None:
+            since = (since - since.utcoffset()).replace(tzinfo=None)
+        return since.strftime('%Y-%m-%dT%H:%M:%S.') + '%03dZ' % (since.microsecond // 1000)
+
+    return since
+
+
+class JsonArrayStream(object):
+    """Incremental decoder of a json array nested in a top level json object, yielding the array items one by one.
+
+    Only a single item (and a read chunk) is kept in memory, so arbitrarily large arrays can be iterated.
+    """
+    WHITESPACE = re.compile(r'\s*')
+
+    def __init__(self, chunks, key):
+        """Initialize the stream.
+
+        :param iterable chunks: the json document text chunks.
+        :param str key: the top level key of the array to iterate.
+        """
+        self.chunks = iter(chunks)
+        self.key = key
+        self.decoder = json.JSONDecoder()
+        self.buffer = u''
+        self.position = 0
+
+    def _fill(self):
+        """Read the next chunk into the buffer, return False if there are no more chunks."""
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def _next_char(self):
+        """Skip whitespaces and return the next char (without consuming it)."""
+        while True:
+            self.position = self.WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                raise ValueError('Unexpected end of json document')
+
+    def _expect(self, chars):
+        """Consume the next char, which should be one of the given chars."""
+        char = self._next_char()
+        if char not in chars:
+            raise ValueError('Expected one of %r at position %d, got %r' % (chars, self.position, char))
+        self.position += 1
+        return char
+
+    def _decode(self):
+        """Decode and consume the next json value, reading more chunks as long as the value is incomplete."""
+        self._next_char()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+
+            # A number ending at the buffer end may be truncated
+            if end < len(self.buffer) or not isinstance(value, numbers.Number) or not self._fill():
+                self.position = end
+                return value
+
+    def __iter__(self):
+        self._expect('{')
+        if self._next_char() == '}':
+            return
+
+        while True:
+            key = self._decode()
+            self._expect(':')
+            if key != self.key:
+                self._decode()
+            elif self._next_char() == 'n':
+                self._decode()
+            else:
+                self._expect('[')
+                if self._next_char() == ']':
+                    self.position += 1
+                else:
+                    while True:
+                        yield self._decode()
+                        if self._expect(',]') == ']':
+                            break
+
+            if self._expect(',}') == '}':
+                return
+
+
+class RequestsWaitResult(object):
+    """Result of waiting for wiremock requests.
+
+    :ivar list requests: the matching logged requests.
+    :ivar list arrivals: the requests arrival offsets (in seconds) from the wait start, ascending - negative for
+        requests which arrived before the wait started.
+    :ivar float elapsed: the wait duration (in seconds).
+    :ivar int polls: the number of count polls made.
+    """
+
+    def __init__(self, requests, arrivals, elapsed, polls):
+        self.requests = requests
+        self.arrivals = arrivals
+        self.elapsed = elapsed
+        self.polls = polls
+
+    def __repr__(self):
+        return '<RequestsWaitResult requests=%d elapsed=%.3fs polls=%d>' % (len(self.requests), self.elapsed, self.polls)
+
+
+class ResponseProfile(object):
+    """Latency, bandwidth & faults profile of wiremock stubs responses.
+
+    Usage example:
+
+    >>> profile = ResponseProfile().lognormal_delay(p50=100, p99=2000).fault_rate(0.1)
+    >>> with controller.response_profile(profile):
+    >>>     # the stubs responses are delayed & faulted in this context
+    """
+    # z-score of the 99th percentile of the standard normal distribution
+    P99_Z_SCORE = 2.3263
+    FAULTS = ('CONNECTION_RESET_BY_PEER', 'EMPTY_RESPONSE', 'MALFORMED_RESPONSE_CHUNK', 'RANDOM_DATA_THEN_CLOSE')
+    MAX_FAULT_CYCLE = 20
+
+    def __init__(self):
+        self.delay = None
+        self.dribble = None
+        self.bytes_per_second = None
+        self.chunk_size = None
+        self.fault = None
+        self.fault_ratio = None
+
+    def fixed_delay(self, milliseconds):
+        """Delay the responses by a fixed duration."""
+        self.delay = ('fixed', int(milliseconds))
+        return self
+
+    def uniform_delay(self, lower, upper):
+        """Delay the responses by a uniformly distributed duration between lower and upper (in milliseconds)."""
+        self.delay = ('distribution', {"type": "uniform", "lower": int(lower), "upper": int(upper)})
+        return self
+
+    def lognormal_delay(self, p50, p99):
+        """Delay the responses by a log-normally distributed duration, with the given median & 99th percentile.
+
+        :param float p50: the delay median (in milliseconds).
+        :param float p99: the delay 99th percentile (in milliseconds), should be above the median.
+        """
+        if p99 <= p50:
+            raise ValueError("The delay p99 (%s) must be above the p50 (%s)" % (p99, p50))
+
+        sigma = math.log(float(p99) / p50) / self.P99_Z_SCORE
+        self.delay = ('distribution', {"type": "lognormal", "median": p50, "sigma": round(sigma, 4)})
+        return self
+
+    def chunked_dribble(self, number_of_chunks, total_duration):
+        """Send the responses bodies in the given number of chunks, spread over the total duration (in milliseconds)."""
+        self.dribble = {"numberOfChunks": int(number_of_chunks), "totalDuration": int(total_duration)}
+        return self
+
+    def bandwidth(self, bytes_per_second, chunk_size=1024):
+        """Throttle the responses bodies to the given bandwidth, dribbling them in chunks of the given size."""
+        self.bytes_per_second = bytes_per_second
+        self.chunk_size = chunk_size
+        return self
+
+    def fault_rate(self, rate, fault='CONNECTION_RESET_BY_PEER'):
+        """Fail the given rate of the responses with the given fault.
+
+        The faults are spread evenly over a cycle of responses (e.g. a rate of 0.25 fails each 4th response), the
+        rate is approximated by a fraction with a denominator of up to MAX_FAULT_CYCLE.
+
+        :param float rate: the faulted responses rate (0 - 1).
+        :param str fault: one of FAULTS.
+        """
+        if fault not in self.FAULTS:
+            raise ValueError("Invalid fault: %r, must be one of %s" % (fault, list(self.FAULTS)))
+        if not 0 <= rate <= 1:
+            raise ValueError("Invalid fault rate: %r, must be between 0 and 1" % rate)
+
+        self.fault = fault
+        self.fault_ratio = fractions.Fraction(rate).limit_denominator(self.MAX_FAULT_CYCLE)
+        return self
+
+    def get_settings(self):
+        """Return the global settings applying the profile delay."""
+        if self.delay is None:
+            return {}
+        if self.delay[0] == 'fixed':
+            return {"fixedDelay": self.delay[1]}
+        return {"delayDistribution": self.delay[1]}
+
+    def apply_response(self, response):
+        """Return the given stub response definition with the profile delay & throttling applied."""
+        response = dict(response)
+        if self.delay is not None and self.delay[0] == 'fixed':
+            response.pop('delayDistribution', None)
+            response['fixedDelayMilliseconds'] = self.delay[1]
+        elif self.delay is not None:
+            response.pop('fixedDelayMilliseconds', None)
+            response['delayDistribution'] = self.delay[1]
+
+        if self.dribble is not None:
+            response['chunkedDribbleDelay'] = self.dribble
+        elif self.bytes_per_second is not None:
+            body_size = get_body_size(response)
+            if body_size is None:
+                log.warning("Can't throttle a stub response with an unknown body size: %s", response)
+            elif body_size:
+                response['chunkedDribbleDelay'] = {
+                    "numberOfChunks": int(math.ceil(float(body_size) / self.chunk_size)),
+                    "totalDuration": int(body_size * 1000.0 / self.bytes_per_second)}
+
+        return response
+
+    def apply_stub(self, stub):
+        """Return the stubs implementing the profile for the given stub.
+
+        :return list: a single stub, or a cycle of scenario stubs when only some of the responses are faulted.
+        """
+        stub = dict(stub, response=self.apply_response(stub.get('response', {})))
+        if not self.fault_ratio:
+            return [stub]
+
+        if self.fault_ratio == 1:
+            return [dict(stub, response={"fault": self.fault})]
+
+        if 'scenarioName' in stub:
+            raise ValueError("Can't apply a fault rate to a scenario stub: %s" % stub.get('id'))
+
+        # A cycle of stubs for the same request, each advancing the scenario state to the next stub
+        faults, cycle = self.fault_ratio.numerator, self.fault_ratio.denominator
+        scenario = 'dtt-faults-%s' % stub['id']
+        states = ['Started'] + ['%s-%d' % (scenario, index) for index in range(1, cycle)]
+        stubs = []
+        for index in range(cycle):
+            variant = dict(stub, id=stub['id'] if index == 0 else str(uuid.uuid4()), scenarioName=scenario,
+                           requiredScenarioState=states[index], newScenarioState=states[(index + 1) % cycle])
+            variant.pop('uuid', None)
+            if (index + 1) * faults // cycle > index * faults // cycle:
+                variant['response'] = {"fault": self.fault}
+            stubs.append(variant)
+
+        return stubs
+
+
+def get_body_size(response):
+    """Return the body size of a stub response definition, None if it's unknown (e.g. a body file)."""
+    if 'bodyFileName' in response:
+        return None
+    if 'base64Body' in response:
+        return len(base64.b64decode(response['base64Body']))
+    if 'jsonBody' in response:
+        return len(json.dumps(response['jsonBody']).encode('utf-8'))
+    return len(response.get('body', '').encode('utf-8'))
+
+
+class AppliedProfile(object):
+    """A response profile applied to a wiremock service, which can be reverted."""
+
+    def __init__(self, controller, settings, stubs, added_stub_ids):
+        """Initialize the applied profile.
+
+        :param WiremockController controller: the controller the profile was applied with.
+        :param dict settings: the global settings before applying the profile, None if they weren't changed.
+        :param list stubs: the stubs before applying the profile.
+        :param list added_stub_ids: ids of stubs added by the profile (e.g. the faults cycle stubs).
+        """
+        self.controller = controller
+        self.settings = settings
+        self.stubs = stubs
+        self.added_stub_ids = added_stub_ids
+
+    def revert(self):
+        """Restore the global settings & stubs as they were before applying the profile."""
+        for stub_id in self.added_stub_ids:
+            self.controller.delete_mapping(stub_id)
+        for stub in self.stubs:
+            self.controller.update_mapping(stub['id'], stub)
+        if self.stubs:
+            self.controller.reset_scenarios()
+        if self.settings is not None:
+            self.controller.update_settings(self.settings)
+
+
+def save_stubs(stubs, dir_path, clean=False):
+    """Save stubs to a directory as content-hashed json files ('<hash>.json'), deduplicating identical stubs.
+
+    The stubs are saved without their ids, so the directory can be loaded using `set_mapping_from_dir` (or synced).
+
+    :param list stubs: the stubs json objects.
+    :param str dir_path: target directory path, created if missing.
+    :param bool clean: whether to remove the directory json files which are not one of the saved stubs.
+    :return list: the saved stubs file paths.
+    """
+    if not os.path.isdir(dir_path):
+        os.makedirs(dir_path)
+
+    paths = []
+    for stub in stubs:
+        stub = dict((key, value) for key, value in stub.items() if key not in ('id', 'uuid', 'persistent'))
+        path = os.path.join(dir_path, '%s.json' % get_stub_hash(stub)[:16])
+        if path in paths:
+            continue
+
+        with open(path, 'w') as stub_file:
+            json.dump(stub, stub_file, indent=2, sort_keys=True)
+        paths.append(path)
+
+    if clean:
+        for path in glob.glob(os.path.join(dir_path, '*.json')):
+            if path not in paths:
+                log.debug('Removing stale stub file %s', path)
+                os.remove(path)
+
+    return paths
+
+
+def with_observed_delays(stubs, serve_events):
+    """Return the stubs with delays reproducing the response times observed in the given journal serve events.
+
+    Observed requests are related to the stubs by their method & url. A stub with a stable observed latency gets a
+    fixed delay of the median, otherwise a log-normal delay fitted to the observed p50 & p99.
+
+    :param list stubs: the stubs json objects.
+    :param serve_events: the journal serve events (e.g. a streamed journal iterator).
+    """
+    observed = {}
+    for serve_event in serve_events:
+        if 'timing' in serve_event:
+            key = (serve_event["request"]["method"], serve_event["request"]["url"])
+            observed.setdefault(key, []).append(serve_event["timing"]["totalTime"])
+
+    delayed_stubs = []
+    for stub in stubs:
+        latencies = sorted(observed.get((stub["request"].get("method"), stub["request"].get("url")), []))
+        p50, p99 = journal.percentile(latencies, 50), journal.percentile(latencies, 99)
+        if latencies and p50 >= 1:
+            profile = ResponseProfile()
+            if p99 > p50:
+                profile.lognormal_delay(p50=p50, p99=p99)
+            else:
+                profile.fixed_delay(p50)
+            stub = dict(stub, response=profile.apply_response(stub.get("response", {})))
+        delayed_stubs.append(stub)
+
+    return delayed_stubs
+
+
+class Recording(object):
+    """Result of a recording, available once the recording context ends.
+
+    :ivar list stubs: the recorded stubs.
+    :ivar list paths: the saved stubs file paths.
+    """
+
+    def __init__(self):
+        self.stubs = None
+        self.paths = None
+
+
+def create_session(pool_size=10, retries=3, backoff_factor=0.1, hosts=None):
+    """Return a keep-alive session with a connection pool, retrying with backoff on connection errors.
+
+    :param int pool_size: max number of pooled connections per host.
+    :param int retries: number of retries on connection errors & resets.
+    :param float backoff_factor: backoff factor between retries (sleeps {backoff factor} * 2 ^ {retry number}).
+    :param int hosts: number of hosts to keep connection pools for, defaults to the pool size.
+    """
+    retry = Retry(total=retries, connect=retries, read=retries, backoff_factor=backoff_factor)
+    adapter = HTTPAdapter(pool_connections=hosts or pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
 class WiremockController(object):
     """Utility for managing wiremock based services.
 
@@ -25,23 +527,143 @@ class WiremockController(object):
     >>> controller = WiremockController(url='http://test.service:9999')
     >>> controller.set_mapping_from_dir('some/config/dir')
     >>> controller.reset_mapping()
+
+    The controller sends all the admin API calls over a pooled keep-alive session, close it when done:
+
+    >>> with WiremockController(url='http://test.service:9999') as controller:
+    >>>     controller.reset_mapping()
+
+    The url may be a service reference, resolved on every call - for services published on ephemeral host ports:
+
+    >>> controller = WiremockController(url=environment_controller.service_url('test.service', 8080))
     """
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_RETRIES = 3
+    DEFAULT_BACKOFF_FACTOR = 0.1
+    DEFAULT_BATCH_SIZE = 100
+    DEFAULT_PARALLELISM = 8
+    JOURNAL_CHUNK_SIZE = 64 * 1024
+    WAIT_MIN_INTERVAL = 0.05
+    WAIT_MAX_INTERVAL = 1.0
 
-    def __init__(self, url):
+    def __init__(self, url, session=None, timeout=None, pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR):
         """Initialize the wiremock controller.
 
-        :param str url: wiremock service url.
+        :param url: wiremock service url, or a utils.ServiceReference resolved on every call.
+        :param requests.Session session: session to send the admin API calls with, a pooled session is created
+            (and owned by the controller) if not given.
+        :param float timeout: admin API calls timeout (in seconds), None for no timeout.
+        :param int pool_size: max number of pooled connections (when creating a session).
+        :param int retries: number of retries on connection errors (when creating a session).
+        :param float backoff_factor: backoff factor between retries (when creating a session).
+        """
+        self.service_url = url
+
+        self.timeout = timeout
+        self.owns_session = session is None
+        if session is None:
+            session = create_session(pool_size=pool_size, retries=retries, backoff_factor=backoff_factor)
+        self.session = session
+
+        self.call_stats_lock = threading.Lock()
+        self.call_stats = {}
+
+        # Whether the wiremock server supports the stubs import API, updated on the first import attempt
+        self.import_supported = True
+
+        # Index of {content_hash: stub_uuid} of the stubs set by syncs, loaded from the server on the first sync
+        self.stubs_index = None
+
+    @property
+    def url(self):
+        return utils.resolve_url(self.service_url)
+
+    @property
+    def admin_url(self):
+        return os.path.join(self.url, "__admin")
+
+    @property
+    def admin_mapping_url(self):
+        return os.path.join(self.admin_url, "mappings")
+
+    @property
+    def mapping_reset_url(self):
+        return os.path.join(self.admin_mapping_url, 'reset')
+
+    @property
+    def mapping_import_url(self):
+        return os.path.join(self.admin_mapping_url, 'import')
+
+    @property
+    def settings_url(self):
+        return os.path.join(self.admin_url, "settings")
+
+    @property
+    def recordings_url(self):
+        return os.path.join(self.admin_url, "recordings")
+
+    @property
+    def scenarios_reset_url(self):
+        return os.path.join(self.admin_url, "scenarios", "reset")
+
+    @property
+    def requests_url(self):
+        return "%s/requests" % self.admin_url
+
+    @property
+    def requests_find_url(self):
+        return "%s/find" % self.requests_url
+
+    @property
+    def requests_count_url(self):
+        return "%s/count" % self.requests_url
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the controller session (if owned by the controller)."""
+        if self.owns_session:
+            self.session.close()
+
+    def _request(self, operation, method, url, **kwargs):
+        """Send an admin API call and record its duration under the given operation name.
+
+        :return requests.Response: the admin API response.
+        """
+        start_time = time.time()
+        try:
+            return self.session.request(method, url, timeout=self.timeout, **kwargs)
+        finally:
+            duration = time.time() - start_time
+            with self.call_stats_lock:
+                count, total = self.call_stats.get(operation, (0, 0.0))
+                self.call_stats[operation] = (count + 1, total + duration)
+
+    def get_call_stats(self):
+        """Return the admin API calls count and durations (in seconds) per operation.
+
+        :return dict: of format {operation: {"count": count, "total": total_duration, "avg": avg_duration}}
         """
-        self.url = url
-        self.admin_url = os.path.join(url, "__admin")
-        self.admin_mapping_url = os.path.join(self.admin_url, "mappings")
-        self.mapping_reset_url = os.path.join(self.admin_mapping_url, 'reset')
-        self.requests_url = "%s/requests" % self.admin_url
+        with self.call_stats_lock:
+            return {operation: {"count": count, "total": total, "avg": total / count}
+                    for operation, (count, total) in self.call_stats.items()}
 
-    def set_mapping_from_dir(self, dir_path):
+    def reset_call_stats(self):
+        """Reset the admin API calls counters."""
+        with self.call_stats_lock:
+            self.call_stats = {}
+
+    def set_mapping_from_dir(self, dir_path, batch_size=DEFAULT_BATCH_SIZE, parallelism=DEFAULT_PARALLELISM):
         """Set wiremock service mapping based on given directory.
 
         :param str dir_path: directory path to scan - should contain json mapping files.
+        :param int batch_size: max number of stubs imported per admin API call.
+        :param int parallelism: max number of concurrent uploads, when falling back to uploading stub per call.
         :return dict: of format {json_file_path: stub_uuid} the uuid of the mapping stub
         """
         log.debug('Setting service %s wiremock mapping using directory %s', self.url, dir_path)
@@ -49,16 +671,239 @@ class WiremockController(object):
             raise ValueError("'%s' is not a valid dir" % dir_path)
 
         mapping_files_pattern = os.path.join(dir_path, '*.json')
-        return self.set_mapping_from_files(glob.iglob(mapping_files_pattern))
+        return self.set_mapping_from_files(glob.iglob(mapping_files_pattern),
+                                           batch_size=batch_size,
+                                           parallelism=parallelism)
 
-    def set_mapping_from_files(self, json_paths):
+    def set_mapping_from_files(self, json_paths, batch_size=DEFAULT_BATCH_SIZE, parallelism=DEFAULT_PARALLELISM):
         """Set wiremock service mapping based on given json paths.
 
+        The stubs are uploaded in batches using the wiremock import API. Servers which don't support the import API
+        (and batches which fail to import) fall back to a bounded parallel upload of a stub per call.
+        A failure to load or upload a stub doesn't prevent the other stubs from being uploaded.
+
+        :param list json_paths: list of json stub file paths.
+        :param int batch_size: max number of stubs imported per admin API call.
+        :param int parallelism: max number of concurrent uploads, when falling back to uploading stub per call.
+        :return dict: of format {json_file_path: stub_uuid} the uuid of the mapping stub
+        :raise WiremockMappingError: once all the stubs were handled, if some of them failed to load or upload.
+        """
+        stubs = []
+        errors = {}
+        for json_path in json_paths:
+            try:
+                with open(json_path, 'r') as json_file:
+                    stubs.append((json_path, with_stub_id(json.load(json_file))))
+            except (IOError, ValueError) as error:
+                errors[json_path] = "Failed loading stub: %s" % error
+
+        stub_ids = self.set_mappings(stubs, errors=errors, batch_size=batch_size, parallelism=parallelism)
+
+        if errors:
+            log.error("Failed setting service %s wiremock mapping using files: %s", self.url, errors)
+            raise WiremockMappingError("Failed setting service %s wiremock mapping using %d files" %
+                                       (self.url, len(errors)), errors=errors, stub_ids=stub_ids)
+
+        return stub_ids
+
+    def sync_mapping_from_dir(self, dir_path, batch_size=DEFAULT_BATCH_SIZE, parallelism=DEFAULT_PARALLELISM):
+        """Sync wiremock service mapping with the given directory, uploading only new or changed stubs.
+
+        :param str dir_path: directory path to scan - should contain json mapping files.
+        :param int batch_size: max number of stubs imported per admin API call.
+        :param int parallelism: max number of concurrent uploads & deletions.
+        :return dict: of format {json_file_path: stub_uuid} the uuid of the mapping stub
+        """
+        log.debug('Syncing service %s wiremock mapping using directory %s', self.url, dir_path)
+        if not os.path.isdir(dir_path):
+            raise ValueError("'%s' is not a valid dir" % dir_path)
+
+        mapping_files_pattern = os.path.join(dir_path, '*.json')
+        return self.sync_mapping_from_files(glob.iglob(mapping_files_pattern),
+                                            batch_size=batch_size,
+                                            parallelism=parallelism)
+
+    def sync_mapping_from_files(self, json_paths, batch_size=DEFAULT_BATCH_SIZE, parallelism=DEFAULT_PARALLELISM):
+        """Sync wiremock service mapping with the given json paths, uploading only new or changed stubs.
+
+        Each stub is identified by a hash of its normalized json, stamped in the stub metadata. The controller keeps
+        an index of the synced stubs hashes, so syncing unchanged stubs costs no admin API calls. Stubs set by
+        previous syncs which are not in the given files are deleted, other stubs are left untouched.
+
         :param list json_paths: list of json stub file paths.
+        :param int batch_size: max number of stubs imported per admin API call.
+        :param int parallelism: max number of concurrent uploads & deletions.
         :return dict: of format {json_file_path: stub_uuid} the uuid of the mapping stub
+        :raise WiremockMappingError: once all the stubs were handled, if some of them failed to load or upload.
+        """
+        stubs_index = self.get_stubs_index()
+
+        errors = {}
+        paths_by_hash = {}
+        new_stubs = {}
+        for json_path in json_paths:
+            try:
+                with open(json_path, 'r') as json_file:
+                    json_object = json.load(json_file)
+            except (IOError, ValueError) as error:
+                errors[json_path] = "Failed loading stub: %s" % error
+                continue
+
+            stub_hash = get_stub_hash(json_object)
+            paths_by_hash.setdefault(stub_hash, []).append(json_path)
+            if stub_hash not in stubs_index and stub_hash not in new_stubs:
+                new_stubs[stub_hash] = with_stub_hash(with_stub_id(json_object), stub_hash)
+
+        upload_errors = {}
+        uploaded = self.set_mappings(list(new_stubs.items()), errors=upload_errors,
+                                     batch_size=batch_size, parallelism=parallelism)
+        stubs_index.update(uploaded)
+        for stub_hash, error in upload_errors.items():
+            errors.update((json_path, error) for json_path in paths_by_hash[stub_hash])
+
+        # Stubs which were overwritten by a changed stub with the same id need no deletion
+        uploaded_ids = set(uploaded.values())
+        removed = [(stub_hash, stub_id) for stub_hash, stub_id in stubs_index.items() if stub_hash not in paths_by_hash]
+        for stub_hash, stub_id in removed:
+            if stub_id in uploaded_ids:
+                del stubs_index[stub_hash]
+        removed = [(stub_hash, stub_id) for stub_hash, stub_id in removed if stub_id not in uploaded_ids]
+
+        if removed:
+            pool = ThreadPool(processes=min(parallelism, len(removed)))
+            try:
+                results = pool.map(self._try_delete_mapping, [stub_id for _, stub_id in removed])
+            finally:
+                pool.close()
+
+            for (stub_hash, stub_id), error in zip(removed, results):
+                if error is None:
+                    del stubs_index[stub_hash]
+                else:
+                    # Kept in the index, so the deletion is retried on the next sync
+                    log.warning("Failed deleting stub %s from service %s wiremock mapping: %s", stub_id, self.url, error)
+
+        log.debug("Synced service %s wiremock mapping: %d stubs uploaded, %d deleted, %d unchanged",
+                  self.url, len(uploaded), len(removed), len(paths_by_hash) - len(new_stubs))
+
+        stub_ids = dict((json_path, stubs_index[stub_hash])
+                        for stub_hash, json_paths in paths_by_hash.items() if stub_hash in stubs_index
+                        for json_path in json_paths)
+
+        if errors:
+            log.error("Failed syncing service %s wiremock mapping using files: %s", self.url, errors)
+            raise WiremockMappingError("Failed syncing service %s wiremock mapping using %d files" %
+                                       (self.url, len(errors)), errors=errors, stub_ids=stub_ids)
+
+        return stub_ids
+
+    def get_stubs_index(self):
+        """Return the index of synced stubs, loading it from the server stubs metadata if not loaded yet.
+
+        :return dict: of format {content_hash: stub_uuid}.
+        :raise WiremockError: on failure to get the service mapping.
+        """
+        if self.stubs_index is None:
+            log.debug('Loading service %s wiremock synced stubs', self.url)
+            stubs_index = {}
+            for mapping in self.get_mappings():
+                stub_hash = (mapping.get('metadata') or {}).get(STUB_HASH_KEY)
+                if stub_hash:
+                    stubs_index[stub_hash] = mapping.get('id') or mapping['uuid']
+            self.stubs_index = stubs_index
+
+        return self.stubs_index
+
+    def invalidate_stubs_index(self):
+        """Forget the synced stubs index, so it's reloaded from the server on the next sync.
+
+        Should be called when the service mapping was changed externally (e.g. the service was restarted).
+        """
+        self.stubs_index = None
+
+    def set_mappings(self, stubs, errors, batch_size=DEFAULT_BATCH_SIZE, parallelism=DEFAULT_PARALLELISM):
+        """Set wiremock service mapping based on the given stubs, in batches.
+
+        :param list stubs: list of (key, json_object) tuples, each stub json must contain its id.
+        :param dict errors: per key errors output dictionary.
+        :param int batch_size: max number of stubs imported per admin API call.
+        :param int parallelism: max number of concurrent uploads, when falling back to uploading stub per call.
+        :return dict: of format {key: stub_uuid} of the successfully uploaded stubs.
+        """
+        stub_ids = {}
+        fallback_stubs = []
+        for index in range(0, len(stubs), batch_size):
+            batch = stubs[index:index + batch_size]
+            if self.import_supported and self._import_mappings([json_object for _, json_object in batch]):
+                stub_ids.update((key, json_object['id']) for key, json_object in batch)
+            else:
+                fallback_stubs.extend(batch)
+
+        if fallback_stubs:
+            pool = ThreadPool(processes=min(parallelism, len(fallback_stubs)))
+            try:
+                results = pool.map(self._try_set_mapping_from_json, [json_object for _, json_object in fallback_stubs])
+            finally:
+                pool.close()
+
+            for (key, _), (stub_id, error) in zip(fallback_stubs, results):
+                if error is None:
+                    stub_ids[key] = stub_id
+                else:
+                    errors[key] = error
+
+        return stub_ids
+
+    def _import_mappings(self, json_objects):
+        """Import the given stubs using a single admin API call.
+
+        :return bool: True if the stubs were imported, False otherwise.
+        """
+        log.debug('Importing %d stubs to service %s wiremock mapping', len(json_objects), self.url)
+        try:
+            response = self._request('import_mappings', 'POST', self.mapping_import_url,
+                                     json={"mappings": json_objects,
+                                           "importOptions": {"duplicatePolicy": "OVERWRITE",
+                                                             "deleteAllNotInImport": False}})
+        except requests.RequestException as error:
+            log.warning('Failed importing stubs to service %s wiremock mapping: %s', self.url, error)
+            return False
+
+        if response.status_code in (http_client.NOT_FOUND, http_client.METHOD_NOT_ALLOWED):
+            log.info('Service %s wiremock does not support stubs import, uploading a stub per call', self.url)
+            self.import_supported = False
+            return False
+
+        if not response.ok:
+            log.warning('Failed importing stubs to service %s wiremock mapping: %s', self.url, response.text)
+            return False
+
+        return True
+
+    def _try_set_mapping_from_json(self, json_object):
+        """Set wiremock service mapping based on given json object.
+
+        :return tuple: (stub_uuid, None) on success, (None, error) on failure.
         """
+        try:
+            return self.set_mapping_from_json(json_object), None
+        except WiremockError as error:
+            return None, str(error)
+
+    def _try_delete_mapping(self, stub_id):
+        """Delete the given stub from the wiremock service mapping, a stub which doesn't exist counts as deleted.
+
+        :return str: None on success, the error on failure.
+        """
+        try:
+            response = self._request('delete_mapping', 'DELETE', os.path.join(self.admin_mapping_url, stub_id))
+        except requests.RequestException as error:
+            return str(error)
+
+        if response.status_code != http_client.NOT_FOUND and not response.ok:
+            return response.text
 
-        return {json_path: self.set_mapping_from_file(json_path) for json_path in json_paths}
+        return None
 
     def set_mapping_from_file(self, json_path):
         """Set wiremock service mapping based on given json path.
@@ -80,7 +925,7 @@ class WiremockController(object):
         """
         log.debug('Setting service %s wiremock mapping using json: %s', self.url, json_object)
         try:
-            resp = requests.post(self.admin_mapping_url, json=json_object)
+            resp = self._request('set_mapping', 'POST', self.admin_mapping_url, json=json_object)
             resp.raise_for_status()
         except:
             log.exception("Failed setting service %s wiremock mapping using json: %s", self.url, json_object)
@@ -88,6 +933,256 @@ class WiremockController(object):
 
         return resp.json()['uuid']
 
+    def get_mappings(self):
+        """Get all the wiremock service stubs.
+
+        :return list: the stubs json objects.
+        :raise WiremockError: on failure to get the service mapping.
+        """
+        response = self._request('get_mappings', 'GET', self.admin_mapping_url)
+        if response.status_code != http_client.OK:
+            raise WiremockError('Failed getting service %s wiremock mapping: %s' % (self.url, response.text))
+        return response.json().get('mappings', [])
+
+    def get_mapping(self, stub_id):
+        """Get a wiremock service stub.
+
+        :param str stub_id: the stub uuid.
+        :return dict: the stub json object.
+        :raise WiremockError: on failure to get the stub.
+        """
+        response = self._request('get_mapping', 'GET', os.path.join(self.admin_mapping_url, stub_id))
+        if response.status_code != http_client.OK:
+            raise WiremockError('Failed getting service %s wiremock stub %s: %s' % (self.url, stub_id, response.text))
+        return response.json()
+
+    def update_mapping(self, stub_id, json_object):
+        """Update (replace) a wiremock service stub.
+
+        :param str stub_id: the stub uuid.
+        :param dict json_object: the new stub json object.
+        :raise WiremockError: on failure to update the stub.
+        """
+        log.debug('Updating service %s wiremock stub %s using json: %s', self.url, stub_id, json_object)
+        response = self._request('update_mapping', 'PUT', os.path.join(self.admin_mapping_url, stub_id),
+                                 json=json_object)
+        if not response.ok:
+            raise WiremockError('Failed updating service %s wiremock stub %s: %s' % (self.url, stub_id, response.text))
+
+    def delete_mapping(self, stub_id):
+        """Delete a wiremock service stub, a stub which doesn't exist counts as deleted.
+
+        :param str stub_id: the stub uuid.
+        :raise WiremockError: on failure to delete the stub.
+        """
+        error = self._try_delete_mapping(stub_id)
+        if error is not None:
+            raise WiremockError('Failed deleting service %s wiremock stub %s: %s' % (self.url, stub_id, error))
+
+    def get_settings(self):
+        """Get the wiremock service global settings.
+
+        :return dict: the global settings, empty if the server doesn't expose them.
+        """
+        response = self._request('get_settings', 'GET', self.settings_url)
+        if response.status_code != http_client.OK:
+            return {}
+        return response.json().get('settings', {})
+
+    def update_settings(self, settings):
+        """Update the wiremock service global settings (e.g. {"fixedDelay": 100}).
+
+        :raise WiremockError: on failure to update the settings.
+        """
+        response = self._request('update_settings', 'POST', self.settings_url, json=settings)
+        if not response.ok:
+            raise WiremockError('Failed updating service %s wiremock settings: %s' % (self.url, response.text))
+
+    def reset_scenarios(self):
+        """Reset the wiremock service scenarios to their started state.
+
+        :raise WiremockError: on failure to reset the scenarios.
+        """
+        response = self._request('reset_scenarios', 'POST', self.scenarios_reset_url)
+        if not response.ok:
+            raise WiremockError('Failed resetting service %s wiremock scenarios: %s' % (self.url, response.text))
+
+    def apply_response_profile(self, profile, stub_ids=None):
+        """Apply a response profile to the given stubs.
+
+        When no stubs are given, the profile delay is applied globally (using the wiremock global settings) and its
+        throttling & faults are applied to all the current stubs.
+
+        :param ResponseProfile profile: the profile to apply.
+        :param list stub_ids: uuids of the stubs to apply the profile to, None for all the stubs.
+        :return AppliedProfile: the applied profile, which can be reverted.
+        """
+        settings = None
+        if stub_ids is None:
+            stubs = self.get_mappings()
+            if profile.delay is not None:
+                settings = self.get_settings()
+                self.update_settings(dict(settings, **profile.get_settings()))
+                profile = copy.copy(profile)
+                profile.delay = None
+        else:
+            stubs = [self.get_mapping(stub_id) for stub_id in stub_ids]
+
+        applied = AppliedProfile(controller=self, settings=settings, stubs=[], added_stub_ids=[])
+        if profile.delay is None and profile.dribble is None and profile.bytes_per_second is None \
+                and not profile.fault_ratio:
+            return applied
+
+        try:
+            for stub in stubs:
+                stub = dict(stub, id=stub.get('id') or stub['uuid'])
+                profile_stubs = profile.apply_stub(stub)
+                self.update_mapping(stub['id'], profile_stubs[0])
+                applied.stubs.append(stub)
+                for added_stub in profile_stubs[1:]:
+                    applied.added_stub_ids.append(self.set_mapping_from_json(added_stub))
+        except:
+            applied.revert()
+            raise
+
+        if applied.added_stub_ids:
+            self.reset_scenarios()
+
+        return applied
+
+    @contextmanager
+    def response_profile(self, profile, stub_ids=None):
+        """Response profile context manager.
+
+        Apply the profile to the given stubs (or globally) within the context, once the context ends revert the
+        stubs and the global settings.
+
+        :param ResponseProfile profile: the profile to apply.
+        :param list stub_ids: uuids of the stubs to apply the profile to, None for all the stubs.
+
+        Usage:
+
+        >>> with controller.response_profile(ResponseProfile().lognormal_delay(p50=100, p99=2000)):
+        >>>     # the service responses p99 latency is 2 seconds in this context
+        """
+        applied = self.apply_response_profile(profile, stub_ids=stub_ids)
+        try:
+            yield applied
+        finally:
+            applied.revert()
+
+    def start_recording(self, target_url, filters=None, capture_headers=None, repeats_as_scenarios=False):
+        """Start recording the requests proxied to the given target.
+
+        :param str target_url: base url of the target to proxy the requests to.
+        :param dict filters: wiremock recording filters (e.g. {"urlPathPattern": "/api/.*"}).
+        :param dict capture_headers: request headers to match on in the recorded stubs (e.g. {"Accept": {}}).
+        :param bool repeats_as_scenarios: whether to record repeated requests as scenarios.
+        :raise WiremockError: on failure to start recording.
+        """
+        log.debug('Starting service %s wiremock recording of %s', self.url, target_url)
+        spec = self._get_recording_spec(filters, capture_headers, repeats_as_scenarios)
+        spec["targetBaseUrl"] = target_url
+        response = self._request('start_recording', 'POST', os.path.join(self.recordings_url, 'start'), json=spec)
+        if not response.ok:
+            raise WiremockError('Failed starting service %s wiremock recording: %s' % (self.url, response.text))
+
+    def stop_recording(self):
+        """Stop recording.
+
+        :return list: the recorded stubs.
+        :raise WiremockError: on failure to stop recording.
+        """
+        log.debug('Stopping service %s wiremock recording', self.url)
+        response = self._request('stop_recording', 'POST', os.path.join(self.recordings_url, 'stop'))
+        if not response.ok:
+            raise WiremockError('Failed stopping service %s wiremock recording: %s' % (self.url, response.text))
+        return response.json()["mappings"]
+
+    def snapshot_recording(self, filters=None, capture_headers=None, repeats_as_scenarios=False):
+        """Return stubs recorded from the proxied requests already in the journal.
+
+        :param dict filters: wiremock recording filters (e.g. {"urlPathPattern": "/api/.*"}).
+        :param dict capture_headers: request headers to match on in the recorded stubs (e.g. {"Accept": {}}).
+        :param bool repeats_as_scenarios: whether to record repeated requests as scenarios.
+        :return list: the recorded stubs.
+        :raise WiremockError: on failure to take the snapshot.
+        """
+        spec = self._get_recording_spec(filters, capture_headers, repeats_as_scenarios)
+        response = self._request('snapshot_recording', 'POST', os.path.join(self.recordings_url, 'snapshot'),
+                                 json=spec)
+        if not response.ok:
+            raise WiremockError('Failed taking service %s wiremock snapshot: %s' % (self.url, response.text))
+        return response.json()["mappings"]
+
+    @staticmethod
+    def _get_recording_spec(filters, capture_headers, repeats_as_scenarios):
+        """Return a wiremock recording spec, the stubs are returned rather than persisted by the server."""
+        spec = {"persist": False, "repeatsAsScenarios": repeats_as_scenarios}
+        if filters:
+            spec["filters"] = filters
+        if capture_headers:
+            spec["captureHeaders"] = capture_headers
+        return spec
+
+    def get_recording_status(self):
+        """Return the recording status ('NeverStarted', 'Recording' or 'Stopped')."""
+        response = self._request('get_recording_status', 'GET', os.path.join(self.recordings_url, 'status'))
+        if response.status_code != http_client.OK:
+            raise WiremockError('Failed getting service %s wiremock recording status: %s' % (self.url, response.text))
+        return response.json()["status"]
+
+    def save_recorded_stubs(self, stubs, dir_path, keep_delays=False, clean=False, since=None):
+        """Save recorded stubs to a content-hashed stubs directory.
+
+        :param list stubs: the recorded stubs.
+        :param str dir_path: target directory path.
+        :param bool keep_delays: whether to add delays reproducing the response times observed in the journal.
+        :param bool clean: whether to remove the directory stubs which were not recorded.
+        :param since: only fit the delays to requests logged after this time (an ISO 8601 string or a datetime).
+        :return list: the saved stubs file paths.
+        """
+        if keep_delays:
+            stubs = with_observed_delays(stubs, self.iter_request_journal(since=since))
+        return save_stubs(stubs, dir_path, clean=clean)
+
+    @contextmanager
+    def recording(self, target_url, dir_path, keep_delays=False, clean=False, **options):
+        """Recording context manager.
+
+        Proxy the requests to the target and record them within the context, once the context ends save the recorded
+        stubs to the given directory.
+
+        :param str target_url: base url of the target to proxy the requests to.
+        :param str dir_path: directory path to save the recorded stubs to.
+        :param bool keep_delays: whether to add delays reproducing the response times observed while recording.
+        :param bool clean: whether to remove the directory stubs which were not recorded.
+        :param options: recording options, see `start_recording`.
+
+        Usage:
+
+        >>> with controller.recording('http://real.service:8080', 'tests/stubs/real.service') as recording:
+        >>>     # requests to the wiremock service are proxied to the real service in this context
+        >>>
+        >>> # recording.paths holds the saved stubs files
+        """
+        recording = Recording()
+        started = datetime.datetime.utcnow()
+        self.start_recording(target_url, **options)
+        try:
+            yield recording
+        except:
+            try:
+                self.stop_recording()
+            except:
+                log.exception('Failed stopping service %s wiremock recording', self.url)
+            raise
+
+        recording.stubs = self.stop_recording()
+        recording.paths = self.save_recorded_stubs(recording.stubs, dir_path, keep_delays=keep_delays, clean=clean,
+                                                   since=started)
+        log.debug('Recorded %d stubs of %s to %s', len(recording.paths), target_url, dir_path)
+
     def reset_mapping(self):
         """Reset wiremock service mapping.
 
@@ -95,30 +1190,66 @@ class WiremockController(object):
         """
         log.debug('Resetting %s wiremock mapping', self.url)
         try:
-            requests.post(self.mapping_reset_url).raise_for_status()
+            self._request('reset_mapping', 'POST', self.mapping_reset_url).raise_for_status()
         except:
+            self.invalidate_stubs_index()
             log.exception('Failed resetting %s wiremock mapping', self.url)
             raise WiremockError('Failed resetting %s wiremock mapping' % self.url)
 
+        # Reset restores the default mapping, dropping the synced stubs
+        self.invalidate_stubs_index()
+
     def get_request_journal(self):
         """Get the wiremock service request journal.
 
         :raise ValueError: on failure to retrieve journal from Wiremock admin API.
         """
-        response = requests.get(self.requests_url)
+        response = self._request('get_request_journal', 'GET', self.requests_url)
         if response.status_code != http_client.OK:
             raise ValueError(response.text, response.status_code)
         response_body = json.loads(response.text)
         return response_body["requests"]
 
-    def get_matching_requests(self, inner_url=None, stub_id=None):
+    def iter_request_journal(self, since=None, limit=None, stub_id=None, chunk_size=JOURNAL_CHUNK_SIZE):
+        """Iterate the wiremock service request journal (newest first), streaming it so memory stays bounded.
+
+        :param since: only return requests logged after this time (an ISO 8601 string or a datetime).
+        :param int limit: max number of (newest) requests to return.
+        :param str stub_id: only return requests matched by this stub (on servers supporting this filter).
+        :param int chunk_size: size of the chunks the journal is read in.
+        :raise ValueError: on failure to retrieve journal from Wiremock admin API.
+        """
+        params = {}
+        if since is not None:
+            params['since'] = format_since(since)
+        if limit is not None:
+            params['limit'] = limit
+        if stub_id is not None:
+            params['matchingStub'] = stub_id
+
+        response = self._request('get_request_journal', 'GET', self.requests_url, params=params, stream=True)
+        try:
+            if response.status_code != http_client.OK:
+                raise ValueError(response.text, response.status_code)
+
+            response.encoding = response.encoding or 'utf-8'
+            for request in JsonArrayStream(response.iter_content(chunk_size, decode_unicode=True), key="requests"):
+                yield request
+        finally:
+            response.close()
+
+    def get_matching_requests(self, inner_url=None, stub_id=None, since=None, limit=None):
         """Get all wiremock service requests of the given type (by inner URL) from  the journal.
 
+        The journal is streamed and filtered while read, so only the matching requests are kept in memory.
+
         :param inner_url: The inner URL with which to filter journal requests by matching.
         :param stub_id: The matched stub id with which to filter journal requests by matching.
+        :param since: only return requests logged after this time (an ISO 8601 string or a datetime).
+        :param int limit: max number of (newest) journal requests to scan.
         """
         matching_requests = []
-        for request in self.get_request_journal():
+        for request in self.iter_request_journal(since=since, limit=limit, stub_id=stub_id):
             if inner_url is not None and request["request"]["url"] != inner_url:
                 continue
             if stub_id is not None and (not request["wasMatched"] or request["stubMapping"]["uuid"] != stub_id):
@@ -127,6 +1258,234 @@ class WiremockController(object):
 
         return matching_requests
 
+    def get_journal_analytics(self, since=None, limit=None, stub_id=None):
+        """Get the request rates, inter-arrival, concurrency & timing stats of the journal, per stub and per url.
+
+        The journal is streamed and analyzed in a single pass.
+
+        :param since: only analyze requests logged after this time (an ISO 8601 string or a datetime).
+        :param int limit: max number of (newest) requests to analyze.
+        :param str stub_id: only analyze requests matched by this stub (on servers supporting this filter).
+        :return journal.JournalAnalytics: the journal analytics.
+        """
+        return journal.JournalAnalytics.from_events(self.iter_request_journal(since=since, limit=limit, stub_id=stub_id))
+
+    def find_requests(self, criteria=None):
+        """Find the journal requests matching the given criteria, filtered on the server side.
+
+        :param dict criteria: wiremock request pattern (see `request_pattern`), all requests when not given.
+        :return list: the matching logged requests (of the format of the journal entries 'request' item).
+        :raise ValueError: on failure to find requests using Wiremock admin API.
+        """
+        response = self._request('find_requests', 'POST', self.requests_find_url, json=criteria or request_pattern())
+        if response.status_code != http_client.OK:
+            raise ValueError(response.text, response.status_code)
+        return response.json()["requests"]
+
+    def count_requests(self, criteria=None):
+        """Count the journal requests matching the given criteria, without transferring them.
+
+        :param dict criteria: wiremock request pattern (see `request_pattern`), all requests when not given.
+        :return int: the number of matching requests.
+        :raise ValueError: on failure to count requests using Wiremock admin API.
+        """
+        response = self._request('count_requests', 'POST', self.requests_count_url, json=criteria or request_pattern())
+        if response.status_code != http_client.OK:
+            raise ValueError(response.text, response.status_code)
+        return response.json()["count"]
+
+    def wait_for_requests(self, criteria=None, count=1, timeout=10, min_interval=WAIT_MIN_INTERVAL,
+                          max_interval=WAIT_MAX_INTERVAL):
+        """Wait until the journal holds at least the given number of requests matching the given criteria.
+
+        The wait polls the requests count endpoint, so each poll transfers a single number regardless of the journal
+        size. The poll interval doubles (up to the max interval) while no new requests arrive, and drops back to the
+        min interval once they do. The matching requests are fetched once, when the count is reached.
+
+        :param dict criteria: wiremock request pattern (see `request_pattern`), all requests when not given.
+        :param int count: the number of matching requests to wait for.
+        :param float timeout: max time to wait (in seconds).
+        :param float min_interval: min time between polls (in seconds).
+        :param float max_interval: max time between polls (in seconds).
+        :return RequestsWaitResult: the matching requests and their arrival timings.
+        :raise WiremockError: if the requests didn't arrive in time.
+        """
+        criteria = criteria or request_pattern()
+        start_time = time.time()
+        deadline = start_time + timeout
+        interval = min_interval
+        polls = 0
+        last_count = 0
+
+        while True:
+            current_count = self.count_requests(criteria)
+            polls += 1
+            if current_count >= count:
+                break
+
+            now = time.time()
+            if now >= deadline:
+                raise WiremockError("Timed out after %ss waiting for %d requests matching %s on service %s, got %d" %
+                                    (timeout, count, criteria, self.url, current_count))
+
+            if current_count > last_count:
+                interval = min_interval
+            last_count = current_count
+            time.sleep(min(interval, deadline - now))
+            interval = min(interval * 2, max_interval)
+
+        requests = self.find_requests(criteria)
+        elapsed = time.time() - start_time
+        arrivals = sorted(request["loggedDate"] / 1000.0 - start_time for request in requests if "loggedDate" in request)
+        log.debug("Got %d requests matching %s on service %s after %.3fs (%d polls)",
+                  len(requests), criteria, self.url, elapsed, polls)
+        return RequestsWaitResult(requests=requests, arrivals=arrivals, elapsed=elapsed, polls=polls)
+
     def delete_request_journal(self):
         """Delete all entries from the service request journal."""
-        requests.delete(self.requests_url).raise_for_status()
+        self._request('delete_request_journal', 'DELETE', self.requests_url).raise_for_status()
+
+
+class InstanceResult(object):
+    """Result of an operation on a single wiremock instance of a cluster.
+
+    :ivar result: the operation return value (None on failure).
+    :ivar Exception error: the operation error (None on success).
+    :ivar float duration: the operation duration (in seconds).
+    """
+
+    def __init__(self, result, error, duration):
+        self.result = result
+        self.error = error
+        self.duration = duration
+
+    def __repr__(self):
+        return '<InstanceResult %s duration=%.3fs>' % ('error=%r' % self.error if self.error else 'ok', self.duration)
+
+
+class WiremockCluster(object):
+    """Group of wiremock controllers, running admin operations on all the instances concurrently.
+
+    All the controllers share a single pooled keep-alive session.
+
+    Usage example:
+
+    >>> with WiremockCluster({'service1': 'http://service1:9999', 'service2': 'http://service2:9999'}) as cluster:
+    >>>     cluster.reset_mapping()
+    >>>     cluster.sync_mapping_from_dirs({'service1': 'stubs/service1', 'service2': 'stubs/service2'})
+    >>>     cluster['service1'].get_matching_requests('/test')
+    """
+
+    def __init__(self, urls, timeout=None, pool_size=WiremockController.DEFAULT_POOL_SIZE,
+                 retries=WiremockController.DEFAULT_RETRIES, backoff_factor=WiremockController.DEFAULT_BACKOFF_FACTOR,
+                 parallelism=None):
+        """Initialize the wiremock cluster.
+
+        :param urls: either a dictionary of format {instance_name: url} or a list of urls (used as the names).
+        :param float timeout: admin API calls timeout (in seconds), None for no timeout.
+        :param int pool_size: max number of pooled connections per instance.
+        :param int retries: number of retries on connection errors.
+        :param float backoff_factor: backoff factor between retries.
+        :param int parallelism: max number of instances operated concurrently, all of them by default.
+        """
+        urls = urls if isinstance(urls, dict) else collections.OrderedDict((url, url) for url in urls)
+        self.session = create_session(pool_size=pool_size, retries=retries, backoff_factor=backoff_factor,
+                                      hosts=max(len(urls), 1))
+        self.controllers = collections.OrderedDict((name, WiremockController(url=url, session=self.session,
+                                                                             timeout=timeout))
+                                                   for name, url in urls.items())
+        self.pool = ThreadPool(processes=parallelism or max(len(self.controllers), 1))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getitem__(self, name):
+        return self.controllers[name]
+
+    def __iter__(self):
+        return iter(self.controllers)
+
+    def __len__(self):
+        return len(self.controllers)
+
+    def close(self):
+        """Stop the cluster workers and close the shared session."""
+        self.pool.close()
+        self.pool.join()
+        self.session.close()
+
+    def run(self, operation, names=None, raise_errors=True, **kwargs):
+        """Run an operation on the given instances concurrently.
+
+        :param operation: either a controller method name or a callable receiving the controller (and the kwargs).
+        :param list names: names of the instances to run the operation on, all the instances by default.
+        :param bool raise_errors: whether to raise an error if the operation failed on some of the instances.
+        :param kwargs: keyword arguments of the operation, a value may be a dictionary of format
+            {instance_name: value} when wrapped using `PerInstance`.
+        :return dict: of format {instance_name: InstanceResult}.
+        :raise WiremockClusterError: once the operation ended on all the instances, if it failed on some of them.
+        """
+        names = list(self.controllers) if names is None else names
+
+        def run_operation(name):
+            controller = self.controllers[name]
+            call = getattr(controller, operation) if isinstance(operation, six.string_types) else partial(operation, controller)
+            call_kwargs = dict((key, value.values[name] if isinstance(value, PerInstance) else value)
+                               for key, value in kwargs.items())
+            start_time = time.time()
+            try:
+                return InstanceResult(result=call(**call_kwargs), error=None, duration=time.time() - start_time)
+            except Exception as error:
+                log.warning("Failed running %s on wiremock instance %s: %s", operation, name, error)
+                return InstanceResult(result=None, error=error, duration=time.time() - start_time)
+
+        results = collections.OrderedDict(zip(names, self.pool.map(run_operation, names)))
+        failed = [name for name, result in results.items() if result.error is not None]
+        if failed and raise_errors:
+            raise WiremockClusterError("Failed running %s on wiremock instances: %s" % (operation, failed),
+                                       results=results)
+        return results
+
+    def reset_mapping(self, **kwargs):
+        """Reset the mapping of all the instances."""
+        return self.run('reset_mapping', **kwargs)
+
+    def sync_mapping_from_dirs(self, dir_paths, **kwargs):
+        """Sync the mapping of the given instances with their stubs directories.
+
+        :param dict dir_paths: of format {instance_name: dir_path}.
+        """
+        return self.run('sync_mapping_from_dir', names=list(dir_paths), dir_path=PerInstance(dir_paths), **kwargs)
+
+    def set_mapping_from_dirs(self, dir_paths, **kwargs):
+        """Set the mapping of the given instances from their stubs directories.
+
+        :param dict dir_paths: of format {instance_name: dir_path}.
+        """
+        return self.run('set_mapping_from_dir', names=list(dir_paths), dir_path=PerInstance(dir_paths), **kwargs)
+
+    def delete_request_journal(self, **kwargs):
+        """Delete the request journal of all the instances."""
+        return self.run('delete_request_journal', **kwargs)
+
+    def count_requests(self, criteria=None, **kwargs):
+        """Count the requests matching the given criteria on all the instances."""
+        return self.run('count_requests', criteria=criteria, **kwargs)
+
+    def find_requests(self, criteria=None, **kwargs):
+        """Find the requests matching the given criteria on all the instances."""
+        return self.run('find_requests', criteria=criteria, **kwargs)
+
+    def get_matching_requests(self, inner_url=None, stub_id=None, **kwargs):
+        """Get the journal requests matching the given inner url / stub on all the instances."""
+        return self.run('get_matching_requests', inner_url=inner_url, stub_id=stub_id, **kwargs)
+
+
+class PerInstance(object):
+    """Marks an operation keyword argument as a dictionary of per instance values ({instance_name: value})."""
+
+    def __init__(self, values):
+        self.values = values
@@ -1,17 +1,32 @@
 """utilized by in pytest configuration."""
+from docker_test_tools import ordering
+from docker_test_tools.config import Config
 from docker_test_tools.environment import EnvironmentController
 
-controller = EnvironmentController.from_file(config_path='tests/integration/pytest.cfg')
+config_object = Config(config_path='tests/integration/pytest.cfg')
+controller = EnvironmentController.from_config(config_object)
 
 
-def pytest_configure(config):
-    """Run prior to any test - setup the environment."""
-    controller.setup()
+def pytest_collection_modifyitems(session, config, items):
+    """Order the tests by environment affinity, when enabled (`order-tests` / `DTT_ORDER_TESTS`)."""
+    if config_object.order_tests:
+        ordering.order_items(items)
 
 
-def pytest_unconfigure(config):
-    """Run post all tests - tear down the environment."""
+def pytest_collection_finish(session):
+    """Run prior to any test - setup the environment (in lazy services mode, only the collected tests services)."""
+    controller.setup(services=ordering.get_items_services(session.items))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """Run post all tests - tear down the environment and fail the run on resource regressions."""
     controller.teardown()
+    if controller.baseline_path:
+        # The stats baseline is checked on teardown, which may run in the background
+        controller.wait_for_teardown()
+
+    if controller.regression_report is not None and not controller.regression_report.passed:
+        session.exitstatus = 1
 
 
 def pytest_runtest_setup(item):
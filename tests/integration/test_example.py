@@ -33,6 +33,7 @@ class ExampleTest(BaseDockerTest):
         super(ExampleTest, self).setUp()
 
         self.wiremock = WiremockController(url=WIREMOCK_URL)
+        self.addCleanup(self.wiremock.close)
         self.addCleanup(self.wiremock.reset_mapping)
 
     def test_services_sanity(self):
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from docker_test_tools import baseline
+
+
+def get_summary(ram_max, cpu_avg, test_ram_max=None):
+    """Return a numeric stats summary of a single container."""
+    container_stats = {"cpu": {"min": 0.0, "max": 50.0, "avg": cpu_avg},
+                       "ram": {"min": 0, "max": ram_max, "avg": ram_max / 2}}
+    summary = {"containers": {"service1": container_stats}, "tests": {}}
+    if test_ram_max is not None:
+        summary["tests"]["test_1"] = {"service1": {"ram": {"max": test_ram_max}}}
+    return summary
+
+
+class TestBaseline(unittest.TestCase):
+    """Test for the stats baseline comparison."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.test_dir)
+
+    def test_threshold(self):
+        """Validate a threshold is exceeded only when both relative and absolute growth are exceeded."""
+        threshold = baseline.Threshold(relative=0.2, absolute=10)
+        self.assertFalse(threshold.is_exceeded(100, 110))
+        self.assertFalse(threshold.is_exceeded(100, 115))
+        self.assertTrue(threshold.is_exceeded(100, 121))
+        self.assertFalse(threshold.is_exceeded(1000, 1100))
+        self.assertTrue(threshold.is_exceeded(0, 11))
+
+    def test_parse_thresholds(self):
+        """Validate thresholds string parsing."""
+        self.assertEqual(baseline.parse_thresholds(''), baseline.DEFAULT_THRESHOLDS)
+
+        thresholds = baseline.parse_thresholds('ram.max=0.4:1024, cpu.avg=0.5')
+        self.assertEqual(sorted(thresholds), ['cpu.avg', 'ram.max'])
+        self.assertEqual((thresholds['ram.max'].relative, thresholds['ram.max'].absolute), (0.4, 1024))
+        self.assertEqual((thresholds['cpu.avg'].relative, thresholds['cpu.avg'].absolute), (0.5, 0))
+
+        with self.assertRaises(ValueError):
+            baseline.parse_thresholds('ram.max')
+
+    def test_compare(self):
+        """Validate regressions are detected per container and per test."""
+        baseline_path = os.path.join(self.test_dir, 'baselines', 'baseline.json')
+        baseline.save_baseline(get_summary(ram_max=100 * 1000 ** 2, cpu_avg=10, test_ram_max=1000), baseline_path)
+        stored_baseline = baseline.load_baseline(baseline_path)
+
+        thresholds = {'ram.max': baseline.Threshold(relative=0.2, absolute=100),
+                      'cpu.avg': baseline.Threshold(relative=0.5)}
+
+        report = baseline.compare(stored_baseline, get_summary(ram_max=110 * 1000 ** 2, cpu_avg=12), thresholds)
+        self.assertTrue(report.passed)
+
+        report = baseline.compare(stored_baseline,
+                                  get_summary(ram_max=140 * 1000 ** 2, cpu_avg=12, test_ram_max=2000),
+                                  thresholds)
+        self.assertFalse(report.passed)
+        self.assertEqual([(regression.container, regression.metric, regression.test)
+                          for regression in report.regressions],
+                         [('service1', 'ram.max', None), ('service1', 'ram.max', 'test_1')])
+        self.assertIn('service1 ram.max: 100 MB -> 140 MB (+40.0%)', report.format())
+        self.assertFalse(report.to_dict()['passed'])
+
+    def test_compare_containers_diff(self):
+        """Validate new and missing containers are reported without failing the comparison."""
+        current = get_summary(ram_max=100, cpu_avg=10)
+        current["containers"]["service2"] = current["containers"].pop("service1")
+
+        report = baseline.compare(get_summary(ram_max=100, cpu_avg=10), current)
+        self.assertTrue(report.passed)
+        self.assertEqual(report.new_containers, ['service2'])
+        self.assertEqual(report.missing_containers, ['service1'])
+
+    def test_check(self):
+        """Validate the baseline is stored when missing (or in update mode) and compared against otherwise."""
+        baseline_path = os.path.join(self.test_dir, 'baseline.json')
+        report_path = os.path.join(self.test_dir, 'regressions.json')
+
+        self.assertIsNone(baseline.check(get_summary(ram_max=100, cpu_avg=10), baseline_path,
+                                         report_dir=self.test_dir))
+        self.assertEqual(baseline.load_baseline(baseline_path), get_summary(ram_max=100, cpu_avg=10))
+        self.assertFalse(os.path.exists(report_path))
+
+        report = baseline.check(get_summary(ram_max=100, cpu_avg=100), baseline_path, report_dir=self.test_dir)
+        self.assertFalse(report.passed)
+        self.assertTrue(os.path.exists(report_path))
+
+        self.assertIsNone(baseline.check(get_summary(ram_max=100, cpu_avg=100), baseline_path, mode='update'))
+        self.assertEqual(baseline.load_baseline(baseline_path), get_summary(ram_max=100, cpu_avg=100))
@@ -0,0 +1,254 @@
+import os
+import json
+import mock
+import time
+import shutil
+import tempfile
+import unittest
+
+from docker_test_tools import stats
+from docker_test_tools import cgroups
+
+CONTAINER_ID = 'aaaabbbbcccc'
+CONTAINER_NAME = 'test-project_service1_1'
+CONTAINER_PID = 4321
+NET_DEV = ('Inter-|   Receive                            |  Transmit\n'
+           ' face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets\n'
+           '    lo:    1000      10    0    0    0     0          0         0     1000      10\n'
+           '  eth0:     200       2    0    0    0     0          0         0      100       1\n')
+
+
+class TestSampleRing(unittest.TestCase):
+    """Test for the samples ring."""
+
+    def test_append_and_iterate(self):
+        """Validate samples are kept in order and the oldest are overwritten once the ring is full."""
+        ring = cgroups.SampleRing(capacity=3)
+        self.assertIsNone(ring.latest())
+
+        for index in range(5):
+            ring.append(float(index), index, index * 10, index * 100)
+
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.latest(), (4.0, 4, 40, 400, 0, False))
+        self.assertEqual([sample[0] for sample in ring], [2.0, 3.0, 4.0])
+
+        ring.append(5.0, 5, 50, 500, net_io=5000, reset=True)
+        self.assertEqual(ring.latest(), (5.0, 5, 50, 500, 5000, True))
+
+
+class TestContainerCgroup(unittest.TestCase):
+    """Test for the container cgroup reader, using a fake cgroup tree."""
+
+    def setUp(self):
+        """Create a temporary cgroup root directory."""
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary cgroup root directory."""
+        shutil.rmtree(self.root)
+
+    def write_files(self, dir_path, files):
+        """Write the given {name: content} files under the given directory."""
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+
+        for name, content in files.items():
+            with open(os.path.join(dir_path, name), 'w') as cgroup_file:
+                cgroup_file.write(content)
+
+    def test_read_v2(self):
+        """Validate reading a cgroup v2 container directory (systemd driver layout)."""
+        self.write_files(self.root, {'cgroup.controllers': 'cpu memory io'})
+        container_dir = os.path.join(self.root, 'system.slice', 'docker-%s.scope' % CONTAINER_ID)
+        self.write_files(container_dir, {
+            'cpu.stat': 'usage_usec 1500\nuser_usec 1000\nsystem_usec 500\n',
+            'memory.current': '10000\n',
+            'memory.stat': 'anon 8000\ninactive_file 2000\n',
+            'io.stat': '8:0 rbytes=100 wbytes=50 rios=1 wios=1\n8:16 rbytes=10 wbytes=5 rios=1 wios=1\n',
+        })
+
+        cgroup = cgroups.ContainerCgroup.find(CONTAINER_ID, root=self.root)
+        self.assertEqual(cgroup.read(), (1500, 8000, 165))
+
+        # Files are re-read from their start on each read
+        self.write_files(container_dir, {'memory.current': '20000\n'})
+        self.assertEqual(cgroup.read(), (1500, 18000, 165))
+        cgroup.close()
+
+    def test_read_v1(self):
+        """Validate reading cgroup v1 container directories (cgroupfs driver layout)."""
+        self.write_files(os.path.join(self.root, 'cpuacct', 'docker', CONTAINER_ID),
+                         {'cpuacct.usage': '3000000\n'})
+        self.write_files(os.path.join(self.root, 'memory', 'docker', CONTAINER_ID),
+                         {'memory.usage_in_bytes': '5000\n', 'memory.stat': 'cache 1000\ntotal_inactive_file 1000\n'})
+        self.write_files(os.path.join(self.root, 'blkio', 'docker', CONTAINER_ID),
+                         {'blkio.throttle.io_service_bytes': '8:0 Read 40\n8:0 Write 2\n8:0 Total 42\nTotal 42\n'})
+
+        cgroup = cgroups.ContainerCgroup.find(CONTAINER_ID, root=self.root)
+        self.assertEqual(cgroup.read(), (3000, 4000, 42))
+        cgroup.close()
+
+    def test_read_net(self):
+        """Validate the network usage is read from the container process network devices file, without loopback."""
+        self.write_files(self.root, {'cgroup.controllers': 'cpu memory io'})
+        self.write_files(os.path.join(self.root, 'docker', CONTAINER_ID), {
+            'cpu.stat': 'usage_usec 1500\n', 'memory.current': '10000\n', 'memory.stat': 'anon 8000\n'})
+        self.write_files(os.path.join(self.root, 'proc', str(CONTAINER_PID), 'net'), {'dev': NET_DEV})
+
+        cgroup = cgroups.ContainerCgroup.find(CONTAINER_ID, root=self.root, pid=CONTAINER_PID,
+                                              proc_root=os.path.join(self.root, 'proc'))
+        self.assertEqual(cgroup.read_net(), 300)
+        cgroup.close()
+
+        # The network usage is not available without the container process
+        cgroup = cgroups.ContainerCgroup.find(CONTAINER_ID, root=self.root)
+        self.assertEqual(cgroup.read_net(), 0)
+        cgroup.close()
+
+    def test_missing_cgroup(self):
+        """Validate None is returned when the container cgroup directory doesn't exist."""
+        self.write_files(self.root, {'cgroup.controllers': 'cpu memory io'})
+        self.assertIsNone(cgroups.ContainerCgroup.find(CONTAINER_ID, root=self.root))
+        self.assertIsNone(cgroups.ContainerCgroup.find(CONTAINER_ID, root=os.path.join(self.root, 'missing')))
+
+
+class TestCgroupStatsCollector(unittest.TestCase):
+    """Test for the cgroup stats collector."""
+
+    def setUp(self):
+        """Create a fake cgroup v2 tree and a target directory."""
+        self.root = tempfile.mkdtemp()
+        self.target_dir = tempfile.mkdtemp()
+
+        with open(os.path.join(self.root, 'cgroup.controllers'), 'w') as controllers_file:
+            controllers_file.write('cpu memory io')
+
+        self.container_dir = os.path.join(self.root, 'docker', CONTAINER_ID)
+        os.makedirs(self.container_dir)
+        for name, content in {'cpu.stat': 'usage_usec 1000\n',
+                              'memory.current': '4096\n',
+                              'memory.stat': 'inactive_file 0\n'}.items():
+            with open(os.path.join(self.container_dir, name), 'w') as cgroup_file:
+                cgroup_file.write(content)
+
+        self.proc_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.proc_root, str(CONTAINER_PID), 'net'))
+        with open(os.path.join(self.proc_root, str(CONTAINER_PID), 'net', 'dev'), 'w') as net_file:
+            net_file.write(NET_DEV)
+
+        self.docker_client = mock.MagicMock()
+        self.docker_client.containers.return_value = [{'Id': CONTAINER_ID, 'Names': ['/' + CONTAINER_NAME]}]
+        self.docker_client.inspect_container.return_value = {'State': {'Pid': CONTAINER_PID}}
+
+    def tearDown(self):
+        """Remove the temporary directories."""
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.target_dir)
+        shutil.rmtree(self.proc_root)
+
+    def get_collector(self):
+        """Return a cgroup stats collector sampling the fake cgroup tree."""
+        return cgroups.CgroupStatsCollector(target_dir_path=self.target_dir,
+                                            project='test-project',
+                                            encoding='utf-8',
+                                            environment_variables={},
+                                            docker_client=self.docker_client,
+                                            rate=200,
+                                            cgroup_root=self.root,
+                                            proc_root=self.proc_root)
+
+    def test_collection(self):
+        """Validate the collector samples the containers and writes the samples & summary files."""
+        collector = self.get_collector()
+        collector.start()
+        self.docker_client.containers.assert_called_once_with(
+            filters={'label': 'com.docker.compose.project=test-project'})
+
+        collector.update('test-1')
+        time.sleep(0.1)
+        collector.stop()
+
+        self.assertFalse(collector.fallback)
+        self.assertGreater(len(collector.rings[CONTAINER_NAME]), 1)
+
+        with open(os.path.join(self.target_dir, 'stats', CONTAINER_NAME + '.json')) as samples_file:
+            samples = json.load(samples_file)
+        self.assertIn({'test': 'test-1'}, samples)
+        self.assertIn({'time': mock.ANY, 'cpu': 0.0, 'ram': 4096, 'net': 300, 'block': 0}, samples)
+
+        with open(os.path.join(self.target_dir, 'stats', 'summary.json')) as summary_file:
+            self.assertIn(CONTAINER_NAME, json.load(summary_file))
+        self.assertEqual(collector.summaries[CONTAINER_NAME].ram_max, 4096)
+
+    def test_follow(self):
+        """Validate containers started after the collection started are sampled once followed."""
+        collector = self.get_collector()
+        collector.start()
+
+        new_container_name = 'test-project_service2_1'
+        shutil.copytree(self.container_dir, os.path.join(self.root, 'docker', 'ddddeeeeffff'))
+        self.docker_client.containers.return_value = [{'Id': CONTAINER_ID, 'Names': ['/' + CONTAINER_NAME]},
+                                                      {'Id': 'ddddeeeeffff', 'Names': ['/' + new_container_name]}]
+        collector.follow(['service2'])
+        time.sleep(0.1)
+        collector.stop()
+
+        self.assertEqual(sorted(collector.cgroups), [CONTAINER_NAME, new_container_name])
+        self.assertGreater(len(collector.rings[new_container_name]), 1)
+        with open(os.path.join(self.target_dir, 'stats', 'summary.json')) as summary_file:
+            self.assertIn(new_container_name, json.load(summary_file))
+
+    def test_rediscovery(self):
+        """Validate a container whose cgroup was replaced (e.g. a recreated container) is re-discovered, without a cpu
+        usage delta across the cgroups."""
+        collector = self.get_collector()
+        collector.cgroups = collector._get_cgroups()
+        collector.rings = {CONTAINER_NAME: cgroups.SampleRing(capacity=10)}
+        collector.summaries = {CONTAINER_NAME: stats.ContainerStats(name=CONTAINER_NAME)}
+
+        previous = {}
+        collector._sample(previous)
+        self.assertIn(CONTAINER_NAME, previous)
+
+        # The container is recreated with a new id (and cgroup), the old cgroup files are no longer readable
+        shutil.copytree(self.container_dir, os.path.join(self.root, 'docker', 'ddddeeeeffff'))
+        with open(os.path.join(self.root, 'docker', 'ddddeeeeffff', 'cpu.stat'), 'w') as cpu_file:
+            cpu_file.write('usage_usec 10\n')
+        with open(os.path.join(self.container_dir, 'memory.current'), 'w'):
+            pass
+        self.docker_client.containers.return_value = [{'Id': 'ddddeeeeffff', 'Names': ['/' + CONTAINER_NAME]}]
+
+        collector._sample(previous)
+        self.assertNotIn(CONTAINER_NAME, collector.cgroups)
+        self.assertIn(CONTAINER_NAME, collector.lost)
+
+        collector.lost[CONTAINER_NAME] = 0
+        collector._sample(previous)
+        self.docker_client.containers.assert_called_with(filters={'name': CONTAINER_NAME})
+        self.assertIn(CONTAINER_NAME, collector.cgroups)
+        self.assertEqual(collector.lost, {})
+        self.assertEqual(len(collector.rings[CONTAINER_NAME]), 2)
+        self.assertTrue(collector.rings[CONTAINER_NAME].latest()[-1])
+
+        time.sleep(0.01)
+        collector._sample(previous)
+        collector.cgroups[CONTAINER_NAME].close()
+        collector._write_samples()
+        with open(os.path.join(self.target_dir, 'stats', CONTAINER_NAME + '.json')) as samples_file:
+            # Only the delta between the samples of the new cgroup
+            self.assertEqual([sample['cpu'] for sample in json.load(samples_file)], [0.0])
+
+    @mock.patch('docker_test_tools.stats.StatsCollector.start')
+    @mock.patch('docker_test_tools.stats.StatsCollector.stop')
+    def test_fallback(self, stop_mock, start_mock):
+        """Validate the collector falls back to docker stats collection when cgroups are not readable."""
+        shutil.rmtree(self.container_dir)
+
+        collector = self.get_collector()
+        collector.start()
+        self.assertTrue(collector.fallback)
+        start_mock.assert_called_once_with()
+
+        collector.stop()
+        stop_mock.assert_called_once_with()
@@ -0,0 +1,97 @@
+import os
+import json
+import math
+import shutil
+import tempfile
+import unittest
+
+from docker_test_tools import stats
+from docker_test_tools import columnar
+
+
+class TestColumnar(unittest.TestCase):
+    """Test for the columnar stats format."""
+
+    def setUp(self):
+        """Create a temporary directory."""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.test_dir)
+
+    def test_write_and_load(self):
+        """Validate columns and markers are loaded back as written."""
+        path = os.path.join(self.test_dir, 'service.dttc')
+        columnar.write_columns(path, [('cpu', [1.5, 2.5, 3.5]), ('ram', [1024, 2048, 4096])],
+                               markers=[(0, 'test-1'), (2, 'test-2')])
+
+        loaded = columnar.load_columns(path)
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual(list(loaded['cpu']), [1.5, 2.5, 3.5])
+        self.assertEqual(list(loaded['ram']), [1024, 2048, 4096])
+        self.assertEqual(loaded.markers, [(0, 'test-1'), (2, 'test-2')])
+
+        with open(path, 'wb') as bad_file:
+            bad_file.write(b'BAD!' + b'\x00' * 16)
+        with self.assertRaises(ValueError):
+            columnar.load_columns(path)
+
+        with self.assertRaises(ValueError):
+            columnar.write_columns(path, [('cpu', [1, 2]), ('ram', [1])])
+
+    def test_lttb(self):
+        """Validate the LTTB downsampling keeps the edges and the peaks."""
+        xs = list(range(1000))
+        ys = [math.sin(x / 50.0) for x in xs]
+        ys[500] = 10
+
+        indices = columnar.lttb(xs, ys, threshold=50)
+        self.assertEqual(len(indices), 50)
+        self.assertEqual(indices, sorted(indices))
+        self.assertEqual((indices[0], indices[-1]), (0, 999))
+        self.assertIn(500, indices)
+
+        self.assertEqual(columnar.lttb(xs[:10], ys[:10], threshold=50), list(range(10)))
+
+    def test_downsample(self):
+        """Validate all columns share the selected samples and markers are remapped."""
+        columns = [('cpu', [0] * 100), ('ram', [0] * 100)]
+        columns[0][1][30] = 100
+        columns[1][1][70] = 100
+
+        downsampled, markers = columnar.downsample(columns, [(0, 'test-1'), (50, 'test-2')], threshold=10)
+        cpu, ram = dict(downsampled)['cpu'], dict(downsampled)['ram']
+        self.assertEqual(len(cpu), len(ram))
+        self.assertLess(len(cpu), 20)
+        self.assertIn(100, cpu)
+        self.assertIn(100, ram)
+        self.assertEqual(markers[0], (0, 'test-1'))
+        self.assertEqual(cpu[:markers[1][0]].count(100), 1)
+
+    def test_write_stats_json(self):
+        """Validate the json format keeps the samples dictionaries format."""
+        path = columnar.write_stats(os.path.join(self.test_dir, 'service'),
+                                    columns=[('cpu', [1.0, 2.0]), ('ram', [1, 2])],
+                                    markers=[(0, 'test-1'), (1, 'test-2'), (2, 'test-3')])
+
+        with open(path) as stat_file:
+            self.assertEqual(json.load(stat_file), [{'test': 'test-1'}, {'cpu': 1.0, 'ram': 1},
+                                                    {'test': 'test-2'}, {'cpu': 2.0, 'ram': 2},
+                                                    {'test': 'test-3'}])
+
+    def test_cluster_stats_binary_format(self):
+        """Validate the docker stats file is split into columnar files per service."""
+        stats_path = os.path.join(self.test_dir, 'stats.json')
+        with open(stats_path, 'w') as stats_file:
+            stats_file.write('>>> test-1\n')
+            for cpu in range(3):
+                stats_file.write('{"name": "service1", "cpu": "%d.00%%", "ram": "1KiB / 2GiB", '
+                                 '"net": "0B / 0B", "block": "0B / 0B"}\n' % cpu)
+
+        cluster_stats = stats.ClusterStats(stat_file_path=stats_path, encoding='utf-8', output_format='binary')
+        self.assertEqual(cluster_stats.to_raw_dict()['containers']['service1']['ram']['max'], 1024)
+
+        loaded = columnar.load_columns(os.path.join(self.test_dir, 'service1.dttc'))
+        self.assertEqual(list(loaded['cpu']), [0.0, 1.0, 2.0])
+        self.assertEqual(loaded.markers, [(0, 'test-1')])
@@ -60,6 +60,25 @@ class TestConfig(unittest.TestCase):
             self.assertEquals(config.reuse_containers, test_config[Config.REUSE_CONTAINERS_ENV_VAR])
             self.assertEquals(config.docker_compose_path, test_config[Config.DOCKER_COMPOSE_PATH_ENV_VAR])
 
+    def test_env_flags(self):
+        """Validate the boolean env vars are parsed, rather than enabled by any value."""
+        test_config = {Config.ORDER_TESTS_ENV_VAR: '1',
+                       Config.LAZY_SERVICES_ENV_VAR: 'True',
+                       Config.BACKGROUND_TEARDOWN_ENV_VAR: '0',
+                       Config.REAP_STALE_PROJECTS_ENV_VAR: 'false'}
+
+        with mock.patch('os.environ.get', test_config.get):
+            config = Config()
+
+        self.assertIs(config.order_tests, True)
+        self.assertIs(config.lazy_services, True)
+        self.assertIs(config.background_teardown, False)
+        self.assertIs(config.reap_stale_projects, False)
+
+        with mock.patch('os.environ.get', {Config.ORDER_TESTS_ENV_VAR: 'no'}.get):
+            config = Config(order_tests=True)
+        self.assertIs(config.order_tests, False)
+
     def test_missing_optional_option(self):
         """Parse a valid config file, with missing optional options and validate operation success."""
         test_config = {Config.DOCKER_COMPOSE_PATH_OPTION: 'test-docker-compose-path'}
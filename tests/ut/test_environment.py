@@ -1,10 +1,16 @@
 import os
+import time
 import mock
 import docker
+import six
+import shutil
+import tempfile
+import threading
 import unittest
 import subprocess
 
 from waiting import TimeoutExpired
+from docker_test_tools import stats
 from docker_test_tools import environment
 
 SERVICE_NAMES = ['consul.service', 'mocked.service']
@@ -33,6 +39,7 @@ services:
         self.controller = self.get_controller()
 
     def tearDown(self):
+        self.controller.stop_watching_container_events()
         if os.path.exists(self.log_path):
             os.remove(self.log_path)
 
@@ -108,6 +115,178 @@ services:
                                    return_value={"State": {"Status": "not-running"}}):
                 self.assertFalse(self.controller.is_container_ready('test'))
 
+    @mock.patch('docker_test_tools.environment.EnvironmentController.start_plugins', mock.MagicMock())
+    @mock.patch('docker_test_tools.environment.EnvironmentController.up', mock.MagicMock())
+    @mock.patch('docker_test_tools.environment.EnvironmentController.stop_plugins')
+    @mock.patch('docker_test_tools.environment.EnvironmentController.down')
+    def test_background_teardown(self, down_mock, stop_plugins_mock):
+        """Validate the teardown runs in a tracked thread, and a following setup waits for it."""
+        teardown_events = []
+        down_mock.side_effect = lambda: teardown_events.append('down')
+        stop_plugins_mock.side_effect = lambda: time.sleep(0.1)
+
+        teardown_thread = self.controller.teardown(background=True)
+        self.assertFalse(teardown_thread.daemon)
+        self.assertFalse(self.controller.wait_for_teardown(timeout=0))
+
+        self.controller.setup()
+        self.assertEqual(teardown_events, ['down', 'down'])
+        self.assertTrue(self.controller.wait_for_teardown(timeout=0))
+
+        self.assertIsNone(self.controller.teardown())
+        stop_plugins_mock.assert_called_with()
+
+    @mock.patch('docker_test_tools.environment.EnvironmentController.start_plugins', mock.MagicMock())
+    @mock.patch('docker_test_tools.environment.EnvironmentController.up', mock.MagicMock())
+    @mock.patch('docker_test_tools.reaper.remove_project')
+    def test_fast_teardown(self, remove_project_mock):
+        """Validate the environment is removed through the docker API when a stop timeout is set."""
+        self.controller.stop_timeout = 0
+        self.controller.reap_stale_projects = True
+        remove_project_mock.return_value = [mock.Mock(duration=1.5, service='service1'),
+                                            mock.Mock(duration=0.5, service='service2')]
+
+        with mock.patch('subprocess.check_output') as check_output_mock:
+            self.controller.setup()
+        check_output_mock.assert_not_called()
+        remove_project_mock.assert_has_calls([
+            mock.call(self.controller.docker_client, self.project_name, stop_timeout=0, derived=True),
+            mock.call(self.controller.docker_client, self.project_name, stop_timeout=0),
+        ])
+
+        self.assertEqual(self.controller.shutdown_results, remove_project_mock.return_value)
+        summary = self.controller.metrics.get('dtt_container_shutdown_duration_seconds',
+                                              {'container': remove_project_mock.return_value[0].name,
+                                               'service': 'service1'})
+        self.assertEqual(summary[0], 1)
+
+    @mock.patch('docker_test_tools.environment.EnvironmentController.start_plugins', mock.MagicMock())
+    @mock.patch('docker_test_tools.environment.EnvironmentController.down', mock.MagicMock())
+    @mock.patch('docker_test_tools.environment.get_server_api_version', mock.MagicMock(return_value='1.39'))
+    @mock.patch('docker_test_tools.environment.EnvironmentController.up')
+    def test_lazy_services(self, up_mock):
+        """Validate only the required services (and their dependencies) are started, the rest on first use."""
+        compose_config = "services:\n  service1:\n    depends_on: [service2]\n  service2:\n    image: image2\n"
+        with mock.patch('subprocess.check_output', mock.MagicMock(return_value="service1\nservice2\nservice3\n")):
+            controller = environment.EnvironmentController(log_path=self.log_path,
+                                                           compose_path=self.compose_path,
+                                                           project_name=self.project_name,
+                                                           lazy_services=True)
+        controller.get_stats_collector = mock.MagicMock()
+
+        with mock.patch('subprocess.check_output', return_value=compose_config):
+            controller.setup(services=['service1'])
+        up_mock.assert_called_once_with(services=['service1', 'service2'])
+
+        with mock.patch.object(docker.APIClient, 'containers', return_value=[]):
+            with self.assertRaises(RuntimeError):
+                controller.get_container_id('service3')
+        up_mock.assert_called_with(services=['service3'])
+        controller.get_stats_collector.return_value.follow.assert_called_with(['service3'])
+
+        controller.start_services(['service1', 'service3'])
+        self.assertEqual(up_mock.call_count, 2)
+
+        # Waiting for all the services (e.g. for a test which doesn't declare its services) starts the rest of them
+        controller.started_services = set(['service1'])
+        with mock.patch('docker_test_tools.utils.run_health_checks', return_value=True):
+            self.assertTrue(controller.wait_for_services())
+        up_mock.assert_called_with(services=['service2', 'service3'])
+
+        # Without the required services, all the services are started
+        controller.setup()
+        up_mock.assert_called_with()
+        self.assertIsNone(controller.started_services)
+
+    def test_get_service_address(self):
+        """Validate service addresses are resolved from a single containers listing and cached until restart."""
+        containers = [{'Labels': {'com.docker.compose.project': self.project_name,
+                                  'com.docker.compose.service': 'service1'},
+                       'Id': 'container-1',
+                       'Ports': [{'PrivatePort': 8080, 'PublicPort': 32768, 'Type': 'tcp', 'IP': '0.0.0.0'},
+                                 {'PrivatePort': 53, 'PublicPort': 32769, 'Type': 'udp', 'IP': '127.0.0.1'},
+                                 {'PrivatePort': 9090, 'Type': 'tcp'}],
+                       'NetworkSettings': {'Networks': {'bridge': {'IPAddress': '172.17.0.2'},
+                                                        'test-project_default': {'IPAddress': '172.18.0.2'}}}},
+                      {'Labels': {'com.docker.compose.project': self.project_name,
+                                  'com.docker.compose.service': 'service2'},
+                       'Id': 'container-2',
+                       'Ports': [],
+                       'NetworkSettings': {'Networks': {}}}]
+
+        events_mock = mock.patch.object(docker.APIClient, 'events', return_value=EventsStream())
+        with events_mock, mock.patch.object(docker.APIClient, 'containers', return_value=containers) as mock_containers:
+            self.assertEqual(self.controller.get_service_address('service1', 8080), ('localhost', 32768))
+            self.assertEqual(self.controller.get_service_address('service1', '53/udp'), ('127.0.0.1', 32769))
+            self.assertEqual(self.controller.get_service_address('service1', '9090/tcp'), ('172.18.0.2', 9090))
+            mock_containers.assert_called_once_with(
+                filters={'label': 'com.docker.compose.project=%s' % self.project_name})
+
+            with self.assertRaises(RuntimeError):
+                self.controller.get_service_address('service2', 8080)
+
+            with self.assertRaises(ValueError):
+                self.controller.get_service_address('not-a-service', 8080)
+
+            url = self.controller.service_url('service1', 8080, path='/health')
+            self.assertEqual(url.url, 'http://localhost:32768/health')
+            self.assertEqual(mock_containers.call_count, 1)
+
+            # Restarting a container drops its cached address
+            containers[0]['Ports'][0]['PublicPort'] = 32770
+            with mock.patch("docker_test_tools.environment.EnvironmentController.get_container_id"):
+                with mock.patch.object(docker.APIClient, 'restart'):
+                    self.controller.restart_container('service1')
+
+            self.assertEqual(url.url, 'http://localhost:32770/health')
+            self.assertEqual(mock_containers.call_count, 2)
+
+        self.controller.environment_variables = {'DOCKER_HOST': 'tcp://docker.host:2376'}
+        self.controller.invalidate_service_addresses()
+        with mock.patch.object(docker.APIClient, 'containers', return_value=containers):
+            self.assertEqual(self.controller.get_service_address('service1', 8080), ('docker.host', 32770))
+
+    def test_container_events(self):
+        """Validate addresses of containers started outside the controller are dropped on their start events."""
+        containers = [{'Labels': {'com.docker.compose.project': self.project_name,
+                                  'com.docker.compose.service': 'service1'},
+                       'Id': 'container-1',
+                       'Ports': [{'PrivatePort': 8080, 'PublicPort': 32768, 'Type': 'tcp', 'IP': '0.0.0.0'}],
+                       'NetworkSettings': {'Networks': {}}}]
+
+        events_stream = EventsStream()
+        with mock.patch.object(docker.APIClient, 'events', return_value=events_stream) as mock_events, \
+                mock.patch.object(docker.APIClient, 'containers', return_value=containers) as mock_containers:
+            self.assertEqual(self.controller.get_service_address('service1', 8080), ('localhost', 32768))
+            mock_events.assert_called_once_with(
+                filters={'type': 'container', 'event': ['start', 'restart'],
+                         'label': 'com.docker.compose.project=%s' % self.project_name},
+                decode=True)
+
+            # A container restarted by its restart policy is published on a new port
+            containers[0]['Ports'][0]['PublicPort'] = 32770
+            events_stream.put({'Type': 'container', 'Action': 'start',
+                               'Actor': {'ID': 'container-1',
+                                         'Attributes': {'com.docker.compose.project': self.project_name,
+                                                        'com.docker.compose.service': 'service1'}}})
+            events_stream.processed.wait(5)
+
+            self.assertEqual(self.controller.get_service_address('service1', 8080), ('localhost', 32770))
+            self.assertEqual(mock_containers.call_count, 2)
+            mock_events.assert_called_once()
+
+            self.controller.stop_watching_container_events()
+            self.controller.events_thread.join(5)
+            self.assertFalse(self.controller.events_thread.is_alive())
+
+        # Failing to watch the events keeps the addresses cached until the controller restarts the containers
+        self.controller.invalidate_service_addresses()
+        self.controller.events_thread = None
+        with mock.patch.object(docker.APIClient, 'events', side_effect=docker.errors.APIError('error')), \
+                mock.patch.object(docker.APIClient, 'containers', return_value=containers):
+            self.assertEqual(self.controller.get_service_address('service1', 8080), ('localhost', 32770))
+            self.assertIsNone(self.controller.events_stream)
+
     @mock.patch('subprocess.check_output', mock.MagicMock(side_effect=subprocess.CalledProcessError(1, '', '')))
     @mock.patch('docker_test_tools.environment.EnvironmentController.validate_service_name', mock.MagicMock())
     def test_environment_compose_command_error(self):
@@ -280,11 +459,34 @@ services:
         mock_is_container_ready.side_effect = TimeoutExpired(timeout_seconds=1, what='something')
         self.assertFalse(controller.wait_for_services())
 
+    def test_check_baseline(self):
+        """Validate the stats summary is stored as a baseline, and later compared against it."""
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+
+        stats_collector = mock.MagicMock(spec=stats.StatsCollector, work_dir=test_dir, summary={
+            "containers": {"service1": {"ram": {"min": 0, "max": 100 * 1024 ** 2, "avg": 0}}}, "tests": {}
+        })
+        self.controller.plugins.append(stats_collector)
+        self.controller.baseline_path = os.path.join(test_dir, 'baseline.json')
+
+        # No baseline exists - the summary should be stored as the baseline
+        self.assertIsNone(self.controller.check_baseline())
+        self.assertTrue(os.path.exists(self.controller.baseline_path))
+
+        stats_collector.summary["containers"]["service1"]["ram"]["max"] *= 2
+        report = self.controller.check_baseline()
+        self.assertFalse(report.passed)
+        self.assertIs(self.controller.regression_report, report)
+        self.assertTrue(os.path.exists(os.path.join(test_dir, 'regressions.json')))
+
     def test_from_file(self):
         """"Validate the environment from_file method."""
         mocked_config = mock.MagicMock(log_path='test-log-path',
                                        project_name='test-project-name',
+                                       stats_backend='api',
                                        reuse_containers='test-reuse-containers',
+                                       state_dir=None,
                                        docker_compose_path='test-docker-compose-path')
 
         with mock.patch("subprocess.check_output", return_value="service1\nservice2\n"):
@@ -304,3 +506,23 @@ services:
             return environment.EnvironmentController(log_path=self.log_path,
                                                      compose_path=self.compose_path,
                                                      project_name=self.project_name)
+
+
+class EventsStream(object):
+    """Fake docker events stream, yielding the events put in it until closed."""
+
+    def __init__(self):
+        self.events = six.moves.queue.Queue()
+        self.processed = threading.Event()
+
+    def put(self, event):
+        self.processed.clear()
+        self.events.put(event)
+
+    def close(self):
+        self.events.put(None)
+
+    def __iter__(self):
+        for event in iter(self.events.get, None):
+            yield event
+            self.processed.set()
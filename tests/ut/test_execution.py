@@ -0,0 +1,100 @@
+import os
+import mock
+import socket
+import struct
+import unittest
+import threading
+import subprocess
+
+from docker_test_tools import execution
+
+
+class TestExecution(unittest.TestCase):
+    """Test the batched commands execution."""
+
+    def setUp(self):
+        self.docker_client = mock.MagicMock()
+        self.docker_client.exec_create.return_value = {'Id': 'exec-id'}
+        self.docker_client.exec_start.side_effect = self.exec_start
+
+    def exec_start(self, exec_id, **kwargs):
+        """Fake `exec_start` of a shell session, attached to a local shell through a socket pair."""
+        client_socket, server_socket = socket.socketpair()
+        process = subprocess.Popen(['sh'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.addCleanup(process.wait)
+        self.addCleanup(server_socket.close)
+
+        def forward_input():
+            for data in iter(lambda: server_socket.recv(4096), b''):
+                process.stdin.write(data)
+                process.stdin.flush()
+            process.stdin.close()
+
+        def forward_output():
+            # The docker exec output is multiplexed, framed with the stream type & size
+            for data in iter(lambda: os.read(process.stdout.fileno(), 4096), b''):
+                server_socket.sendall(struct.pack(execution.FRAME_HEADER_FORMAT, 1, len(data)) + data)
+
+        for target in (forward_input, forward_output):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+        return client_socket
+
+    def test_shell_session(self):
+        """Validate commands are framed and their exit codes & outputs are returned, sharing the shell state."""
+        with execution.ShellSession(self.docker_client, 'container-id') as session:
+            self.assertTrue(session.run('cd /tmp').ok)
+            result = session.run('pwd; echo error >&2')
+            self.assertEqual(result.output, '/tmp\nerror\n')
+            self.assertEqual(result.exit_code, 0)
+
+            result = session.run(['printf', 'no new line'])
+            self.assertEqual(result.output, 'no new line')
+
+            result = session.run('cat; exit_code() { return 3; }; exit_code')
+            self.assertEqual((result.exit_code, result.output), (3, ''))
+
+            with self.assertRaises(execution.ExecError):
+                session.run('sleep 1', timeout=0.05)
+
+            with self.assertRaises(execution.ExecError):
+                session.run('true')
+
+        self.docker_client.exec_create.assert_called_once_with('container-id', ['sh'], stdin=True)
+
+    def test_session_reopen_after_timeout(self):
+        """Validate the partial output of a timed out command is not returned by the next commands."""
+        session = execution.ShellSession(self.docker_client, 'container-id')
+        session.open()
+        with self.assertRaises(execution.ExecError):
+            session.run('echo stale; sleep 1', timeout=0.5)
+        self.assertIsNone(session.socket)
+
+        session.open()
+        try:
+            result = session.run('echo fresh', timeout=10)
+        finally:
+            session.close()
+
+        self.assertEqual(result.output, 'fresh\n')
+
+    def test_exec_batch_sessions(self):
+        """Validate commands are spread over the sessions and the results are returned in order."""
+        results = execution.exec_batch(self.docker_client, 'container-id', ['echo %d' % index for index in range(8)],
+                                       parallelism=2, session=True, timeout=10)
+        self.assertEqual([result.output for result in results], ['%d\n' % index for index in range(8)])
+        self.assertEqual(self.docker_client.exec_create.call_count, 2)
+
+    def test_exec_batch(self):
+        """Validate a command per exec mode."""
+        self.docker_client.exec_start.side_effect = None
+        self.docker_client.exec_start.return_value = b'output'
+        self.docker_client.exec_inspect.return_value = {'ExitCode': 1}
+
+        results = execution.exec_batch(self.docker_client, 'container-id', ['false', ['echo', 'a b']], parallelism=4)
+        self.assertEqual([(result.exit_code, result.output) for result in results], [(1, 'output'), (1, 'output')])
+        self.docker_client.exec_create.assert_has_calls([mock.call('container-id', ['sh', '-c', 'false']),
+                                                         mock.call('container-id', ['sh', '-c', "echo 'a b'"])],
+                                                        any_order=True)
@@ -0,0 +1,68 @@
+import unittest
+
+from docker_test_tools import journal
+
+
+def get_serve_event(url, logged_date, total_time=None, stub_id=None):
+    """Return a journal serve event."""
+    serve_event = {"request": {"url": url, "loggedDate": logged_date}, "wasMatched": stub_id is not None}
+    if stub_id is not None:
+        serve_event["stubMapping"] = {"id": stub_id}
+    if total_time is not None:
+        serve_event["timing"] = {"totalTime": total_time, "serveTime": total_time}
+    return serve_event
+
+
+class TestJournalAnalytics(unittest.TestCase):
+    """Test for the journal analytics."""
+
+    def setUp(self):
+        # The journal is ordered newest first
+        self.analytics = journal.JournalAnalytics.from_events(reversed([
+            get_serve_event('/items?page=1', 1000, total_time=100, stub_id='stub-1'),
+            get_serve_event('/items?page=2', 1050, total_time=100, stub_id='stub-1'),
+            get_serve_event('/items', 1100, total_time=100, stub_id='stub-1'),
+            get_serve_event('/other', 3000, total_time=10, stub_id='stub-2'),
+            get_serve_event('/unknown', 3500),
+        ]))
+
+    def test_groups(self):
+        """Validate requests are grouped per stub and per url path."""
+        self.assertEqual(self.analytics.total.count, 5)
+        self.assertEqual(sorted((stub_id, stats.count) for stub_id, stats in self.analytics.stubs.items()
+                                if stub_id is not None), [('stub-1', 3), ('stub-2', 1)])
+        self.assertEqual(self.analytics.stubs[None].count, 1)
+        self.assertEqual(sorted((url, stats.count) for url, stats in self.analytics.urls.items()),
+                         [('/items', 3), ('/other', 1), ('/unknown', 1)])
+
+    def test_rates(self):
+        """Validate the request rates and inter-arrival times."""
+        items = self.analytics.urls['/items']
+        self.assertAlmostEqual(items.rate(), 30)
+        self.assertAlmostEqual(items.rate(duration=3), 1)
+        self.assertEqual(self.analytics.urls['/other'].rate(), None)
+        self.assertEqual(self.analytics.total.peak_rate(window=1), 3)
+        self.assertEqual(self.analytics.total.peak_rate(window=0.5), 6)
+
+        inter_arrival = journal.summarize(self.analytics.total.inter_arrivals())
+        self.assertEqual(inter_arrival["count"], 4)
+        self.assertAlmostEqual(inter_arrival["min"], 0.05)
+        self.assertAlmostEqual(inter_arrival["max"], 1.9)
+
+    def test_concurrency_and_timing(self):
+        """Validate the concurrency over time and the timing percentiles."""
+        items = self.analytics.urls['/items']
+        self.assertEqual(items.max_concurrency, 2)
+        self.assertEqual([(round(change_time, 3), concurrency) for change_time, concurrency in items.concurrency()],
+                         [(1.0, 1), (1.05, 2), (1.1, 2), (1.15, 1), (1.2, 0)])
+
+        self.assertEqual(self.analytics.total.timing('totalTime'),
+                         {"count": 4, "min": 10, "max": 100, "avg": 77.5, "p50": 100, "p90": 100, "p99": 100})
+        self.assertEqual(self.analytics.stubs[None].timing('totalTime'), {"count": 0})
+        self.assertEqual(self.analytics.to_dict()["urls"]["/items"]["max_concurrency"], 2)
+
+    def test_percentile(self):
+        """Validate percentiles interpolate between the closest ranks."""
+        self.assertEqual(journal.percentile([1, 2, 3, 4], 50), 2.5)
+        self.assertEqual(journal.percentile([1, 2, 3, 4], 100), 4)
+        self.assertEqual(journal.percentile([], 50), None)
@@ -70,3 +70,18 @@ class TestLogsCollector(unittest.TestCase):
             logs.LogCollector.COMMON_LOG_FORMAT.format(message=test_message)
         )
         self.log_collector.logs_file.flush.assert_called_once_with()
+
+    @mock.patch("subprocess.Popen")
+    def test_follow(self, mock_popen):
+        """"Validate the log collector follows services started after the collection started."""
+        self.log_collector.logs_file = mock.MagicMock(name='logs-file-mock')
+        self.log_collector.follow(['service1'])
+        mock_popen.assert_called_with(
+            ['docker-compose',
+             '-f', self.TEST_COMPOSE_PATH,
+             '-p', self.TEST_PROJECT_NAME,
+             'logs', '--no-color', '-f', '-t', 'service1'],
+            stdout=self.log_collector.logs_file,
+            env=self.TEST_ENVIRONMENT_VARIABLES
+        )
+        self.assertEqual(self.log_collector.follow_processes, [mock_popen.return_value])
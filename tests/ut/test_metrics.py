@@ -0,0 +1,122 @@
+import os
+import mock
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from docker_test_tools import stats
+from docker_test_tools import metrics
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """Test for the metrics registry."""
+
+    def test_render(self):
+        """Validate the registry metrics are rendered in the OpenMetrics text format."""
+        registry = metrics.MetricsRegistry()
+        registry.describe('calls', metrics.MetricsRegistry.COUNTER, 'Calls.')
+        registry.describe('duration_seconds', metrics.MetricsRegistry.SUMMARY, 'Duration.')
+        registry.describe('ram_bytes', metrics.MetricsRegistry.GAUGE, 'Ram.')
+
+        registry.inc('calls', {'method': 'kill'})
+        registry.inc('calls', {'method': 'kill'}, 2)
+        registry.observe('duration_seconds', {'method': 'kill'}, 0.5)
+        registry.observe('duration_seconds', {'method': 'kill'}, 1.5)
+        registry.set('ram_bytes', {'container': 'a"b'}, 1024)
+
+        self.assertEqual(registry.get('calls', {'method': 'kill'}), 3)
+        self.assertEqual(registry.render().splitlines(), [
+            '# TYPE calls counter',
+            '# HELP calls Calls.',
+            'calls_total{method="kill"} 3',
+            '# TYPE duration_seconds summary',
+            '# HELP duration_seconds Duration.',
+            'duration_seconds_count{method="kill"} 2',
+            'duration_seconds_sum{method="kill"} 2.0',
+            '# TYPE ram_bytes gauge',
+            '# HELP ram_bytes Ram.',
+            'ram_bytes{container="a\\"b"} 1024',
+            '# EOF',
+        ])
+
+    def test_instrumented_docker_client(self):
+        """Validate the docker client proxy counts and times the API calls."""
+        registry = metrics.MetricsRegistry()
+        docker_client = mock.MagicMock()
+        docker_client.kill.return_value = 'killed'
+
+        client = metrics.InstrumentedDockerClient(docker_client, registry=registry)
+        self.assertEqual(client.kill('container-id'), 'killed')
+        docker_client.kill.assert_called_once_with('container-id')
+
+        self.assertEqual(registry.get('dtt_docker_api_calls', {'method': 'kill'}), 1)
+        self.assertEqual(registry.get('dtt_docker_api_call_duration_seconds', {'method': 'kill'})[0], 1)
+
+
+class TestMetricsExporter(unittest.TestCase):
+    """Test for the metrics exporter."""
+
+    def setUp(self):
+        """Create a controller mock with a log file and a stats collector."""
+        self.test_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.test_dir, 'docker.log')
+
+        self.stats_collector = stats.StatsCollector(target_dir_path=self.test_dir,
+                                                    project='test-project',
+                                                    encoding='utf-8',
+                                                    environment_variables={})
+        self.controller = mock.MagicMock(project_name='test-project', encoding='utf-8',
+                                         metrics=metrics.MetricsRegistry())
+        self.controller.logs_collector.log_path = self.log_path
+        self.controller.get_stats_collector.return_value = self.stats_collector
+        self.controller.docker_client.containers.return_value = [
+            {'Names': ['/test-project_service1_1'], 'State': 'running', 'Status': 'Up 1 minute (healthy)',
+             'Labels': {'com.docker.compose.service': 'service1'}},
+            {'Names': ['/test-project_service2_1'], 'State': 'exited', 'Status': 'Exited (1)',
+             'Labels': {'com.docker.compose.service': 'service2'}},
+        ]
+
+        self.exporter = metrics.MetricsExporter(controller=self.controller)
+
+    def tearDown(self):
+        """Stop the exporter and remove the temporary directory."""
+        self.exporter.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_scrape(self):
+        """Validate the exporter serves the environment metrics."""
+        with open(self.log_path, 'w') as log_file:
+            log_file.write('test-project_service1_1  | line 1\ntest-project_service1_1  | line 2\n'
+                           'test-project_service2_1  | line 1\ntest-project_service2_1  | partial')
+
+        with open(self.stats_collector.stats_file_path, 'w') as stats_file:
+            stats_file.write('{"name": "test-project_service1_1", "cpu": "1.50%", "ram": "1KiB / 2GiB", '
+                             '"net": "0B / 0B", "block": "2KiB / 0B"}\n')
+
+        self.exporter.start()
+        self.exporter.update('test-1')
+        response = requests.get(self.exporter.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], metrics.CONTENT_TYPE)
+
+        lines = response.text.splitlines()
+        self.assertIn('dtt_tests_started_total 1', lines)
+        self.assertIn('dtt_log_lines_total{service="test-project_service1_1"} 2', lines)
+        self.assertIn('dtt_log_lines_total{service="test-project_service2_1"} 1', lines)
+        self.assertIn('dtt_container_running{container="test-project_service1_1",service="service1"} 1', lines)
+        self.assertIn('dtt_container_running{container="test-project_service2_1",service="service2"} 0', lines)
+        self.assertIn('dtt_container_healthy{container="test-project_service1_1",service="service1"} 1', lines)
+        self.assertIn('dtt_container_healthy{container="test-project_service2_1",service="service2"} -1', lines)
+        self.assertIn('dtt_container_cpu_percent{container="test-project_service1_1"} 1.5', lines)
+        self.assertIn('dtt_container_ram_bytes{container="test-project_service1_1"} 1024', lines)
+        self.assertIn('dtt_container_block_io_bytes{container="test-project_service1_1"} 2048', lines)
+        self.assertEqual(lines[-1], '# EOF')
+
+        # Log lines are counted incrementally
+        with open(self.log_path, 'a') as log_file:
+            log_file.write(' line\n')
+        self.assertIn('dtt_log_lines_total{service="test-project_service2_1"} 2', self.exporter.render().splitlines())
+
+        self.assertEqual(requests.get(self.exporter.url.replace('/metrics', '/other')).status_code, 404)
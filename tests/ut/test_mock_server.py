@@ -0,0 +1,151 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import requests
+from six.moves import http_client
+
+from docker_test_tools import wiremock
+from docker_test_tools import mock_server
+
+
+class TestMockServer(unittest.TestCase):
+    """Test the mock server using the wiremock controller."""
+
+    def setUp(self):
+        """Start a mock server and create a controller for it."""
+        self.server = mock_server.MockServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+        self.controller = wiremock.WiremockController(url=self.server.url)
+        self.addCleanup(self.controller.close)
+
+    def test_mappings(self):
+        """Validate stubs are set, matched, synced and reset using the controller."""
+        self.assertEqual(requests.get(self.server.url + '/__admin').status_code, http_client.OK)
+        self.assertEqual(requests.post(self.server.url + '/test').status_code, http_client.NOT_FOUND)
+
+        stubs_dir_path = os.path.join(os.path.dirname(__file__), '..', 'resources', 'wiremock_stubs')
+        stub_ids = self.controller.set_mapping_from_dir(stubs_dir_path)
+        self.assertEqual(requests.post(self.server.url + '/test').status_code, http_client.OK)
+        self.assertEqual(requests.get(self.server.url + '/test').status_code, http_client.NOT_FOUND)
+
+        stub_id = self.controller.set_mapping_from_json({"request": {"method": "ANY", "urlPattern": "/te.*"},
+                                                         "response": {"status": 201}})
+        self.assertEqual(requests.get(self.server.url + '/test').status_code, http_client.CREATED)
+        # Newer stubs take precedence over older stubs of the same priority
+        self.assertEqual(requests.post(self.server.url + '/test').status_code, http_client.CREATED)
+
+        self.assertEqual(len(self.controller.get_matching_requests(stub_id=stub_id)), 2)
+        self.assertEqual(len(self.controller.get_matching_requests(stub_id=list(stub_ids.values())[0])), 1)
+
+        self.controller.reset_mapping()
+        self.assertEqual(requests.post(self.server.url + '/test').status_code, http_client.NOT_FOUND)
+
+        self.controller.sync_mapping_from_dir(stubs_dir_path)
+        self.assertEqual(requests.post(self.server.url + '/test').status_code, http_client.OK)
+        self.assertEqual(len(self.controller.get_stubs_index()), 1)
+
+    def test_journal(self):
+        """Validate the journal, find & count requests and waiting for requests."""
+        self.controller.set_mapping_from_json({"request": {"method": "POST", "urlPath": "/items",
+                                                           "bodyPatterns": [{"matchesJsonPath": "$.name"}]},
+                                               "response": {"status": 200}})
+        requests.post(self.server.url + '/items?page=1', json={"name": "item-1"})
+        requests.post(self.server.url + '/items', json={"other": "item-2"})
+        requests.get(self.server.url + '/other', headers={'X-Id': '1'})
+
+        journal = self.controller.get_request_journal()
+        self.assertEqual([request["request"]["url"] for request in journal], ['/other', '/items', '/items?page=1'])
+        self.assertEqual([request["wasMatched"] for request in journal], [False, False, True])
+        self.assertEqual(len(self.controller.get_matching_requests('/other')), 1)
+        self.assertEqual(len(self.controller.get_matching_requests(limit=1)), 1)
+
+        criteria = wiremock.request_pattern(method='POST', url_path='/items', body_json_paths=[{"expression": "$.name",
+                                                                                               "contains": "item"}])
+        self.assertEqual(self.controller.count_requests(criteria), 1)
+        self.assertEqual(json.loads(self.controller.find_requests(criteria)[0]["body"]), {"name": "item-1"})
+        self.assertEqual(self.controller.count_requests(wiremock.request_pattern(headers={'X-Id': '1'})), 1)
+
+        result = self.controller.wait_for_requests(wiremock.request_pattern(url_path='/items'), count=2, timeout=1)
+        self.assertEqual(result.polls, 1)
+        self.assertEqual(len(result.arrivals), 2)
+
+        analytics = self.controller.get_journal_analytics()
+        self.assertEqual(analytics.urls['/items'].count, 2)
+        self.assertEqual(analytics.stubs[None].count, 2)
+        self.assertEqual(analytics.total.timing('totalTime')['count'], 1)
+
+        self.controller.delete_request_journal()
+        self.assertEqual(self.controller.count_requests(), 0)
+
+    def test_response_templating(self):
+        """Validate templated responses are rendered from the request."""
+        self.controller.set_mapping_from_json({
+            "request": {"method": "POST", "urlPathPattern": "/users/.*"},
+            "response": {"status": 200,
+                         "headers": {"X-Method": "{{request.method}}"},
+                         "body": "{{request.path.[1]}} {{request.query.page}} {{request.headers.X-Id}} "
+                                 "{{jsonPath request.body '$.user.name'}} {{request.unknown}}",
+                         "transformers": ["response-template"]}})
+
+        response = requests.post(self.server.url + '/users/12?page=3', headers={'X-Id': 'abc'},
+                                 json={"user": {"name": "test"}})
+        self.assertEqual(response.text, '12 3 abc test ')
+        self.assertEqual(response.headers['X-Method'], 'POST')
+
+    def test_default_mappings(self):
+        """Validate the root dir stubs are loaded on start and on reset."""
+        root_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root_dir)
+        os.makedirs(os.path.join(root_dir, 'mappings'))
+        os.makedirs(os.path.join(root_dir, '__files'))
+        with open(os.path.join(root_dir, 'mappings', 'stubs.json'), 'w') as stubs_file:
+            json.dump({"mappings": [{"request": {"url": "/file"}, "response": {"bodyFileName": "body.txt"}}]},
+                      stubs_file)
+        with open(os.path.join(root_dir, '__files', 'body.txt'), 'w') as body_file:
+            body_file.write('file-body')
+
+        with mock_server.MockServer(root_dir=root_dir) as server:
+            controller = wiremock.WiremockController(url=server.url)
+            self.assertEqual(requests.get(server.url + '/file').text, 'file-body')
+
+            controller.set_mapping_from_json({"request": {"url": "/other"}, "response": {"status": 200}})
+            controller.reset_mapping()
+            self.assertEqual(requests.get(server.url + '/file').text, 'file-body')
+            self.assertEqual(requests.get(server.url + '/other').status_code, http_client.NOT_FOUND)
+
+
+class TestMatching(unittest.TestCase):
+    """Test the request matching."""
+
+    def test_match_value(self):
+        """Validate the value matchers."""
+        self.assertTrue(mock_server.match_value({"equalTo": "Value", "caseInsensitive": True}, "value"))
+        self.assertFalse(mock_server.match_value({"equalTo": "Value"}, "value"))
+        self.assertTrue(mock_server.match_value({"contains": "al"}, "value"))
+        self.assertTrue(mock_server.match_value({"matches": "v.*"}, "value"))
+        self.assertFalse(mock_server.match_value({"matches": "v"}, "value"))
+        self.assertTrue(mock_server.match_value({"doesNotMatch": "x.*"}, "value"))
+        self.assertTrue(mock_server.match_value({"absent": True}, None))
+        self.assertFalse(mock_server.match_value({"equalTo": "value"}, None))
+        self.assertTrue(mock_server.match_value({"equalToJson": '{"a": [1, 2]}'}, '{"a":[1,2]}'))
+        self.assertTrue(mock_server.match_value({"matchesJsonPath": "$.a[1]"}, '{"a": [1, 2]}'))
+        self.assertFalse(mock_server.match_value({"matchesJsonPath": "$.a[2]"}, '{"a": [1, 2]}'))
+        self.assertTrue(mock_server.match_value({"matchesJsonPath": {"expression": "$['a'][0]", "equalTo": "1"}},
+                                                '{"a": [1, 2]}'))
+
+    def test_match_request(self):
+        """Validate the request pattern matching."""
+        request = mock_server.LoggedRequest(method='GET', url='/path/1?q=a&q=b', headers={'Accept': 'text/plain'},
+                                            body=b'', client_ip='127.0.0.1', absolute_url='http://host/path/1?q=a&q=b')
+        self.assertTrue(mock_server.match_request({"method": "GET", "urlPath": "/path/1"}, request))
+        self.assertTrue(mock_server.match_request({"urlPathPattern": "/path/\\d+",
+                                                   "queryParameters": {"q": {"equalTo": "b"}, "p": {"absent": True}},
+                                                   "headers": {"accept": {"contains": "text"}}}, request))
+        self.assertFalse(mock_server.match_request({"method": "POST"}, request))
+        self.assertFalse(mock_server.match_request({"url": "/path/1"}, request))
+        self.assertFalse(mock_server.match_request({"queryParameters": {"q": {"equalTo": "c"}}}, request))
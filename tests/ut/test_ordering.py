@@ -0,0 +1,100 @@
+import mock
+import unittest
+
+from docker_test_tools import ordering
+from docker_test_tools.base_test import BaseDockerTest
+
+
+def get_test_classes():
+    """Return example test classes (defined here, so the test runner doesn't collect them)."""
+    class ConsulTest(BaseDockerTest):
+        REQUIRED_SERVICES = ['consul.service']
+
+        def test_read(self):
+            pass
+
+    class ConsulDownTest(BaseDockerTest):
+        REQUIRED_SERVICES = ['consul.service']
+        DISRUPTS = ['consul.service']
+
+        def test_down(self):
+            pass
+
+    class ConsulResetTest(BaseDockerTest):
+        REQUIRED_SERVICES = ['consul.service']
+        DISRUPTS = True
+
+        def test_reset(self):
+            pass
+
+    class AllServicesTest(BaseDockerTest):
+
+        def test_all(self):
+            pass
+
+    return ConsulTest, ConsulDownTest, ConsulResetTest, AllServicesTest
+
+
+def get_item(test_class):
+    """Return a mocked pytest item of the given test class."""
+    item = mock.Mock()
+    item.cls = test_class
+    return item
+
+
+class TestOrdering(unittest.TestCase):
+    """Test the environment affinity tests ordering."""
+
+    def test_order_suite(self):
+        """Validate tests are grouped by required services, with the disruptive tests last per group."""
+        ConsulTest, ConsulDownTest, ConsulResetTest, AllServicesTest = get_test_classes()
+        loader = unittest.defaultTestLoader
+        suite = unittest.TestSuite([loader.loadTestsFromTestCase(test_class) for test_class in
+                                    (ConsulResetTest, ConsulDownTest, AllServicesTest, ConsulTest)])
+
+        ordered_suite = ordering.order_suite(suite)
+        self.assertEqual([type(test) for test in ordered_suite],
+                         [ConsulTest, ConsulDownTest, ConsulResetTest, AllServicesTest])
+
+    def test_order_items(self):
+        """Validate pytest items are ordered in place, items without a class are grouped as requiring all services."""
+        ConsulTest, ConsulDownTest, _, _ = get_test_classes()
+        items = [get_item(ConsulDownTest), get_item(None), get_item(ConsulTest)]
+
+        ordering.order_items(items)
+        self.assertEqual([item.cls for item in items], [ConsulTest, ConsulDownTest, None])
+
+    @mock.patch('docker_test_tools.environment.EnvironmentController.from_config', mock.MagicMock())
+    def test_pytest_conftest(self):
+        """Validate the pytest conftest orders the collected items when enabled, and sets up their services."""
+        from tests.integration import conftest
+
+        ConsulTest, ConsulDownTest, _, _ = get_test_classes()
+        items = [get_item(ConsulDownTest), get_item(None), get_item(ConsulTest)]
+        with mock.patch.object(conftest.config_object, 'order_tests', False):
+            conftest.pytest_collection_modifyitems(session=mock.Mock(), config=mock.Mock(), items=items)
+        self.assertEqual([item.cls for item in items], [ConsulDownTest, None, ConsulTest])
+
+        with mock.patch.object(conftest.config_object, 'order_tests', True):
+            conftest.pytest_collection_modifyitems(session=mock.Mock(), config=mock.Mock(), items=items)
+        self.assertEqual([item.cls for item in items], [ConsulTest, ConsulDownTest, None])
+
+        conftest.pytest_collection_finish(mock.Mock(items=items[:2]))
+        conftest.controller.setup.assert_called_with(services=['consul.service'])
+
+    def test_required_services_wait(self):
+        """Validate only the required services are waited for."""
+        test = get_test_classes()[0]('test_read')
+        test.controller = mock.MagicMock()
+        test.controller.wait_for_services.return_value = True
+        test.setUp()
+        test.controller.wait_for_services.assert_called_once_with(services=['consul.service'], interval=1,
+                                                                  timeout=120)
+
+    def test_get_tests_services(self):
+        """Validate the union of the services required by the tests."""
+        ConsulTest, ConsulDownTest, _, AllServicesTest = get_test_classes()
+        self.assertEqual(ordering.get_tests_services([ConsulTest('test_read'), ConsulDownTest('test_down')]),
+                         ['consul.service'])
+        self.assertIsNone(ordering.get_tests_services([ConsulTest('test_read'), AllServicesTest('test_all')]))
+        self.assertEqual(ordering.get_items_services([get_item(ConsulTest)]), ['consul.service'])
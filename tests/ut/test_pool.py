@@ -0,0 +1,171 @@
+import time
+import mock
+import shutil
+import tempfile
+import unittest
+import threading
+
+from docker_test_tools import pool
+from docker_test_tools import config
+
+
+def get_controller_mock(worker_config):
+    """Return a mocked environment controller for the given config."""
+    return mock.MagicMock(dirty=False, project_name=worker_config.project_name)
+
+
+class TestEnvironmentPool(unittest.TestCase):
+    """Test the environments pool."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+
+        patcher = mock.patch('docker_test_tools.pool.EnvironmentController.from_config',
+                             side_effect=get_controller_mock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.pool = pool.EnvironmentPool(config.Config(project_name='example', log_path=self.test_dir + '/docker.log'),
+                                         size=2)
+        self.addCleanup(self.pool.pool.terminate)
+        self.pool.setup()
+
+    def test_lease(self):
+        """Validate replicas are leased exclusively and recycled when marked dirty."""
+        replicas = list(self.pool.replicas)
+        self.assertEqual([replica.controller.project_name for replica in replicas],
+                         ['example-replica0', 'example-replica1'])
+        for replica in replicas:
+            replica.controller.setup.assert_called_once_with()
+
+        with self.pool.lease(name='test_1') as first, self.pool.lease(name='test_2') as second:
+            self.assertIsNot(first, second)
+            first.update_plugins.assert_called_once_with('test_1')
+            with self.assertRaises(pool.EnvironmentPoolError):
+                with self.pool.lease(timeout=0.01):
+                    pass
+
+            first.dirty = True
+
+        for recycle in self.pool.recycles:
+            recycle.wait()
+
+        first.teardown.assert_called_once_with(background=False)
+        second.teardown.assert_not_called()
+        recycled = self.pool.replicas[0] if replicas[0].controller is first else self.pool.replicas[1]
+        self.assertEqual(recycled.generation, 1)
+        self.assertEqual(recycled.controller.project_name, 'example-%s-1' % replicas[recycled.index].name)
+        self.assertEqual(self.pool.available.qsize(), 2)
+
+        self.pool.teardown()
+        for replica in self.pool.replicas:
+            replica.controller.teardown.assert_called_once_with(background=False)
+
+    def test_double_buffer(self):
+        """Validate the next generation of a dirty replica is set up while the dirty one is torn down."""
+        next_generation_ready = threading.Event()
+        overlapped = []
+
+        def get_double_buffered_controller_mock(worker_config):
+            controller = get_controller_mock(worker_config)
+            if worker_config.project_name.endswith('-1'):
+                controller.setup.side_effect = next_generation_ready.set
+            else:
+                controller.teardown.side_effect = lambda background: overlapped.append(next_generation_ready.wait(1))
+            return controller
+
+        with mock.patch('docker_test_tools.pool.EnvironmentController.from_config',
+                        side_effect=get_double_buffered_controller_mock):
+            double_buffered_pool = pool.EnvironmentPool(self.pool.config, size=1, double_buffer=True)
+            self.addCleanup(double_buffered_pool.pool.terminate)
+            double_buffered_pool.setup()
+
+            with double_buffered_pool.lease() as controller:
+                controller.dirty = True
+
+            for recycle in double_buffered_pool.recycles:
+                recycle.wait()
+
+        self.assertEqual(overlapped, [True])
+        controller.teardown.assert_called_once_with(background=False)
+        self.assertEqual(double_buffered_pool.replicas[0].generation, 1)
+
+    def test_failed_recycles(self):
+        """Validate replicas failing recycling are dropped, and leases fail once no replicas are left."""
+        def get_failing_controller_mock(worker_config):
+            controller = get_controller_mock(worker_config)
+            if worker_config.project_name.endswith('-1'):
+                controller.setup.side_effect = RuntimeError('setup-failure')
+            return controller
+
+        with mock.patch('docker_test_tools.pool.EnvironmentController.from_config',
+                        side_effect=get_failing_controller_mock):
+            with self.pool.lease() as first, self.pool.lease() as second:
+                first.dirty = second.dirty = True
+
+            for recycle in self.pool.recycles:
+                recycle.wait()
+
+        self.assertEqual((self.pool.live, self.pool.replicas), (0, [None, None]))
+        with self.assertRaises(pool.EnvironmentPoolError):
+            with self.pool.lease():
+                pass
+
+        results = self.pool.run([('test_1', mock.Mock()), ('test_2', mock.Mock())])
+        self.assertTrue(all(isinstance(result, pool.EnvironmentPoolError) for result in results))
+
+        self.pool.teardown()
+        first.teardown.assert_called_once_with(background=False)
+        second.teardown.assert_called_once_with(background=False)
+
+    def test_run(self):
+        """Validate tests are handed to whichever replica frees up first."""
+        lock = threading.Lock()
+        in_use = set()
+
+        def run_test(controller):
+            with lock:
+                self.assertNotIn(controller.project_name, in_use)
+                in_use.add(controller.project_name)
+            time.sleep(0.01)
+            with lock:
+                in_use.remove(controller.project_name)
+            return controller.project_name
+
+        results = self.pool.run([('test_%d' % index, run_test) for index in range(6)])
+        self.assertEqual(len(results), 6)
+        self.assertEqual(set(results), set(['example-replica0', 'example-replica1']))
+
+    def test_run_suite(self):
+        """Validate unittest tests get the leased controller, their class fixtures run and outcomes are collected."""
+        class ExampleTest(unittest.TestCase):
+            class_controllers = []
+
+            @classmethod
+            def setUpClass(cls):
+                cls.class_controllers.append('set up')
+
+            @classmethod
+            def tearDownClass(cls):
+                cls.class_controllers.append('torn down')
+
+            def test_pass(self):
+                self.assertTrue(self.controller.project_name.startswith('example-replica'))
+                self.class_controllers.append(self.controller)
+
+            def test_fail(self):
+                self.class_controllers.append(self.controller)
+                self.fail('failure')
+
+        result = self.pool.run_suite(unittest.defaultTestLoader.loadTestsFromTestCase(ExampleTest),
+                                     result=unittest.TestResult())
+        self.assertEqual(result.testsRun, 2)
+        self.assertEqual(len(result.failures), 1)
+        self.assertEqual(len(result.errors), 0)
+
+        # The class tests run on a single lease, between the class fixtures
+        controller = ExampleTest.class_controllers[1]
+        self.assertEqual(ExampleTest.class_controllers, ['set up', controller, controller, 'torn down'])
+        tests = unittest.defaultTestLoader.loadTestsFromTestCase(ExampleTest)
+        controller.update_plugins.assert_has_calls([mock.call(test.id()) for test in tests])
@@ -0,0 +1,74 @@
+import time
+import mock
+import docker
+import unittest
+
+from docker_test_tools import reaper
+
+
+def get_container(name, project, state='running'):
+    return {'Id': name + '-id', 'Names': ['/' + name], 'State': state,
+            'Labels': {reaper.PROJECT_LABEL: project, reaper.SERVICE_LABEL: name.split('_')[1]}}
+
+
+class TestReaper(unittest.TestCase):
+    """Test the docker API based projects removal."""
+
+    def setUp(self):
+        self.docker_client = mock.MagicMock()
+        self.docker_client.containers.return_value = [
+            get_container('example_slow_1', 'example'),
+            get_container('example_exited_1', 'example', state='exited'),
+            get_container('example-gw0_slow_1', 'example-gw0'),
+            get_container('example2_slow_1', 'example2'),
+        ]
+        self.docker_client.networks.return_value = [
+            {'Id': 'example-network-id', 'Name': 'example_default', 'Labels': {reaper.PROJECT_LABEL: 'example'}},
+            {'Id': 'other-network-id', 'Name': 'example2_default', 'Labels': {reaper.PROJECT_LABEL: 'example2'}},
+        ]
+
+    def test_remove_project(self):
+        """Validate the project containers are stopped & removed concurrently, and the project networks removed."""
+        def stop(container_id, timeout):
+            time.sleep(0.1)
+
+        self.docker_client.stop.side_effect = stop
+        start_time = time.time()
+        results = reaper.remove_project(self.docker_client, 'Example', stop_timeout=3)
+        self.assertLess(time.time() - start_time, 0.2)
+
+        self.assertEqual([result.name for result in results], ['example_slow_1', 'example_exited_1'])
+        self.assertEqual(results[0].service, 'slow')
+        self.docker_client.stop.assert_called_once_with('example_slow_1-id', timeout=3)
+        self.docker_client.remove_container.assert_has_calls([mock.call('example_slow_1-id', v=True, force=True),
+                                                              mock.call('example_exited_1-id', v=True, force=True)],
+                                                             any_order=True)
+        self.docker_client.remove_network.assert_called_once_with('example-network-id')
+
+    def test_reap_derived_projects(self):
+        """Validate derived projects are reaped, killing their containers right away."""
+        self.docker_client.remove_container.side_effect = [None, docker.errors.NotFound('removed'), None]
+        results = reaper.remove_project(self.docker_client, 'example', derived=True, parallelism=1)
+        self.assertEqual(sorted(result.name for result in results),
+                         ['example-gw0_slow_1', 'example_exited_1', 'example_slow_1'])
+        self.docker_client.stop.assert_not_called()
+
+    def test_matches_project(self):
+        """Validate only the worker and replica projects are considered derived from a project."""
+        for project in ('example', 'example-gw0', 'example-gw12', 'example-replica0', 'example-replica1-2'):
+            self.assertTrue(reaper.matches_project({reaper.PROJECT_LABEL: project}, 'example', derived=True), project)
+
+        for project in ('example-api', 'example-gw', 'example-gw0-api', 'example-replica-1', 'example2', 'other-gw0'):
+            self.assertFalse(reaper.matches_project({reaper.PROJECT_LABEL: project}, 'example', derived=True), project)
+
+        self.assertFalse(reaper.matches_project({reaper.PROJECT_LABEL: 'example-gw0'}, 'example'))
+        self.assertFalse(reaper.matches_project(None, 'example', derived=True))
+
+    def test_remove_failure(self):
+        """Validate all the resources are attempted before reporting the failures."""
+        self.docker_client.remove_container.side_effect = docker.errors.APIError('failure')
+        with self.assertRaises(RuntimeError):
+            reaper.remove_project(self.docker_client, 'example')
+
+        self.assertEqual(self.docker_client.remove_container.call_count, 2)
+        self.docker_client.remove_network.assert_called_once_with('example-network-id')
@@ -0,0 +1,137 @@
+import io
+import os
+import json
+import mock
+import shutil
+import tempfile
+import unittest
+
+from docker_test_tools import stats
+from docker_test_tools import config
+from docker_test_tools import sharding
+
+
+class TestSharding(unittest.TestCase):
+    """Test the workers environments sharding."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.config = config.Config(project_name='example', log_path=os.path.join(self.test_dir, 'docker.log'),
+                                    metrics_port=9100, baseline_path='baseline.json')
+
+    def test_get_worker_config(self):
+        """Validate each worker gets its own project name, log directory and an ephemeral metrics port."""
+        worker_config = sharding.get_worker_config(self.config, 'gw1')
+        self.assertEqual(worker_config.project_name, 'example-gw1')
+        self.assertEqual(worker_config.log_path, os.path.join(self.test_dir, 'workers', 'gw1', 'docker.log'))
+        self.assertTrue(os.path.isdir(os.path.join(self.test_dir, 'workers', 'gw1')))
+        self.assertEqual(worker_config.metrics_port, 0)
+        self.assertIsNone(worker_config.baseline_path)
+
+        # The base config is left as is
+        self.assertEqual(self.config.project_name, 'example')
+        self.assertEqual(self.config.metrics_port, 9100)
+
+        self.assertEqual(sharding.get_worker_config(self.config, 'gw1', shared=True).project_name, 'example')
+
+    def test_is_xdist_controller(self):
+        """Validate the xdist controller process detection."""
+        self.assertTrue(sharding.is_xdist_controller(mock.Mock(spec=['option'], option=mock.Mock(dist='load'))))
+        self.assertFalse(sharding.is_xdist_controller(mock.Mock(spec=['option'], option=mock.Mock(dist='no'))))
+        self.assertFalse(sharding.is_xdist_controller(mock.Mock(spec=['option', 'workerinput'],
+                                                                option=mock.Mock(dist='load'))))
+
+    @mock.patch('docker_test_tools.sharding.EnvironmentController.from_config')
+    def test_isolated_workers(self, from_config_mock):
+        """Validate isolated workers set up and tear down their own environment."""
+        environment = sharding.WorkerEnvironment(self.config, worker_id='gw0')
+        environment.setup()
+        self.assertEqual(from_config_mock.call_args[0][0].project_name, 'example-gw0')
+        from_config_mock.return_value.setup.assert_called_once_with()
+
+        environment.teardown()
+        from_config_mock.return_value.teardown.assert_called_once_with(background=False)
+
+    @mock.patch.dict(os.environ, {sharding.TEST_RUN_ENV_VAR: 'run-1'})
+    @mock.patch('docker_test_tools.sharding.EnvironmentController.from_config')
+    def test_shared_workers(self, from_config_mock):
+        """Validate the first worker sets up a shared environment and the last one tears it down."""
+        controllers = [mock.MagicMock(), mock.MagicMock()]
+        from_config_mock.side_effect = controllers
+        environments = [sharding.WorkerEnvironment(self.config, worker_id=worker_id, shared=True)
+                        for worker_id in ('gw0', 'gw1')]
+
+        for environment in environments:
+            environment.setup()
+
+        controllers[0].up.assert_called_once_with()
+        controllers[1].up.assert_not_called()
+        for controller in controllers:
+            controller.start_plugins.assert_called_once_with()
+
+        # The first worker cleans up leftovers before setting the environment up, but leaves it up on teardown
+        environments[0].teardown()
+        controllers[0].cleanup.assert_called_once_with()
+        environments[1].teardown()
+        controllers[1].cleanup.assert_called_once_with()
+
+        # References of a previous run are ignored
+        with open(environments[0].refcount_path, 'w') as refcount_file:
+            json.dump({'run': 'run-0', 'references': 3}, refcount_file)
+        self.assertEqual(environments[0]._read_references(), 0)
+
+    def test_merge_stats_summaries(self):
+        """Validate the workers stats summaries are merged per service."""
+        metric = {"min": 1, "max": 2, "avg": 1.5}
+        summaries = {'gw0': {"containers": {"example-gw0_consul_1": {"cpu": metric}},
+                             "tests": {"test_a": {}}},
+                     'gw1': {"containers": {"example-gw1_consul_1": {"cpu": {"min": 0, "max": 4, "avg": 2.5}}},
+                             "tests": {"test_b": {}}}}
+
+        summary = sharding.merge_stats_summaries(summaries, 'example')
+        self.assertEqual(summary["containers"], {"example_consul_1": {"cpu": {"min": 0, "max": 4, "avg": 2.0}}})
+        self.assertEqual(sorted(summary["tests"]), ["test_a", "test_b"])
+
+    def test_merge_worker_reports(self):
+        """Validate the workers logs and stats summaries are merged into the main paths."""
+        self.config.baseline_path = None
+
+        # Directories of a previous run are removed once the xdist controller is configured
+        stale_config = sharding.get_worker_config(self.config, 'gw2')
+        with open(stale_config.log_path, 'w') as log_file:
+            log_file.write('gw2 log line\n')
+        environment = sharding.WorkerEnvironment(self.config)
+        environment.setup(pytest_config=mock.Mock(option=mock.Mock(dist='load'), spec=['option']))
+        self.assertFalse(os.path.exists(os.path.dirname(stale_config.log_path)))
+
+        for worker_id in ('gw0', 'gw1'):
+            worker_config = sharding.get_worker_config(self.config, worker_id)
+            with open(worker_config.log_path, 'w') as log_file:
+                log_file.write('%s log line\n' % worker_id)
+
+            # The worker stats summary files, as written by its stats collector
+            collector = stats.StatsCollector(target_dir_path=os.path.dirname(worker_config.log_path),
+                                             project=worker_config.project_name, encoding='utf-8',
+                                             environment_variables={})
+            collector.stats_file = io.open(collector.stats_file_path, 'w', encoding='utf-8')
+            collector.update(u'test_%s' % worker_id)
+            collector.stats_file.write(u'{"name": "%s_consul_1", "cpu": "1.00%%", "ram": "2MiB / 1GiB", '
+                                       u'"net": "0B / 0B", "block": "0B / 0B"}\n' % worker_config.project_name)
+            collector.stop()
+
+        self.assertIsNone(sharding.merge_worker_reports(self.config))
+
+        with open(self.config.log_path) as log_file:
+            merged_log = log_file.read()
+        self.assertLess(merged_log.index('gw0 log line'), merged_log.index('gw1 log line'))
+        self.assertNotIn('gw2 log line', merged_log)
+
+        with open(os.path.join(self.test_dir, 'stats', 'summary.raw.json')) as summary_file:
+            summary = json.load(summary_file)
+        self.assertEqual(list(summary["containers"]), ["example_consul_1"])
+        self.assertEqual(summary["containers"]["example_consul_1"]["ram"]["max"], 2 * 1024 ** 2)
+        self.assertEqual(sorted(summary["tests"]), ["test_gw0", "test_gw1"])
+
+        with open(os.path.join(self.test_dir, 'stats', 'summary.json')) as summary_file:
+            self.assertEqual(json.load(summary_file)["example_consul_1"]["cpu"]["max"], "1.00")
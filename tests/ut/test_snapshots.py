@@ -0,0 +1,111 @@
+import mock
+import docker
+import unittest
+from contextlib import contextmanager
+
+from docker_test_tools import snapshots
+
+SERVICE_NAME = 'postgres.service'
+VOLUME_NAME = 'example_postgres-data'
+SNAPSHOT_VOLUME_NAME = 'example_dtt-snapshot-postgres.service-default-0'
+
+
+@contextmanager
+def container_stopped(*args, **kwargs):
+    yield
+
+
+class TestSnapshotManager(unittest.TestCase):
+    """Test the services state snapshots."""
+
+    def setUp(self):
+        self.controller = mock.MagicMock(project_name='example', work_dir=None, container_stopped=container_stopped)
+        self.controller.get_container_id.return_value = 'container-id'
+        self.controller.logs_collector.logs_file = None
+
+        self.docker_client = self.controller.docker_client
+        self.docker_client.inspect_container.return_value = {'Mounts': [
+            {'Type': 'volume', 'Name': VOLUME_NAME},
+            {'Type': 'volume', 'Name': 'a' * 64},
+            {'Type': 'bind', 'Source': '/tmp'},
+        ]}
+        self.docker_client.create_container.return_value = {'Id': 'helper-id'}
+        self.docker_client.wait.return_value = {'StatusCode': 0}
+
+        self.manager = snapshots.SnapshotManager(self.controller)
+
+    def test_volumes_snapshot(self):
+        """Validate only the named volumes are copied, and restoring copies them back & recreates the container."""
+        snapshot = self.manager.snapshot(SERVICE_NAME)
+        self.assertEqual(snapshot.mode, 'volumes')
+        self.assertEqual(snapshot.volumes, [(VOLUME_NAME, SNAPSHOT_VOLUME_NAME)])
+        self.docker_client.create_volume.assert_called_once_with(name=SNAPSHOT_VOLUME_NAME,
+                                                                 labels={snapshots.SNAPSHOT_LABEL: 'example'})
+        self.docker_client.create_host_config.assert_called_with(binds={
+            VOLUME_NAME: {'bind': '/source/0', 'mode': 'ro'},
+            SNAPSHOT_VOLUME_NAME: {'bind': '/target/0', 'mode': 'rw'},
+        })
+        self.docker_client.remove_container.assert_called_once_with({'Id': 'helper-id'}, force=True)
+
+        result = self.manager.restore(SERVICE_NAME)
+        self.assertIs(result.snapshot, snapshot)
+        self.docker_client.stop.assert_called_once_with('container-id')
+        self.docker_client.remove_container.assert_any_call('container-id', v=True)
+        self.docker_client.create_host_config.assert_called_with(binds={
+            SNAPSHOT_VOLUME_NAME: {'bind': '/source/0', 'mode': 'ro'},
+            VOLUME_NAME: {'bind': '/target/0', 'mode': 'rw'},
+        })
+        self.controller.invalidate_service_addresses.assert_called_once_with(SERVICE_NAME)
+        self.controller.up.assert_called_once_with(services=[SERVICE_NAME])
+        self.assertEqual(self.controller.wait_for_health.call_count, 2)
+
+        self.manager.remove_snapshots()
+        self.docker_client.remove_volume.assert_called_once_with(SNAPSHOT_VOLUME_NAME, force=True)
+        self.assertEqual(self.manager.snapshots, {})
+
+    @mock.patch('subprocess.check_output')
+    def test_commit_snapshot(self, mocked_check_output):
+        """Validate commit snapshots are restored by recreating the container from the snapshot image."""
+        self.docker_client.commit.return_value = {'Id': 'image-id'}
+        self.docker_client.inspect_container.return_value = {'Mounts': [{'Type': 'bind', 'Source': '/tmp'}]}
+        self.controller.get_compose_config.return_value = {'version': '2.1'}
+        self.controller.compose_path = 'docker-compose.yml'
+
+        snapshot = self.manager.snapshot(SERVICE_NAME, mode='commit')
+        self.assertEqual(snapshot.image, 'image-id')
+        self.docker_client.create_volume.assert_not_called()
+
+        self.manager.restore(SERVICE_NAME)
+        command = mocked_check_output.call_args[0][0]
+        self.assertEqual(command[-5:], ['up', '-d', '--no-deps', '--force-recreate', SERVICE_NAME])
+        self.controller.up.assert_not_called()
+
+        self.manager.remove_snapshots()
+        self.docker_client.remove_image.assert_called_once_with('image-id', force=True)
+
+    def test_snapshot_errors(self):
+        """Validate failures are reported as snapshot errors."""
+        with self.assertRaises(ValueError):
+            self.manager.snapshot(SERVICE_NAME, mode='invalid')
+
+        with self.assertRaises(snapshots.SnapshotError):
+            self.manager.restore(SERVICE_NAME)
+
+        self.docker_client.inspect_image.side_effect = docker.errors.ImageNotFound('missing')
+        self.docker_client.wait.return_value = {'StatusCode': 1}
+        self.docker_client.logs.return_value = b'tar: error'
+        with self.assertRaises(snapshots.SnapshotError):
+            self.manager.snapshot(SERVICE_NAME)
+
+        self.docker_client.pull.assert_called_once_with(snapshots.HELPER_IMAGE)
+        self.docker_client.remove_container.assert_called_once_with({'Id': 'helper-id'}, force=True)
+
+        self.docker_client.inspect_container.return_value = {'Mounts': []}
+        with self.assertRaises(snapshots.SnapshotError):
+            self.manager.snapshot(SERVICE_NAME)
+
+        # Volumes contents are not captured by a commit
+        self.docker_client.inspect_container.return_value = {'Mounts': [{'Type': 'volume', 'Name': 'a' * 64}]}
+        with self.assertRaises(snapshots.SnapshotError):
+            self.manager.snapshot(SERVICE_NAME, mode='commit')
+        self.docker_client.commit.assert_not_called()
@@ -0,0 +1,94 @@
+import os
+import mock
+import docker
+import shutil
+import tempfile
+import unittest
+
+from docker_test_tools import state
+from docker_test_tools import environment
+
+
+class TestStateCache(unittest.TestCase):
+    """Test the on-disk environment state cache."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+
+        self.compose_path = os.path.join(self.test_dir, 'docker-compose.yml')
+        with open(self.compose_path, 'w') as compose_file:
+            compose_file.write('services: {service1: {image: image1}}\n')
+
+        self.state_dir = os.path.join(self.test_dir, 'state')
+        self.state_cache = state.StateCache(self.state_dir, 'Example', self.compose_path)
+
+    def test_state_cache(self):
+        """Validate the state is written atomically and read back, keyed by the project & compose file."""
+        self.assertEqual(self.state_cache.load(), {})
+
+        self.state_cache.update(api_version='1.39', services=['service1'])
+        self.state_cache.set_entry('containers', 'service1', 'container-id')
+        self.assertEqual(self.state_cache.load()['containers'], {'service1': 'container-id'})
+        self.assertEqual(sorted(name for name in os.listdir(self.state_dir) if not name.endswith('.lock')),
+                         [os.path.basename(self.state_cache.path)])
+
+        self.state_cache.remove_entries('containers')
+        self.assertEqual(self.state_cache.load(), {'version': state.STATE_VERSION, 'api_version': '1.39',
+                                                   'services': ['service1']})
+
+        # Another project, or a changed compose file, don't share the state
+        self.assertEqual(state.StateCache(self.state_dir, 'other', self.compose_path).load(), {})
+        with open(self.compose_path, 'a') as compose_file:
+            compose_file.write('# changed\n')
+        self.assertEqual(state.StateCache(self.state_dir, 'example', self.compose_path).load(), {})
+
+        with open(self.state_cache.path, 'w') as state_file:
+            state_file.write('{corrupted')
+        self.assertEqual(self.state_cache.load(), {})
+
+        self.state_cache.clear()
+        self.assertFalse(os.path.exists(self.state_cache.path))
+
+    def test_addresses_format(self):
+        """Validate the service addresses survive the JSON state format."""
+        addresses = {'service1': ({(8080, 'tcp'): ('localhost', 32768)}, '172.18.0.2'), 'service2': ({}, None)}
+        self.assertEqual(state.load_addresses(state.dump_addresses(addresses)), addresses)
+
+    @mock.patch('docker_test_tools.environment.get_server_api_version', return_value='1.39')
+    def test_attach(self, get_server_api_version_mock):
+        """Validate a secondary controller attaches using the cached state, verifying cached container ids once."""
+        with mock.patch('subprocess.check_output', return_value='service1\n') as check_output_mock:
+            first_controller = environment.EnvironmentController(
+                project_name='example', compose_path=self.compose_path, state_dir=self.state_dir,
+                log_path=os.path.join(self.test_dir, 'first.log'))
+        check_output_mock.assert_called_once()
+
+        container = {'Id': 'container-id', 'Labels': {'com.docker.compose.service': 'service1',
+                                                      'com.docker.compose.project': 'example'}}
+        with mock.patch.object(docker.APIClient, 'containers', return_value=[container]):
+            self.assertEqual(first_controller.get_container_id('service1'), 'container-id')
+
+        with mock.patch('subprocess.check_output') as check_output_mock:
+            second_controller = environment.EnvironmentController(
+                project_name='example', compose_path=self.compose_path, state_dir=self.state_dir,
+                log_path=os.path.join(self.test_dir, 'second.log'))
+        check_output_mock.assert_not_called()
+        get_server_api_version_mock.assert_called_once_with()
+        self.assertEqual(second_controller.services, ['service1'])
+        self.assertEqual(second_controller.environment_variables['DOCKER_API_VERSION'], '1.39')
+
+        with mock.patch.object(docker.APIClient, 'containers') as containers_mock, \
+                mock.patch.object(docker.APIClient, 'inspect_container',
+                                  return_value={'Config': {'Labels': container['Labels']}}) as inspect_mock:
+            self.assertEqual(second_controller.get_container_id('service1'), 'container-id')
+            self.assertEqual(second_controller.get_container_id('service1'), 'container-id')
+        containers_mock.assert_not_called()
+        inspect_mock.assert_called_once_with('container-id')
+
+        # A recreated container is looked up again
+        second_controller.invalidate_container_ids()
+        with mock.patch.object(docker.APIClient, 'inspect_container', side_effect=docker.errors.NotFound('gone')), \
+                mock.patch.object(docker.APIClient, 'containers', return_value=[dict(container, Id='new-id')]):
+            self.assertEqual(second_controller.get_container_id('service1'), 'new-id')
+        self.assertEqual(first_controller.state_cache.load()['containers'], {'service1': 'new-id'})
@@ -0,0 +1,102 @@
+import io
+import os
+import mock
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from docker_test_tools import transfer
+from docker_test_tools import environment
+
+
+def receive_archive(container_id, path, data):
+    """Fake `put_archive`, consuming the streamed archive chunks."""
+    receive_archive.archives[container_id] = b''.join(data)
+    return True
+
+
+class TestTransfer(unittest.TestCase):
+    """Test the streaming files transfer."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+
+        self.src_dir = os.path.join(self.test_dir, 'fixtures')
+        os.makedirs(os.path.join(self.src_dir, 'nested'))
+        with open(os.path.join(self.src_dir, 'nested', 'data.bin'), 'wb') as data_file:
+            data_file.write(os.urandom(3 * 1024 * 1024))
+        with open(os.path.join(self.src_dir, 'config.txt'), 'w') as config_file:
+            config_file.write('config')
+
+        receive_archive.archives = {}
+        self.docker_client = mock.MagicMock()
+        self.docker_client.put_archive.side_effect = receive_archive
+
+    def assert_same_file(self, first_path, second_path):
+        with open(first_path, 'rb') as first_file, open(second_path, 'rb') as second_file:
+            self.assertEqual(first_file.read(), second_file.read())
+
+    def test_round_trip(self):
+        """Validate the files are archived & extracted as streamed chunks, with and without compression."""
+        for compression in (None, 'gz', 'bz2') + (('xz',) if transfer.XZ_SUPPORTED else ()):
+            size = transfer.put_files(self.docker_client, 'container-id', [self.src_dir + '/'], '/data',
+                                      compression=compression, chunk_size=64 * 1024)
+            archive = receive_archive.archives['container-id']
+            self.assertEqual(size, len(archive))
+
+            dest = os.path.join(self.test_dir, 'received-%s' % compression)
+            self.docker_client.get_archive.return_value = (
+                (archive[index:index + 1000] for index in range(0, len(archive), 1000)), {})
+            self.assertEqual(transfer.get_files(self.docker_client, 'container-id', ['/data/fixtures'], dest),
+                             size)
+
+            self.assert_same_file(os.path.join(self.src_dir, 'nested', 'data.bin'),
+                                  os.path.join(dest, 'fixtures', 'nested', 'data.bin'))
+            self.assert_same_file(os.path.join(self.src_dir, 'config.txt'),
+                                  os.path.join(dest, 'fixtures', 'config.txt'))
+
+    def test_errors(self):
+        """Validate missing sources and invalid compressions are rejected before streaming."""
+        with self.assertRaises(transfer.TransferError):
+            transfer.iter_archive([os.path.join(self.test_dir, 'missing')])
+
+        with self.assertRaises(ValueError):
+            transfer.iter_archive([self.src_dir], compression='zip')
+
+        with mock.patch('docker_test_tools.transfer.XZ_SUPPORTED', False):
+            with self.assertRaises(ValueError):
+                transfer.iter_archive([self.src_dir], compression='xz')
+
+    def test_unsafe_members(self):
+        """Validate members extracting outside the destination directory are skipped."""
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            for name in ('safe.txt', '../unsafe.txt', '/absolute.txt'):
+                info = tarfile.TarInfo(name)
+                info.size = 4
+                tar.addfile(info, io.BytesIO(b'data'))
+
+            link = tarfile.TarInfo('link')
+            link.type = tarfile.LNKTYPE
+            link.linkname = '/etc/passwd'
+            tar.addfile(link)
+
+        dest = os.path.join(self.test_dir, 'dest')
+        self.assertEqual(transfer.extract_archive([archive.getvalue()], dest), 1)
+        self.assertEqual(os.listdir(dest), ['safe.txt'])
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, 'unsafe.txt')))
+
+    @mock.patch('docker_test_tools.environment.get_server_api_version', mock.MagicMock(return_value='1.39'))
+    def test_controller_put_files(self):
+        """Validate the controller copies files into several containers in parallel."""
+        with mock.patch("subprocess.check_output", return_value="service1\nservice2\n"):
+            controller = environment.EnvironmentController(project_name='test', compose_path='compose.yml',
+                                                           log_path=os.path.join(self.test_dir, 'docker.log'))
+        controller.docker_client = self.docker_client
+        controller.get_container_id = lambda name: name + '-id'
+
+        size = controller.put_files(['service1', 'service2'], self.src_dir, '/data')
+        self.assertEqual(sorted(receive_archive.archives), ['service1-id', 'service2-id'])
+        self.assertEqual(size, sum(len(archive) for archive in receive_archive.archives.values()))
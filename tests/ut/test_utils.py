@@ -19,3 +19,18 @@ class TestUtils(unittest.TestCase):
         self.assertTrue(utils.run_health_checks([lambda: True, lambda: True], timeout=0))
         self.assertFalse(utils.run_health_checks([lambda: True, lambda: False], timeout=0))
         self.assertFalse(utils.run_health_checks([lambda: False, lambda: False], timeout=0))
+
+    @mock.patch('requests.get')
+    def test_health_check_service_reference(self, get_mock):
+        """Validate health checks resolve service references on every check."""
+        get_mock.return_value = mock.MagicMock(status_code=200)
+        controller = mock.MagicMock()
+        controller.get_service_address.side_effect = [('localhost', 32768), ('localhost', 32769)]
+
+        health_check = utils.get_health_check('service1', utils.ServiceReference(controller, 'service1', 8080,
+                                                                                 path='/health'))
+        self.assertTrue(health_check())
+        self.assertTrue(health_check())
+        get_mock.assert_any_call('http://localhost:32768/health', timeout=5)
+        get_mock.assert_called_with('http://localhost:32769/health', timeout=5)
+        controller.get_service_address.assert_called_with('service1', 8080)
@@ -1,8 +1,19 @@
+import os
+import json
+import math
+import collections
 import mock
+import datetime
+import shutil
+import tempfile
 from six.moves import http_client
 import unittest
 
+import requests
+
+from docker_test_tools import utils
 from docker_test_tools import wiremock
+from docker_test_tools import mock_server
 
 
 class TestWiremockController(unittest.TestCase):
@@ -22,7 +33,7 @@ class TestWiremockController(unittest.TestCase):
         mock_response = mock.MagicMock()
         mock_post = mock.MagicMock(return_value=mock_response)
 
-        with mock.patch("requests.post", mock_post):
+        with mock.patch("requests.Session.request", mock_post):
 
             # Mock response assertion to fail
             mock_response.raise_for_status = mock.MagicMock(side_effect=Exception("requests-failure"))
@@ -36,7 +47,22 @@ class TestWiremockController(unittest.TestCase):
 
             # Reset should pass
             self.controller.reset_mapping()
-            mock_post.assert_any_call('http://mocked.service:9999/__admin/mappings/reset')
+            mock_post.assert_any_call('POST', 'http://mocked.service:9999/__admin/mappings/reset', timeout=None)
+
+    def test_service_reference_url(self):
+        """Validate the admin urls are resolved from a service reference on every call."""
+        environment_controller = mock.MagicMock()
+        environment_controller.get_service_address.return_value = ('localhost', 32768)
+        controller = wiremock.WiremockController(url=utils.ServiceReference(environment_controller, 'mocked', 8080))
+
+        with mock.patch("requests.Session.request") as mock_request:
+            mock_request.return_value = mock.MagicMock(status_code=http_client.OK, text='{"requests": []}')
+            controller.reset_mapping()
+            mock_request.assert_called_with('POST', 'http://localhost:32768/__admin/mappings/reset', timeout=None)
+
+            environment_controller.get_service_address.return_value = ('localhost', 32769)
+            controller.get_request_journal()
+            mock_request.assert_called_with('GET', 'http://localhost:32769/__admin/requests', timeout=None)
 
     def test_set_mapping_from_json(self):
         """Test 'set_mapping_from_json' method."""
@@ -50,7 +76,7 @@ class TestWiremockController(unittest.TestCase):
         mock_response = mock.MagicMock()
         mock_post = mock.MagicMock(return_value=mock_response)
 
-        with mock.patch("requests.post", mock_post):
+        with mock.patch("requests.Session.request", mock_post):
 
             # Mock response assertion to fail
             mock_response.raise_for_status = mock.MagicMock(side_effect=Exception("requests-failure"))
@@ -64,7 +90,8 @@ class TestWiremockController(unittest.TestCase):
             mock_response.json.return_value = {'uuid': '162d458b-86d6-4161-9918-02cf27566422'}
             # Setting mapping should pass
             stub_id = self.controller.set_mapping_from_json(test_json)
-            mock_post.assert_any_call('http://mocked.service:9999/__admin/mappings', json=test_json)
+            mock_post.assert_any_call('POST', 'http://mocked.service:9999/__admin/mappings', json=test_json,
+                                      timeout=None)
             self.assertEqual(stub_id, '162d458b-86d6-4161-9918-02cf27566422')
 
     @mock.patch('docker_test_tools.wiremock.WiremockController.set_mapping_from_json')
@@ -81,18 +108,131 @@ class TestWiremockController(unittest.TestCase):
             from_json_mock.assert_called_once_with({u"valid": u"json"})
             self.assertEqual(stub_id, '162d458b-86d6-4161-9918-02cf27566422')
 
-    @mock.patch('docker_test_tools.wiremock.WiremockController.set_mapping_from_file')
-    def test_set_mapping_from_files(self, from_file_mock):
-        """Test 'set_mapping_from_files' method."""
-        test_paths = ['json-file-path-1', 'json-file-path-2']
-        stub_ids = ['162d458b-86d6-4161-9918-02cf27566422', '41a0a68b-ecf3-4879-9542-a12028bd7c09']
-        from_file_mock.side_effect = stub_ids
-
-        stub_id_dict = self.controller.set_mapping_from_files(test_paths)
-        for test_path in test_paths:
-            from_file_mock.assert_any_call(test_path)
-
-        self.assertDictEqual(stub_id_dict, dict(zip(test_paths, stub_ids)))
+    def write_stubs(self, count, bad_paths=()):
+        """Write stub files to a temporary directory and return their paths."""
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+
+        paths = []
+        for index in range(count):
+            path = os.path.join(test_dir, 'stub-%d.json' % index)
+            with open(path, 'w') as stub_file:
+                stub_file.write('{"request": {"url": "/%d"}}' % index)
+            paths.append(path)
+
+        for bad_path in bad_paths:
+            path = os.path.join(test_dir, bad_path)
+            with open(path, 'w') as stub_file:
+                stub_file.write('not-a-json')
+            paths.append(path)
+
+        return paths
+
+    def test_set_mapping_from_files(self):
+        """Test 'set_mapping_from_files' method - stubs are imported in batches."""
+        test_paths = self.write_stubs(5)
+
+        mock_request = mock.Mock(return_value=mock.Mock(ok=True, status_code=http_client.OK))
+        with mock.patch("requests.Session.request", mock_request):
+            stub_ids = self.controller.set_mapping_from_files(test_paths, batch_size=2)
+
+        self.assertEqual(sorted(stub_ids), sorted(test_paths))
+        self.assertEqual(mock_request.call_count, 3)
+
+        imported = []
+        for call in mock_request.call_args_list:
+            self.assertEqual(call[0], ('POST', 'http://mocked.service:9999/__admin/mappings/import'))
+            imported.extend(call[1]['json']['mappings'])
+        self.assertEqual(sorted(stub_ids.values()), sorted(stub['id'] for stub in imported))
+
+    def test_set_mapping_from_files_fallback(self):
+        """Test 'set_mapping_from_files' method - fall back to parallel upload without the import API."""
+        test_paths = self.write_stubs(3, bad_paths=['bad.json'])
+
+        def request(method, url, json=None, **kwargs):
+            if url.endswith('/import'):
+                return mock.Mock(ok=False, status_code=http_client.NOT_FOUND)
+            if json['request']['url'] == '/1':
+                return mock.Mock(raise_for_status=mock.Mock(side_effect=Exception('upload-failure')))
+            return mock.Mock(json=mock.Mock(return_value={'uuid': json['id']}))
+
+        with mock.patch("requests.Session.request", mock.Mock(side_effect=request)):
+            with self.assertRaises(wiremock.WiremockMappingError) as context:
+                self.controller.set_mapping_from_files(test_paths)
+
+            self.assertIsInstance(context.exception, ValueError)
+            self.assertFalse(self.controller.import_supported)
+            self.assertEqual(sorted(context.exception.errors), sorted([test_paths[1], test_paths[3]]))
+            self.assertEqual(sorted(context.exception.stub_ids), sorted([test_paths[0], test_paths[2]]))
+
+    def test_with_stub_id(self):
+        """Test stub ids are kept when defined and generated otherwise."""
+        self.assertEqual(wiremock.with_stub_id({'id': 'stub-id'}), {'id': 'stub-id'})
+        self.assertEqual(wiremock.with_stub_id({'uuid': 'stub-id'}), {'id': 'stub-id', 'uuid': 'stub-id'})
+
+        stub = {'request': {}}
+        self.assertIn('id', wiremock.with_stub_id(stub))
+        self.assertNotIn('id', stub)
+
+    def test_sync_mapping_from_files(self):
+        """Test 'sync_mapping_from_files' method - only new or changed stubs are uploaded, removed ones deleted."""
+        test_paths = self.write_stubs(3)
+        server_mappings = {}
+
+        def request(method, url, json=None, **kwargs):
+            if method == 'GET':
+                return mock.Mock(status_code=http_client.OK,
+                                 json=mock.Mock(return_value={'mappings': list(server_mappings.values())}))
+            if method == 'DELETE':
+                server_mappings.pop(url.rsplit('/', 1)[-1])
+                return mock.Mock(ok=True, status_code=http_client.OK)
+            if url.endswith('/reset'):
+                server_mappings.clear()
+                return mock.Mock()
+            server_mappings.update((stub['id'], stub) for stub in json['mappings'])
+            return mock.Mock(ok=True, status_code=http_client.OK)
+
+        mock_request = mock.Mock(side_effect=request)
+        with mock.patch("requests.Session.request", mock_request):
+            # The first sync loads the index from the server and uploads all stubs
+            stub_ids = self.controller.sync_mapping_from_files(test_paths)
+            self.assertEqual(sorted(stub_ids), sorted(test_paths))
+            self.assertEqual(sorted(stub_ids.values()), sorted(server_mappings))
+            self.assertEqual([call[0][0] for call in mock_request.call_args_list], ['GET', 'POST'])
+
+            # Syncing unchanged stubs costs no calls
+            mock_request.reset_mock()
+            self.assertEqual(self.controller.sync_mapping_from_files(test_paths), stub_ids)
+            mock_request.assert_not_called()
+
+            # A new controller loads the index from the stubs metadata
+            controller = wiremock.WiremockController(url='http://mocked.service:9999')
+            self.assertEqual(controller.sync_mapping_from_files(test_paths), stub_ids)
+            self.assertEqual(mock_request.call_count, 1)
+
+            # Only the changed stub is uploaded and only the removed stub is deleted
+            with open(test_paths[0], 'w') as stub_file:
+                stub_file.write('{"request": {"url": "/changed"}}')
+            mock_request.reset_mock()
+            new_stub_ids = self.controller.sync_mapping_from_files(test_paths[:2])
+            self.assertEqual(sorted(call[0][0] for call in mock_request.call_args_list), ['DELETE', 'DELETE', 'POST'])
+            self.assertEqual(new_stub_ids[test_paths[1]], stub_ids[test_paths[1]])
+            self.assertEqual(sorted(new_stub_ids.values()), sorted(server_mappings))
+            self.assertEqual(server_mappings[new_stub_ids[test_paths[0]]]['request']['url'], '/changed')
+
+            # Reset drops the index, so the next sync reloads it and uploads all stubs
+            self.controller.reset_mapping()
+            self.assertIsNone(self.controller.stubs_index)
+            self.controller.sync_mapping_from_files(test_paths)
+            self.assertEqual(len(server_mappings), 3)
+
+    def test_get_stub_hash(self):
+        """Test stub hashes ignore the stub ids, hash metadata and json keys order."""
+        stub_hash = wiremock.get_stub_hash({'request': {'url': '/1', 'method': 'GET'}})
+        self.assertEqual(wiremock.get_stub_hash({'id': 'stub-id', 'request': {'method': 'GET', 'url': '/1'}}), stub_hash)
+        self.assertEqual(wiremock.get_stub_hash(wiremock.with_stub_hash({'request': {'url': '/1', 'method': 'GET'}},
+                                                                        stub_hash)), stub_hash)
+        self.assertNotEqual(wiremock.get_stub_hash({'request': {'url': '/2', 'method': 'GET'}}), stub_hash)
 
     @mock.patch('os.path.isdir')
     @mock.patch('docker_test_tools.wiremock.WiremockController.set_mapping_from_files')
@@ -106,7 +246,8 @@ class TestWiremockController(unittest.TestCase):
             glob_mock.return_value = test_paths
             self.controller.set_mapping_from_dir(test_dir)
             glob_mock.assert_called_once_with('some/dir/*.json')
-            from_files_mock.assert_called_once_with(test_paths)
+            from_files_mock.assert_called_once_with(test_paths, batch_size=wiremock.WiremockController.DEFAULT_BATCH_SIZE,
+                                                    parallelism=wiremock.WiremockController.DEFAULT_PARALLELISM)
 
     def test_get_request_journal(self):
         """Test 'get_request_journal' method."""
@@ -116,9 +257,9 @@ class TestWiremockController(unittest.TestCase):
         mock_response.text = self.journal_json
         mock_get = mock.Mock(return_value=mock_response)
 
-        with mock.patch("requests.get", mock_get):
+        with mock.patch("requests.Session.request", mock_get):
             requests = self.controller.get_request_journal()
-            mock_get.assert_called_once_with("http://mocked.service:9999/__admin/requests")
+            mock_get.assert_called_once_with('GET', "http://mocked.service:9999/__admin/requests", timeout=None)
             self.assertEquals(requests[0]["request"]["url"], "/received-request/7")
             self.assertEquals(requests[1]["request"]["url"], "/received-request/6")
 
@@ -129,37 +270,148 @@ class TestWiremockController(unittest.TestCase):
         mock_response.status_code = http_client.NOT_FOUND
         mock_get = mock.Mock(return_value=mock_response)
 
-        with mock.patch("requests.get", mock_get):
+        with mock.patch("requests.Session.request", mock_get):
             self.assertRaises(ValueError, self.controller.get_request_journal)
 
+    def mock_journal_response(self, chunk_size=100):
+        """Return a mocked streamed journal response."""
+        mock_response = mock.Mock(status_code=http_client.OK, encoding=None)
+        mock_response.iter_content.return_value = [self.journal_json[index:index + chunk_size]
+                                                   for index in range(0, len(self.journal_json), chunk_size)]
+        return mock_response
+
     def test_get_matching_requests(self):
         """Test 'get_matching_requests' method."""
+        mock_get = mock.Mock(side_effect=lambda *args, **kwargs: self.mock_journal_response())
 
-        mock_response = mock.Mock()
-        mock_response.status_code = http_client.OK
-        mock_response.text = self.journal_json
-        mock_get = mock.Mock(return_value=mock_response)
-
-        with mock.patch("requests.get", mock_get):
+        with mock.patch("requests.Session.request", mock_get):
             requests = self.controller.get_matching_requests("/received-request/6")
-            mock_get.assert_called_once_with("http://mocked.service:9999/__admin/requests")
+            mock_get.assert_called_once_with('GET', "http://mocked.service:9999/__admin/requests", params={},
+                                             stream=True, timeout=None)
             self.assertEquals(len(requests), 1)
             self.assertEquals(requests[0]["request"]["url"], "/received-request/6")
 
             mock_get.reset_mock()
             requests = self.controller.get_matching_requests(stub_id="162d458b-86d6-4161-9918-02cf27566422")
-            mock_get.assert_called_once_with("http://mocked.service:9999/__admin/requests")
+            mock_get.assert_called_once_with('GET', "http://mocked.service:9999/__admin/requests",
+                                             params={'matchingStub': "162d458b-86d6-4161-9918-02cf27566422"},
+                                             stream=True, timeout=None)
             self.assertEquals(len(requests), 1)
             self.assertEquals(requests[0]["stubMapping"]["uuid"], "162d458b-86d6-4161-9918-02cf27566422")
 
+            mock_get.reset_mock()
+            self.controller.get_matching_requests(since=datetime.datetime(2016, 10, 3, 11, 46, 53, 275000), limit=10)
+            mock_get.assert_called_once_with('GET', "http://mocked.service:9999/__admin/requests",
+                                             params={'since': '2016-10-03T11:46:53.275Z', 'limit': 10},
+                                             stream=True, timeout=None)
+
+    def test_iter_request_journal(self):
+        """Test the journal is streamed - decoded incrementally from its chunks."""
+        mock_response = self.mock_journal_response(chunk_size=7)
+        with mock.patch("requests.Session.request", mock.Mock(return_value=mock_response)):
+            journal = self.controller.iter_request_journal()
+            self.assertEqual(next(journal)["request"]["url"], "/received-request/7")
+            self.assertEqual(list(journal), json.loads(self.journal_json)["requests"][1:])
+            mock_response.close.assert_called_once_with()
+
+        mock_response = mock.Mock(status_code=http_client.NOT_FOUND)
+        with mock.patch("requests.Session.request", mock.Mock(return_value=mock_response)):
+            with self.assertRaises(ValueError):
+                list(self.controller.iter_request_journal())
+
+    def test_json_array_stream(self):
+        """Test the json array stream decoding of split documents."""
+        document = json.dumps({"meta": {"requests": [0]}, "requests": [{"id": "]}"}, 12345, None], "total": 2})
+        for chunk_size in (1, 4, len(document)):
+            chunks = [document[index:index + chunk_size] for index in range(0, len(document), chunk_size)]
+            self.assertEqual(list(wiremock.JsonArrayStream(chunks, key="requests")), [{"id": "]}"}, 12345, None])
+
+        self.assertEqual(list(wiremock.JsonArrayStream(['{"requests": []}'], key="requests")), [])
+        with self.assertRaises(ValueError):
+            list(wiremock.JsonArrayStream(['{"requests": [{"id"'], key="requests"))
+
+    def test_find_and_count_requests(self):
+        """Test 'find_requests' and 'count_requests' methods."""
+        criteria = wiremock.request_pattern(method='POST', url_path='/test',
+                                            headers={'Content-Type': {'contains': 'json'}, 'X-Id': '1'},
+                                            body_json_paths=['$.name'])
+        self.assertEqual(criteria, {"method": "POST", "urlPath": "/test",
+                                    "headers": {"Content-Type": {"contains": "json"}, "X-Id": {"equalTo": "1"}},
+                                    "bodyPatterns": [{"matchesJsonPath": "$.name"}]})
+
+        mock_request = mock.Mock(return_value=mock.Mock(status_code=http_client.OK))
+        mock_request.return_value.json.return_value = {"requests": [{"url": "/test"}], "count": 1}
+        with mock.patch("requests.Session.request", mock_request):
+            self.assertEqual(self.controller.find_requests(criteria), [{"url": "/test"}])
+            mock_request.assert_called_once_with('POST', "http://mocked.service:9999/__admin/requests/find",
+                                                 json=criteria, timeout=None)
+
+            self.assertEqual(self.controller.count_requests(), 1)
+            mock_request.assert_called_with('POST', "http://mocked.service:9999/__admin/requests/count",
+                                            json={"method": "ANY"}, timeout=None)
+
+            mock_request.return_value.status_code = http_client.NOT_FOUND
+            self.assertRaises(ValueError, self.controller.count_requests, criteria)
+
+    @mock.patch('time.sleep')
+    def test_wait_for_requests(self, sleep_mock):
+        """Test 'wait_for_requests' method - polls the count with an adaptive interval, then finds the requests."""
+        counts = iter([0, 0, 0, 1, 1, 2])
+        criteria = wiremock.request_pattern(url='/test')
+
+        with mock.patch.object(self.controller, 'count_requests', side_effect=lambda criteria: next(counts)), \
+                mock.patch.object(self.controller, 'find_requests') as find_mock:
+            find_mock.return_value = [{"url": "/test", "loggedDate": 2000}, {"url": "/test", "loggedDate": 1000}]
+            with mock.patch('time.time', return_value=1.5):
+                result = self.controller.wait_for_requests(criteria, count=2, timeout=10)
+
+            find_mock.assert_called_once_with(criteria)
+            self.assertEqual(result.polls, 6)
+            self.assertEqual(result.arrivals, [-0.5, 0.5])
+            self.assertEqual(len(result.requests), 2)
+            self.assertEqual([call[0][0] for call in sleep_mock.call_args_list], [0.05, 0.1, 0.2, 0.05, 0.1])
+
+        with mock.patch.object(self.controller, 'count_requests', return_value=0):
+            with self.assertRaises(wiremock.WiremockError):
+                self.controller.wait_for_requests(criteria, timeout=0)
+
     def test_delete_request_journal(self):
         """Test 'delete_request_journal' method."""
 
         mock_delete = mock.Mock()
 
-        with mock.patch("requests.delete", mock_delete):
+        with mock.patch("requests.Session.request", mock_delete):
+            self.controller.delete_request_journal()
+            mock_delete.assert_called_once_with('DELETE', "http://mocked.service:9999/__admin/requests", timeout=None)
+
+    def test_session(self):
+        """Test the controller session pooling, ownership and calls stats."""
+        adapter = self.controller.session.get_adapter('http://mocked.service:9999')
+        self.assertEqual(adapter.max_retries.total, wiremock.WiremockController.DEFAULT_RETRIES)
+        self.assertEqual(adapter._pool_maxsize, wiremock.WiremockController.DEFAULT_POOL_SIZE)
+
+        mock_request = mock.Mock()
+        with mock.patch("requests.Session.request", mock_request):
             self.controller.delete_request_journal()
-            mock_delete.assert_called_once_with("http://mocked.service:9999/__admin/requests")
+            self.controller.delete_request_journal()
+            self.controller.reset_mapping()
+
+        call_stats = self.controller.get_call_stats()
+        self.assertEqual(sorted(call_stats), ['delete_request_journal', 'reset_mapping'])
+        self.assertEqual(call_stats['delete_request_journal']['count'], 2)
+        self.controller.reset_call_stats()
+        self.assertEqual(self.controller.get_call_stats(), {})
+
+        # A given session is shared - not closed by the controller
+        shared_session = mock.MagicMock()
+        with wiremock.WiremockController(url='http://mocked.service:9999', session=shared_session) as controller:
+            self.assertIs(controller.session, shared_session)
+        shared_session.close.assert_not_called()
+
+        with mock.patch("requests.Session.close") as mock_close:
+            with wiremock.WiremockController(url='http://mocked.service:9999'):
+                pass
+            mock_close.assert_called_once_with()
 
     def test_set_mapping_from_non_existing_dir(self):
         """Test 'set_mapping_from_non_existing_dir' method."""
@@ -168,3 +420,200 @@ class TestWiremockController(unittest.TestCase):
 
         with self.assertRaises(ValueError):
             self.controller.set_mapping_from_dir(test_dir)
+
+
+class TestResponseProfile(unittest.TestCase):
+    """Test applying response profiles, using a mock server."""
+
+    def setUp(self):
+        self.server = mock_server.MockServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+        self.controller = wiremock.WiremockController(url=self.server.url)
+        self.addCleanup(self.controller.close)
+        self.stub_id = self.controller.set_mapping_from_json({"request": {"url": "/test"},
+                                                              "response": {"status": 200, "body": "x" * 100}})
+
+    def test_profile(self):
+        """Test the profile delays and throttling definitions."""
+        profile = wiremock.ResponseProfile().lognormal_delay(p50=100, p99=2000)
+        self.assertEqual(profile.delay[1]["type"], "lognormal")
+        self.assertAlmostEqual(100 * math.exp(profile.delay[1]["sigma"] * wiremock.ResponseProfile.P99_Z_SCORE), 2000,
+                               delta=1)
+        self.assertEqual(profile.get_settings(), {"delayDistribution": profile.delay[1]})
+        self.assertEqual(wiremock.ResponseProfile().fixed_delay(10).get_settings(), {"fixedDelay": 10})
+
+        response = wiremock.ResponseProfile().uniform_delay(10, 20).bandwidth(1000, chunk_size=10).apply_response(
+            {"body": "x" * 100, "fixedDelayMilliseconds": 5})
+        self.assertEqual(response, {"body": "x" * 100,
+                                    "delayDistribution": {"type": "uniform", "lower": 10, "upper": 20},
+                                    "chunkedDribbleDelay": {"numberOfChunks": 10, "totalDuration": 100}})
+
+        with self.assertRaises(ValueError):
+            wiremock.ResponseProfile().lognormal_delay(p50=100, p99=50)
+        with self.assertRaises(ValueError):
+            wiremock.ResponseProfile().fault_rate(0.5, fault='UNKNOWN')
+
+    def test_global_delay(self):
+        """Test a profile delay is applied globally and reverted."""
+        with self.controller.response_profile(wiremock.ResponseProfile().fixed_delay(100)):
+            self.assertEqual(self.controller.get_settings(), {"fixedDelay": 100})
+            self.assertGreaterEqual(requests.get(self.server.url + '/test').elapsed.total_seconds(), 0.1)
+            self.assertEqual(self.controller.get_mapping(self.stub_id)["response"]["body"], "x" * 100)
+
+        self.assertEqual(self.controller.get_settings(), {})
+
+    def test_fault_rate(self):
+        """Test faults are spread over the responses cycle and reverted."""
+        profile = wiremock.ResponseProfile().fault_rate(0.25).chunked_dribble(number_of_chunks=2, total_duration=10)
+        with self.controller.response_profile(profile, stub_ids=[self.stub_id]) as applied:
+            self.assertEqual(len(applied.added_stub_ids), 3)
+            self.assertEqual(len(self.controller.get_mappings()), 4)
+
+            statuses = []
+            for _ in range(8):
+                try:
+                    statuses.append(requests.get(self.server.url + '/test').status_code)
+                except requests.ConnectionError:
+                    statuses.append(None)
+            self.assertEqual(statuses, [200, 200, 200, None] * 2)
+
+        self.assertEqual(self.controller.get_mappings(), [self.controller.get_mapping(self.stub_id)])
+        self.assertNotIn('chunkedDribbleDelay', self.controller.get_mapping(self.stub_id)["response"])
+        self.assertEqual(requests.get(self.server.url + '/test').status_code, 200)
+
+
+class TestWiremockCluster(unittest.TestCase):
+    """Test the wiremock cluster, using mock servers."""
+
+    def setUp(self):
+        self.servers = collections.OrderedDict()
+        for name in ('service1', 'service2', 'service3'):
+            self.servers[name] = mock_server.MockServer()
+            self.servers[name].start()
+            self.addCleanup(self.servers[name].stop)
+
+        self.cluster = wiremock.WiremockCluster(dict((name, server.url) for name, server in self.servers.items()))
+        self.addCleanup(self.cluster.close)
+
+    def test_cluster(self):
+        """Test operations run on all the instances, sharing a single session."""
+        self.assertEqual(len(self.cluster), 3)
+        self.assertTrue(all(self.cluster[name].session is self.cluster.session for name in self.cluster))
+
+        stubs_dir_path = os.path.join(os.path.dirname(__file__), '..', 'resources', 'wiremock_stubs')
+        results = self.cluster.sync_mapping_from_dirs({'service1': stubs_dir_path, 'service2': stubs_dir_path})
+        self.assertEqual(list(results), ['service1', 'service2'])
+        self.assertTrue(all(result.error is None and len(result.result) == 1 for result in results.values()))
+        self.assertEqual(requests.post(self.servers['service2'].url + '/test').status_code, http_client.OK)
+        self.assertEqual(requests.post(self.servers['service3'].url + '/test').status_code, http_client.NOT_FOUND)
+
+        counts = self.cluster.count_requests(wiremock.request_pattern(url='/test'))
+        self.assertEqual(dict((name, result.result) for name, result in counts.items()),
+                         {'service1': 0, 'service2': 1, 'service3': 1})
+        self.assertTrue(all(result.duration >= 0 for result in counts.values()))
+
+        self.cluster.delete_request_journal()
+        self.cluster.reset_mapping()
+        self.assertEqual(requests.post(self.servers['service2'].url + '/test').status_code, http_client.NOT_FOUND)
+
+        results = self.cluster.run(lambda controller, url: len(controller.get_matching_requests(url)), url='/test')
+        self.assertEqual([result.result for result in results.values()], [0, 1, 0])
+
+    def test_cluster_errors(self):
+        """Test failures on some instances are reported once all the instances are done."""
+        self.servers['service3'].stop()
+
+        with self.assertRaises(wiremock.WiremockClusterError) as context:
+            self.cluster.reset_mapping()
+        self.assertIsNone(context.exception.results['service1'].error)
+        self.assertIsInstance(context.exception.results['service3'].error, wiremock.WiremockError)
+
+        results = self.cluster.reset_mapping(names=['service1', 'service2'])
+        self.assertEqual(list(results), ['service1', 'service2'])
+
+
+class TestRecording(unittest.TestCase):
+    """Test recording stubs, using mock servers."""
+
+    def setUp(self):
+        self.target = mock_server.MockServer()
+        self.recorder = mock_server.MockServer()
+        for server in (self.target, self.recorder):
+            server.start()
+            self.addCleanup(server.stop)
+
+        self.controller = wiremock.WiremockController(url=self.recorder.url)
+        self.addCleanup(self.controller.close)
+        with wiremock.WiremockController(url=self.target.url) as target_controller:
+            target_controller.set_mapping_from_json({"request": {"url": "/items"},
+                                                     "response": {"status": 200, "jsonBody": {"items": [1, 2]},
+                                                                  "fixedDelayMilliseconds": 20}})
+            target_controller.set_mapping_from_json({"request": {"url": "/other"}, "response": {"status": 204}})
+
+        self.stubs_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.stubs_dir)
+
+    def test_recording(self):
+        """Test the proxied requests are recorded into a content-hashed stubs directory which can be replayed."""
+        stale_path = os.path.join(self.stubs_dir, 'stale.json')
+        with open(stale_path, 'w') as stale_file:
+            stale_file.write('{}')
+
+        # Requests served before the recording started are not part of the fitted delays
+        self.controller.set_mapping_from_json({"request": {"url": "/items"}, "response": {"status": 200}})
+        for _ in range(3):
+            self.assertEqual(requests.get(self.recorder.url + '/items').status_code, http_client.OK)
+        self.controller.reset_mapping()
+
+        with self.controller.recording(self.target.url, self.stubs_dir, keep_delays=True, clean=True) as recording:
+            self.assertEqual(self.controller.get_recording_status(), 'Recording')
+            self.assertEqual(requests.get(self.recorder.url + '/items').json(), {"items": [1, 2]})
+            self.assertEqual(requests.get(self.recorder.url + '/items').status_code, http_client.OK)
+            self.assertEqual(requests.get(self.recorder.url + '/other').status_code, http_client.NO_CONTENT)
+
+        self.assertEqual(self.controller.get_recording_status(), 'Stopped')
+        self.assertEqual(len(recording.stubs), 2)
+        self.assertEqual(sorted(os.listdir(self.stubs_dir)), sorted(os.path.basename(path) for path in recording.paths))
+
+        stubs = dict((stub["request"]["url"], stub) for stub in [json.load(open(path)) for path in recording.paths])
+        self.assertNotIn('id', stubs['/items'])
+        # Identical observed latencies give a fixed delay, differing ones a log-normal distribution
+        response = stubs['/items']["response"]
+        self.assertGreaterEqual(response.get("fixedDelayMilliseconds") or response["delayDistribution"]["median"], 20)
+
+        # Replay the recorded stubs on a fresh server
+        with mock_server.MockServer() as server, wiremock.WiremockController(url=server.url) as controller:
+            controller.set_mapping_from_dir(self.stubs_dir)
+            self.assertEqual(requests.get(server.url + '/items').json(), {"items": [1, 2]})
+            self.assertEqual(requests.get(server.url + '/other').status_code, http_client.NO_CONTENT)
+
+    def test_recording_error(self):
+        """Test an error raised in the recording context isn't masked by a failure to stop the recording."""
+        with mock.patch.object(self.controller, 'stop_recording', side_effect=wiremock.WiremockError('stop failed')):
+            with self.assertRaises(ValueError):
+                with self.controller.recording(self.target.url, self.stubs_dir):
+                    raise ValueError('test error')
+
+        self.assertEqual(os.listdir(self.stubs_dir), [])
+
+    def test_save_stubs(self):
+        """Test identical stubs are saved once, regardless of their ids."""
+        stub = {"request": {"url": "/items"}, "response": {"status": 200}}
+        paths = wiremock.save_stubs([dict(stub, id='1'), dict(stub, id='2'), {"request": {"url": "/other"}}],
+                                    self.stubs_dir)
+        self.assertEqual(len(paths), 2)
+        self.assertEqual(paths, wiremock.save_stubs([stub, {"request": {"url": "/other"}}], self.stubs_dir))
+
+    def test_with_observed_delays(self):
+        """Test delays are fitted to the observed latencies."""
+        stubs = [{"request": {"method": "GET", "url": "/%d" % index}, "response": {"status": 200}} for index in range(3)]
+        serve_events = [{"request": {"method": "GET", "url": "/0"}, "timing": {"totalTime": 10}},
+                        {"request": {"method": "GET", "url": "/1"}, "timing": {"totalTime": 10}},
+                        {"request": {"method": "GET", "url": "/1"}, "timing": {"totalTime": 100}}]
+
+        delayed_stubs = wiremock.with_observed_delays(stubs, serve_events)
+        self.assertEqual(delayed_stubs[0]["response"]["fixedDelayMilliseconds"], 10)
+        self.assertEqual(delayed_stubs[1]["response"]["delayDistribution"]["type"], "lognormal")
+        self.assertEqual(delayed_stubs[2], stubs[2])